@@ -0,0 +1,52 @@
+"""add lower title index to topics
+
+Revision ID: 3f9a1c7e52d4
+Revises: beea70191bf7
+Create Date: 2026-10-19 09:12:31.482113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7e52d4'
+down_revision: Union[str, Sequence[str], None] = 'beea70191bf7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fold topics that only differ by case/whitespace into the oldest one
+    # before the case-insensitive unique index can be created.
+    op.execute("""
+        CREATE TEMPORARY TABLE topic_merge ON COMMIT DROP AS
+        SELECT t.id AS old_id, k.keep_id
+        FROM topics t
+        JOIN (
+            SELECT lower(btrim(regexp_replace(title, '\\s+', ' ', 'g'))) AS key, min(id) AS keep_id
+            FROM topics
+            GROUP BY 1
+        ) k ON k.key = lower(btrim(regexp_replace(t.title, '\\s+', ' ', 'g')))
+        WHERE t.id <> k.keep_id
+    """)
+    for table, owner in (("article_topic_association", "article_id"), ("user_topic_association", "user_id")):
+        op.execute(f"""
+            INSERT INTO {table} ({owner}, topic_id)
+            SELECT a.{owner}, m.keep_id
+            FROM {table} a JOIN topic_merge m ON m.old_id = a.topic_id
+            ON CONFLICT DO NOTHING
+        """)
+    op.execute("UPDATE articles SET topic_id = m.keep_id FROM topic_merge m WHERE articles.topic_id = m.old_id")
+    op.execute("DELETE FROM topics USING topic_merge m WHERE topics.id = m.old_id")
+    op.execute("UPDATE topics SET title = btrim(regexp_replace(title, '\\s+', ' ', 'g'))")
+
+    op.create_index('ix_topics_title_lower', 'topics', [sa.text('lower(title)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_topics_title_lower', table_name='topics')
@@ -0,0 +1,30 @@
+"""add comment tree indexes
+
+Revision ID: 5b8d0e6f2a91
+Revises: d41b7f3e9c08
+Create Date: 2026-10-19 13:41:19.560237
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8d0e6f2a91'
+down_revision: Union[str, Sequence[str], None] = 'd41b7f3e9c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_comments_article_parent_id', 'comments', ['article_id', 'parent_id', 'id'])
+    op.create_index('ix_comments_parent_id_id', 'comments', ['parent_id', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comments_parent_id_id', table_name='comments')
+    op.drop_index('ix_comments_article_parent_id', table_name='comments')
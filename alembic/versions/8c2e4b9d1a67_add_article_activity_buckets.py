@@ -0,0 +1,39 @@
+"""add article activity buckets
+
+Revision ID: 8c2e4b9d1a67
+Revises: 3f9a1c7e52d4
+Create Date: 2026-10-19 10:03:47.215904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2e4b9d1a67'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7e52d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('article_activity',
+    sa.Column('article_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('likes', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('comments', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('bookmarks', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('views', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.ForeignKeyConstraint(['article_id'], ['articles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('article_id', 'bucket')
+    )
+    op.create_index('ix_article_activity_bucket', 'article_activity', ['bucket'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_article_activity_bucket', table_name='article_activity')
+    op.drop_table('article_activity')
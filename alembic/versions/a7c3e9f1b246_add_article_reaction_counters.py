@@ -0,0 +1,40 @@
+"""add article reaction counters
+
+Revision ID: a7c3e9f1b246
+Revises: 5b8d0e6f2a91
+Create Date: 2026-10-19 15:02:11.904125
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9f1b246'
+down_revision: Union[str, Sequence[str], None] = '5b8d0e6f2a91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('articles', sa.Column('likes_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('articles', sa.Column('bookmarks_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.execute("""
+        UPDATE articles SET likes_count = l.n
+        FROM (SELECT article_id, count(*) AS n FROM article_like_association GROUP BY article_id) l
+        WHERE l.article_id = articles.id
+    """)
+    op.execute("""
+        UPDATE articles SET bookmarks_count = b.n
+        FROM (SELECT article_id, count(*) AS n FROM article_bookmark_association GROUP BY article_id) b
+        WHERE b.article_id = articles.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('articles', 'bookmarks_count')
+    op.drop_column('articles', 'likes_count')
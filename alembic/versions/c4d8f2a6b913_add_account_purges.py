@@ -0,0 +1,39 @@
+"""add account purges
+
+Revision ID: c4d8f2a6b913
+Revises: a7c3e9f1b246
+Create Date: 2026-10-19 17:41:27.318502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d8f2a6b913'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e9f1b246'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'account_purges',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('stage', sa.String(), nullable=False),
+        sa.Column('rows_deleted', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('requested_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_index('ix_users_inactive', 'users', ['id'], postgresql_where=sa.text('NOT is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_inactive', table_name='users')
+    op.drop_table('account_purges')
@@ -0,0 +1,106 @@
+"""partition messages and notifications by month
+
+Revision ID: c9e1a5d7f3b2
+Revises: c4d8f2a6b913
+Create Date: 2026-10-19 18:26:03.514870
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e1a5d7f3b2'
+down_revision: Union[str, Sequence[str], None] = 'c4d8f2a6b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same as the PARTITION_MONTHS_AHEAD default; app.partitions keeps it going.
+MONTHS_AHEAD = 3
+
+COLUMNS = {
+    "messages": """
+        id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+        sender_id integer NOT NULL REFERENCES users (id),
+        receiver_id integer NOT NULL REFERENCES users (id),
+        content varchar,
+        is_read boolean,
+        read_at timestamptz,
+        created_at timestamptz {created_at},
+        updated_at timestamptz DEFAULT now()""",
+    "notifications": """
+        id integer NOT NULL DEFAULT nextval('notifications_id_seq'),
+        type varchar NOT NULL,
+        user_id integer NOT NULL REFERENCES users (id),
+        triggered_by_id integer NOT NULL REFERENCES users (id),
+        article_id integer REFERENCES articles (id),
+        created_at timestamptz {created_at},
+        updated_at timestamptz DEFAULT now(),
+        is_read boolean""",
+}
+NAMES = {
+    "messages": "id, sender_id, receiver_id, content, is_read, read_at, created_at, updated_at",
+    "notifications": "id, type, user_id, triggered_by_id, article_id, created_at, updated_at, is_read",
+}
+INDEXES = {
+    "messages": [("ix_messages_receiver_id_created_at", "receiver_id, created_at"),
+                 ("ix_messages_sender_id_created_at", "sender_id, created_at")],
+    "notifications": [("ix_notifications_user_id_created_at", "user_id, created_at")],
+}
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _set_aside(table: str):
+    """Rename ``table`` out of the way, keeping its id sequence alive."""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+
+def _move_rows(table: str, created_at: str = "created_at"):
+    names = NAMES[table].replace("created_at", created_at)
+    op.execute(f"INSERT INTO {table} ({NAMES[table]}) SELECT {names} FROM {table}_old")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"DROP TABLE {table}_old")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    this_month = date.today().replace(day=1)
+    for table in COLUMNS:
+        oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM {table}")).scalar()
+        month = date(oldest.year, oldest.month, 1) if oldest else this_month
+
+        _set_aside(table)
+        columns = COLUMNS[table].format(created_at="NOT NULL DEFAULT now()")
+        op.execute(f"CREATE TABLE {table} ({columns}, PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)")
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        while month <= _add_months(this_month, MONTHS_AHEAD):
+            following = _add_months(month, 1)
+            op.execute(f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                       f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')")
+            month = following
+        # created_at used to be nullable.
+        _move_rows(table, "COALESCE(created_at, updated_at, now())")
+
+        # Declared on the parent, so every partition (and future ones) gets them.
+        for name, columns in INDEXES[table]:
+            op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in COLUMNS:
+        _set_aside(table)
+        columns = COLUMNS[table].format(created_at="DEFAULT now()")
+        op.execute(f"CREATE TABLE {table} ({columns}, PRIMARY KEY (id))")
+        # Dropping the partitioned table drops its partitions and indexes too.
+        _move_rows(table)
@@ -0,0 +1,74 @@
+"""add article excerpt and compressed bodies
+
+Revision ID: d41b7f3e9c08
+Revises: 8c2e4b9d1a67
+Create Date: 2026-10-19 11:26:05.733418
+
+"""
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41b7f3e9c08'
+down_revision: Union[str, Sequence[str], None] = '8c2e4b9d1a67'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+RESTORE_BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('articles', sa.Column('excerpt', sa.String(), nullable=True))
+    op.create_table('article_bodies',
+    sa.Column('article_id', sa.Integer(), nullable=False),
+    sa.Column('codec', sa.String(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['article_id'], ['articles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('article_id')
+    )
+    # Same shape as app.content.make_excerpt, minus the word-boundary trim.
+    op.execute("""
+        UPDATE articles
+        SET excerpt = CASE
+            WHEN length(btrim(regexp_replace(content, '\\s+', ' ', 'g'))) <= 280
+                THEN btrim(regexp_replace(content, '\\s+', ' ', 'g'))
+            ELSE left(btrim(regexp_replace(content, '\\s+', ' ', 'g')), 280) || '…'
+        END
+    """)
+
+
+def _decompress(data: bytes, codec: str) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("article_bodies holds zstd bodies; install zstandard to downgrade")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Compressed articles keep an empty content column; put their bodies back
+    # before the table holding them is dropped.
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT article_id, codec, data FROM article_bodies WHERE article_id > :last_id "
+            "ORDER BY article_id LIMIT :limit"), {"last_id": last_id, "limit": RESTORE_BATCH_SIZE}).all()
+        if not rows:
+            break
+        bind.execute(sa.text("UPDATE articles SET content = :content WHERE id = :id"),
+                     [{"id": article_id, "content": _decompress(data, codec)} for article_id, codec, data in rows])
+        last_id = rows[-1].article_id
+    op.drop_table('article_bodies')
+    op.drop_column('articles', 'excerpt')
@@ -0,0 +1,125 @@
+"""Batched relationship loading for serializing lists of ORM objects.
+
+Serializing 50 articles touches ``author``, ``topic``, ``comments`` and each
+comment's ``user`` on every one of them, and each first touch is a lazy load.
+A Loader walks the response schema before serialization instead. For every
+relationship the schema embeds, it collects the keys of all objects that still
+have it unloaded, dedupes them, and resolves them with one ``IN`` query. The
+results are set as the committed value of the attribute, so serialization
+then reads plain attributes. Many-to-one targets already in the session's
+identity map are not fetched again.
+
+A Loader is request scoped, like the session it wraps:
+
+    def endpoint(loader: batch.Loader = Depends(batch.get_loader)):
+        articles = ...
+        return loader.load(articles, schemas.ArticleSummaryOut)
+"""
+from collections import defaultdict
+
+from fastapi import Depends
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.util import identity_key
+
+from .database import get_db
+from .fields import nested_model
+
+
+def _attribute(mapper, column) -> str:
+    return mapper.get_property_by_column(column).key
+
+
+class Loader:
+    def __init__(self, db: Session):
+        self.db = db
+        self.queries = 0
+
+    def load(self, objects: list, schema: type[BaseModel]) -> list:
+        """Load everything ``schema`` embeds for ``objects``; returns ``objects``."""
+        self._load(objects, schema)
+        return objects
+
+    def _load(self, objects: list, schema: type[BaseModel]):
+        unique = list({id(obj): obj for obj in objects if obj is not None}.values())
+        if not unique:
+            return
+        mapper = inspect(type(unique[0]))
+        for name, info in schema.model_fields.items():
+            nested = nested_model(info.annotation)
+            if nested is None or name not in mapper.relationships:
+                continue
+            children = []
+            for value in self.relationship(unique, name):
+                if isinstance(value, list):
+                    children.extend(value)
+                elif value is not None:
+                    children.append(value)
+            self._load(children, nested)
+
+    def relationship(self, objects: list, name: str) -> list:
+        """Load relationship ``name`` of ``objects``; returns its value per object."""
+        mapper = inspect(type(objects[0]))
+        prop = mapper.relationships[name]
+        pending = [obj for obj in objects if name in inspect(obj).unloaded]
+        if pending:
+            if prop.direction is MANYTOONE:
+                self._many_to_one(mapper, prop, pending)
+            else:
+                self._collection(mapper, prop, pending)
+        return [getattr(obj, name) for obj in objects]
+
+    def _many_to_one(self, mapper, prop, objects: list):
+        target = prop.mapper
+        (local, remote), = prop.local_remote_pairs
+        local_key = _attribute(mapper, local)
+        remote_key = _attribute(target, remote)
+
+        keys = {getattr(obj, local_key) for obj in objects} - {None}
+        found = {}
+        if target.primary_key == (remote,):
+            for key in keys:
+                cached = self.db.identity_map.get(identity_key(target.class_, (key,)))
+                if cached is not None:
+                    found[key] = cached
+        missing = keys - found.keys()
+        if missing:
+            self.queries += 1
+            for row in self.db.query(target.class_).filter(getattr(target.class_, remote_key).in_(missing)):
+                found[getattr(row, remote_key)] = row
+
+        for obj in objects:
+            set_committed_value(obj, prop.key, found.get(getattr(obj, local_key)))
+
+    def _collection(self, mapper, prop, objects: list):
+        target = prop.mapper
+        (parent, child), = prop.synchronize_pairs
+        parent_key = _attribute(mapper, parent)
+        keys = {getattr(obj, parent_key) for obj in objects}
+
+        self.queries += 1
+        grouped = defaultdict(list)
+        if prop.secondary is not None:
+            # many-to-many: ``child`` is the association column pointing back at us.
+            (target_column, association_column), = prop.secondary_synchronize_pairs
+            rows = (self.db.query(child, target.class_)
+                    .select_from(target.class_)
+                    .join(prop.secondary, target_column == association_column)
+                    .filter(child.in_(keys)))
+        else:
+            rows = (self.db.query(child, target.class_)
+                    .filter(child.in_(keys)))
+        if prop.order_by:
+            rows = rows.order_by(*prop.order_by)
+        for key, row in rows:
+            grouped[key].append(row)
+
+        for obj in objects:
+            set_committed_value(obj, prop.key, grouped.get(getattr(obj, parent_key), []))
+
+
+def get_loader(db: Session = Depends(get_db)) -> Loader:
+    return Loader(db)
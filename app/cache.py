@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import orjson
+from fastapi import Request, Response
+
+from . import compression, conditional
+from .config import settings
+
+
+class CacheEntry:
+    __slots__ = ("body", "validator", "tags", "versions", "expires_at", "encoded", "charged")
+
+    def __init__(self, body: bytes, validator: conditional.Validator, tags: tuple, versions: tuple, expires_at: float):
+        self.body = body
+        self.validator = validator
+        self.tags = tags
+        self.versions = versions
+        self.expires_at = expires_at
+        # Compressed copies of body by codec, filled on first request for each.
+        self.encoded = {}
+        # Bytes counted against the local cache while the entry is in it.
+        self.charged = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(map(len, self.encoded.values())) + 64 * len(self.tags) + 256
+
+    def dumps(self) -> bytes:
+        return orjson.dumps({
+            "body": self.body.decode(),
+            "etag": self.validator.etag,
+            "tags": self.tags,
+            "versions": self.versions,
+            "expires_at": self.expires_at,
+        })
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CacheEntry":
+        raw = orjson.loads(data)
+        validator = conditional.Validator(raw["etag"])
+        return cls(raw["body"].encode(), validator, tuple(raw["tags"]), tuple(raw["versions"]), raw["expires_at"])
+
+
+class TagVersions:
+    """Per-tag invalidation counters; an entry is stale once any of its tags moves on."""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+        # Versions start over at 0 with a new store; validators include the
+        # epoch so they never match one handed out by an earlier store.
+        self.epoch = os.urandom(8).hex()
+
+    def get(self, tag: str) -> int:
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag: str):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class CacheBackend:
+    """Shared tier interface (e.g. Redis/memcached); the default stores nothing."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: int):
+        pass
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = None, ttl: int = None, backend: CacheBackend = None, versions: TagVersions = None):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self.backend = backend or CacheBackend()
+        self.versions = versions or TagVersions()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None else settings.response_cache_max_bytes
+
+    @property
+    def ttl(self) -> int:
+        return self._ttl if self._ttl is not None else settings.response_cache_ttl_seconds
+
+    def _is_valid(self, entry: CacheEntry) -> bool:
+        if entry.expires_at < time.time():
+            return False
+        return all(self.versions.get(tag) == version for tag, version in zip(entry.tags, entry.versions))
+
+    def _uncharge(self, entry: CacheEntry):
+        self._size -= entry.charged
+        entry.charged = 0
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._uncharge(evicted)
+
+    def _put_local(self, key: str, entry: CacheEntry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._uncharge(old)
+            self._entries[key] = entry
+            entry.charged = entry.size
+            self._size += entry.charged
+            self._evict()
+
+    def _drop_local(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._uncharge(entry)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and not self._is_valid(entry):
+            self._drop_local(key)
+            entry = None
+
+        if entry is None:
+            data = self.backend.get(key)
+            if data is not None:
+                entry = CacheEntry.loads(data)
+                if self._is_valid(entry):
+                    self._put_local(key, entry)
+                else:
+                    entry = None
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def snapshot(self, tags) -> dict:
+        """Current version of each tag; take it before reading the rows the tags cover."""
+        return {tag: self.versions.get(tag) for tag in tags}
+
+    def validator(self, kind: str, versions: dict) -> conditional.Validator:
+        """Validator of a representation rendered under the ``snapshot`` ``versions``.
+
+        Rows no tag covers (view counts, embedded profiles) change without a
+        bump, so the validator also rolls over once per TTL: a revalidated copy
+        is never older than a cached body could be.
+        """
+        generation = int(time.time() // max(self.ttl, 1))
+        return conditional.make_validator(kind, self.versions.epoch, generation, sorted(versions.items()))
+
+    def set(self, key: str, body: bytes, validator: conditional.Validator, versions: dict) -> CacheEntry:
+        """Store ``body`` under the ``snapshot`` taken before it was rendered.
+
+        A tag that moved since then means the body may predate a write, so it
+        is returned for this request but not stored.
+        """
+        entry = CacheEntry(body, validator, tuple(versions), tuple(versions.values()), time.time() + self.ttl)
+        if self.snapshot(versions) == versions:
+            self._put_local(key, entry)
+            self.backend.set(key, entry.dumps(), self.ttl)
+        return entry
+
+    def encode(self, entry: CacheEntry, codec: str) -> bytes:
+        """``entry.body`` compressed with ``codec``, compressed once and kept with the entry."""
+        data = entry.encoded.get(codec)
+        if data is None:
+            data = compression.compress(entry.body, codec, compression.CACHED_LEVELS[codec])
+            with self._lock:
+                if codec not in entry.encoded:
+                    entry.encoded[codec] = data
+                    if entry.charged:
+                        entry.charged += len(data)
+                        self._size += len(data)
+                        self._evict()
+        return data
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self.versions.bump(tag)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+
+responses = ResponseCache()
+
+
+def invalidate(*tags: str):
+    responses.invalidate(*tags)
+
+
+def respond(request: Request, entry: CacheEntry) -> Response:
+    if conditional.is_fresh(request, entry.validator):
+        return conditional.NotModified(entry.validator).response()
+    headers = {**entry.validator.headers(), "Vary": "Accept-Encoding"}
+    codec = compression.negotiate(request.headers.get("accept-encoding"))
+    if codec is None or len(entry.body) < settings.compression_min_bytes:
+        return Response(entry.body, media_type="application/json", headers=headers)
+    headers["Content-Encoding"] = codec
+    return Response(responses.encode(entry, codec), media_type="application/json", headers=headers)
@@ -0,0 +1,89 @@
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+# Roots are one keyset page; every level below takes at most :reply_limit
+# children per parent via a LATERAL subquery, down to :max_depth.
+_TREE_SQL = """
+WITH RECURSIVE tree AS (
+    (
+        SELECT c.id, c.parent_id, c.user_id, c.content, c.created_at, 0 AS depth
+        FROM comments c
+        WHERE c.article_id = :article_id AND {anchor} AND c.id > :cursor AND {visible}
+        ORDER BY c.id
+        LIMIT :page_size
+    )
+    UNION ALL
+    SELECT r.id, r.parent_id, r.user_id, r.content, r.created_at, t.depth + 1
+    FROM tree t
+    CROSS JOIN LATERAL (
+        SELECT c.id, c.parent_id, c.user_id, c.content, c.created_at
+        FROM comments c
+        WHERE c.parent_id = t.id AND {visible}
+        ORDER BY c.id
+        LIMIT :reply_limit
+    ) r
+    WHERE t.depth < :max_depth
+)
+SELECT tree.id, tree.parent_id, tree.user_id, tree.content, tree.created_at, tree.depth,
+       (SELECT count(*) FROM comments c WHERE c.parent_id = tree.id AND {visible}) AS reply_count
+FROM tree
+ORDER BY tree.depth, tree.id
+"""
+
+# Raw SQL skips the ORM's soft-delete criteria: leave out deactivated authors here.
+_VISIBLE = "c.user_id NOT IN (SELECT id FROM users WHERE NOT is_active)"
+_ROOTS_SQL = text(_TREE_SQL.format(anchor="c.parent_id IS NULL", visible=_VISIBLE))
+_REPLIES_SQL = text(_TREE_SQL.format(anchor="c.parent_id = :parent_id", visible=_VISIBLE))
+
+
+def load_page(db: Session, article_id: int, parent_id: Optional[int], cursor: int,
+              limit: int, reply_limit: int, max_depth: int) -> schemas.CommentPage:
+    params = {"article_id": article_id, "cursor": cursor, "page_size": limit + 1,
+              "reply_limit": reply_limit, "max_depth": max_depth}
+    if parent_id is None:
+        rows = db.execute(_ROOTS_SQL, params).all()
+    else:
+        rows = db.execute(_REPLIES_SQL, {**params, "parent_id": parent_id}).all()
+
+    roots = [row for row in rows if row.depth == 0]
+    next_cursor = None
+    if len(roots) > limit:
+        roots = roots[:limit]
+        next_cursor = roots[-1].id
+    # Drop the look-ahead root together with its subtree.
+    kept = {row.id for row in roots}
+    children = {}
+    for row in rows:
+        if row.depth > 0 and row.parent_id in kept:
+            kept.add(row.id)
+            children.setdefault(row.parent_id, []).append(row)
+
+    user_ids = {row.user_id for row in rows if row.id in kept}
+    users = {user.id: user for user in db.query(models.User).filter(models.User.id.in_(user_ids))}
+
+    def visible(rows) -> list:
+        # An author deactivated since the tree query is missing from users;
+        # leave their comments out, as the query itself would now.
+        return [row for row in rows if row.user_id in users]
+
+    def build(row) -> schemas.CommentNode:
+        replies = [build(child) for child in visible(children.get(row.id, []))]
+        replies_cursor = None
+        if row.reply_count > len(replies):
+            replies_cursor = replies[-1].id if replies else 0
+        return schemas.CommentNode(
+            id=row.id,
+            content=row.content,
+            parent_id=row.parent_id,
+            created_at=row.created_at,
+            user=schemas.UserOut.model_validate(users[row.user_id]),
+            reply_count=row.reply_count,
+            replies=replies,
+            replies_cursor=replies_cursor,
+        )
+
+    return schemas.CommentPage(comments=[build(row) for row in visible(roots)], next_cursor=next_cursor)
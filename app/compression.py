@@ -0,0 +1,162 @@
+"""Response compression negotiated from Accept-Encoding.
+
+The middleware compresses JSON and text responses of at least
+``COMPRESSION_MIN_BYTES``, plus every streamed response such as the NDJSON
+exports. It uses the first codec in ``COMPRESSION_CODECS`` that the client
+accepts. gzip is always available; zstd and br need the zstandard and brotli
+packages and are skipped without them.
+
+Cached responses (app.cache) are compressed once per codec, at a higher
+level, and the compressed bytes are kept next to the plain body. Those
+responses already carry Content-Encoding, and the middleware passes them
+through. The ETags are weak, so every encoding of a response shares its
+ETag.
+"""
+import zlib
+from typing import Optional
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+# Levels for responses compressed on every request, and for cached bodies
+# that are compressed once and sent many times.
+LEVELS = {"gzip": 6, "br": 5, "zstd": 3}
+CACHED_LEVELS = {"gzip": 9, "br": 9, "zstd": 10}
+
+
+def available() -> list[str]:
+    codecs = [codec.strip() for codec in settings.compression_codecs.split(",") if codec.strip()]
+    return [codec for codec in codecs
+            if codec == "gzip" or (codec == "br" and brotli) or (codec == "zstd" and zstandard)]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred codec the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for codec in available():
+        if accepted.get(codec, accepted.get("*", 0.0)) > 0:
+            return codec
+    return None
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE)
+
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    level = level if level is not None else LEVELS[codec]
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Stream:
+    """Incremental compressor; ``flush`` after each chunk so clients see it immediately."""
+
+    def __init__(self, codec: str):
+        level = LEVELS[codec]
+        if codec == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._sync, self._end = zstandard.COMPRESSOBJ_FLUSH_BLOCK, zstandard.COMPRESSOBJ_FLUSH_FINISH
+        elif codec == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._sync, self._end = zlib.Z_SYNC_FLUSH, zlib.Z_FINISH
+        self.codec = codec
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        if self.codec == "br":
+            return self._compressor.process(data) + (self._compressor.finish() if last else self._compressor.flush())
+        return self._compressor.compress(data) + self._compressor.flush(self._end if last else self._sync)
+
+
+def _vary(headers: list) -> list:
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[i] = (name, value + b", Accept-Encoding")
+            return headers
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codec = negotiate(dict(scope["headers"]).get(b"accept-encoding", b"").decode("latin-1"))
+        start = None
+        stream = None
+
+        async def send_wrapper(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                headers = dict((name.lower(), value) for name, value in message.get("headers", []))
+                if (message["status"] in (204, 304) or b"content-encoding" in headers
+                        or not compressible(headers.get(b"content-type", b"").decode("latin-1"))):
+                    await send(message)
+                    return
+                start = {**message, "headers": _vary(list(message.get("headers", [])))}
+                if codec is None:
+                    await send(start)
+                    start = None
+                return
+
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if stream is None:
+                headers = [(name, value) for name, value in start["headers"] if name.lower() != b"content-length"]
+                headers.append((b"content-encoding", codec.encode()))
+                if not more:
+                    if len(body) < settings.compression_min_bytes:
+                        # Too small to be worth it; send as is.
+                        await send(start)
+                        await send(message)
+                    else:
+                        body = compress(body, codec)
+                        await send({**start, "headers": headers + [(b"content-length", str(len(body)).encode())]})
+                        await send({**message, "body": body})
+                    start = None
+                    return
+                stream = Stream(codec)
+                await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": stream.compress(body, not more), "more_body": more})
+            if not more:
+                start = None
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,66 @@
+"""Conditional GETs with weak ETags.
+
+A validator is a digest of the cache tag versions a representation is
+rendered under (see ``cache.ResponseCache.validator``): the same snapshot
+the response cache stores the body with, so checking it costs no queries
+beyond the id lookups the render makes anyway. Every write that changes a
+page bumps one of its tags. Likes and follows don't touch any
+``updated_at``, so there is no Last-Modified and If-Modified-Since is
+ignored; only If-None-Match is answered.
+"""
+import hashlib
+
+from fastapi import Request, Response, status
+
+from .config import settings
+
+
+class Validator:
+    def __init__(self, etag: str):
+        self.etag = etag
+
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            # The guarded reads don't depend on who is asking, so a shared
+            # cache (CDN) may store them and revalidate with the ETag.
+            "Cache-Control": f"public, max-age={settings.public_cache_max_age}, stale-while-revalidate={settings.public_cache_stale_seconds}",
+        }
+
+    def variant(self, key: str) -> "Validator":
+        """Validator for another representation of the same data, e.g. a sparse fieldset."""
+        digest = hashlib.blake2b(f"{self.etag}|{key}".encode(), digest_size=12).hexdigest()
+        return Validator(f'W/"{digest}"')
+
+
+class NotModified(Exception):
+    def __init__(self, validator: Validator):
+        self.validator = validator
+
+    def response(self) -> Response:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=self.validator.headers())
+
+
+def make_validator(kind: str, *parts) -> Validator:
+    """Build a weak validator from a digest of ``parts``."""
+    digest = hashlib.blake2b(repr((kind,) + parts).encode(), digest_size=12).hexdigest()
+    return Validator(f'W/"{digest}"')
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def is_fresh(request: Request, validator: Validator) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and _etag_matches(if_none_match, validator.etag)
+
+
+def check(request: Request, response: Response, validator: Validator):
+    """Raise NotModified for a matching conditional GET, otherwise set the validator headers."""
+    if is_fresh(request, validator):
+        raise NotModified(validator)
+    response.headers.update(validator.headers())
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings  # ✅ correct for v2
 
 
@@ -10,9 +12,78 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    trending_window_hours: int = 72
+    trending_half_life_hours: float = 12
+    trending_top_k: int = 100
+    trending_refresh_seconds: int = 300
+    article_compression: str = "none"
+    article_compression_min_bytes: int = 4096
+    public_cache_max_age: int = 60
+    public_cache_stale_seconds: int = 300
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_ttl_seconds: int = 60
+    singleflight_grace_seconds: float = 0.05
+    singleflight_wait_timeout_seconds: float = 5
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_warm_connections: int = 0
+    create_schema: bool = False
+    profile_sample_rate: float = 0.0
+    profile_interval_ms: float = 1.0
+    profile_dir: str = "profiles"
+    metrics_dir: str = ""
+    metrics_flush_seconds: float = 1.0
+    ratelimit_enabled: bool = True
+    ratelimit_max_keys: int = 100_000
+    ratelimit_trust_forwarded_for: bool = False
+    media_dir: str = "media"
+    image_max_bytes: int = 10 * 1024 * 1024
+    image_max_pixels: int = 40_000_000
+    image_quality: int = 80
+    image_workers: int = 2
+    purge_batch_size: int = 1000
+    purge_interval_seconds: float = 30
+    purge_pause_seconds: float = 0.05
+    partition_months_ahead: int = 3
+    partition_maintenance_seconds: float = 3600
+    partition_retention_action: str = "drop"
+    message_retention_months: int = 0
+    notification_retention_months: int = 6
+    presence_online_seconds: int = 300
+    presence_flush_seconds: float = 60
+    presence_max_ids: int = 100
+    related_index_path: str = "related/index.npy"
+    related_top_k: int = 20
+    related_max_df: float = 0.5
+    related_min_score: float = 0.05
+    related_block_cells: int = 16_000_000
+    related_refresh_seconds: float = 300
+    related_rebuild_seconds: float = 86400
+    feed_candidates: int = 2000
+    feed_half_life_hours: float = 48
+    feed_author_repeat_penalty: float = 0.7
+    feed_affinity_ttl_seconds: float = 300
+    feed_message_window_days: int = 90
+    compression_min_bytes: int = 1024
+    compression_codecs: str = "zstd,br,gzip"
 
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+class _LazySettings:
+    """Reads the environment on first use instead of at import time."""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name, value):
+        setattr(get_settings(), name, value)
+
+
+settings = _LazySettings()
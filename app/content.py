@@ -0,0 +1,76 @@
+import zlib
+
+from . import models, schemas
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXCERPT_LENGTH = 280
+
+
+def make_excerpt(text: str, length: int = EXCERPT_LENGTH) -> str:
+    text = " ".join(text.split())
+    if len(text) <= length:
+        return text
+    cut = text.rfind(" ", 0, length)
+    return text[:cut if cut > 0 else length].rstrip() + "…"
+
+
+def compress(text: str, codec: str) -> bytes:
+    raw = text.encode("utf-8")
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(raw)
+    return zlib.compress(raw, 6)
+
+
+def decompress(data: bytes, codec: str) -> str:
+    if codec == "zstd":
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data)
+    return raw.decode("utf-8")
+
+
+def _codec() -> str:
+    codec = settings.article_compression
+    if codec == "zstd" and zstandard is None:
+        return "zlib"
+    return codec
+
+
+def encode(text: str):
+    """Return (content column, excerpt, codec, compressed body) for a new body."""
+    codec = _codec()
+    if codec in ("zlib", "zstd") and len(text) >= settings.article_compression_min_bytes:
+        return "", make_excerpt(text), codec, compress(text, codec)
+    return text, make_excerpt(text), None, None
+
+
+def store(article: models.Article, text: str):
+    """Set the article body, compressing it into article_bodies when enabled."""
+    article.content, article.excerpt, codec, data = encode(text)
+
+    if codec is None:
+        article.body = None
+    elif article.body is None:
+        article.body = models.ArticleBody(codec=codec, data=data)
+    else:
+        article.body.codec = codec
+        article.body.data = data
+
+
+def read(article: models.Article) -> str:
+    if article.body is not None:
+        return decompress(article.body.data, article.body.codec)
+    return article.content
+
+
+def to_schema(article: models.Article, model=schemas.ArticleOut) -> schemas.ArticleOut:
+    """Validate into ``model``, ArticleOut or a sparse variant of it."""
+    out = model.model_validate(article)
+    if "content" in model.model_fields:
+        out.content = read(article)
+    return out
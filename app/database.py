@@ -1,17 +1,48 @@
-
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
 
-SQLALCHEMY_DATABASE_URL = f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+def database_url() -> str:
+    return f'postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}'
+
+
+_engine = None
+
+
+def get_engine():
+    # Built on first use so importing the app never needs the environment or
+    # the database; create_engine itself does not connect.
+    global _engine
+    if _engine is None:
+        _engine = create_engine(
+            database_url(),
+            pool_size=settings.database_pool_size,
+            max_overflow=settings.database_max_overflow,
+        )
+    return _engine
+
+
+def dispose_engine():
+    global _engine
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
+def SessionLocal():
+    return _sessionmaker(bind=get_engine())
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
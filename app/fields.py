@@ -0,0 +1,178 @@
+"""Sparse fieldsets: ``?fields=`` and ``?include=`` on read endpoints.
+
+``fields`` lists the fields to return, with dots for nested ones, e.g.
+``fields=id,title,author.username``. Naming a nested object without a
+sub-field (``fields=author``) returns all of it. ``include`` adds nested
+objects to the default set of plain fields, e.g. ``include=author`` returns
+every scalar field of the article plus its author.
+
+The selection is turned into a Pydantic model with just those fields, cached
+per (schema, selection). The same tree gives the SQLAlchemy loader options:
+load_only for the columns and selectinload for the requested relationships.
+Relationships that are not requested are never touched during serialization,
+so they are never loaded either.
+"""
+import typing
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+
+MAX_FIELDS = 100
+
+
+def nested_model(annotation) -> Optional[type[BaseModel]]:
+    """The Pydantic model inside ``X``, ``list[X]`` or ``Optional[X]``, if any."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        model = nested_model(arg)
+        if model is not None:
+            return model
+    return None
+
+
+def _replace_model(annotation, old: type[BaseModel], new: type[BaseModel]):
+    if annotation is old:
+        return new
+    origin = typing.get_origin(annotation)
+    if origin is None:
+        return annotation
+    args = tuple(_replace_model(arg, old, new) for arg in typing.get_args(annotation))
+    if origin is typing.Union:
+        return typing.Union[args]
+    return origin[args]
+
+
+def _full_tree(schema: type[BaseModel]) -> tuple:
+    return tuple(sorted((name, None) for name in schema.model_fields))
+
+
+def _freeze(tree: dict) -> tuple:
+    return tuple(sorted((name, None if sub is None else _freeze(sub)) for name, sub in tree.items()))
+
+
+@lru_cache(maxsize=512)
+def sparse_model(schema: type[BaseModel], tree: tuple) -> type[BaseModel]:
+    """``schema`` cut down to the fields in ``tree``, a frozen selection."""
+    selected = dict(tree)
+    definitions = {}
+    # In declaration order, so sparse responses list fields like full ones do.
+    for name, info in schema.model_fields.items():
+        if name not in selected:
+            continue
+        sub = selected[name]
+        annotation = info.annotation
+        nested = nested_model(annotation)
+        if nested is not None and sub is not None:
+            annotation = _replace_model(annotation, nested, sparse_model(nested, sub))
+        if info.is_required():
+            definitions[name] = (annotation, ...)
+        elif info.default_factory is not None:
+            definitions[name] = (annotation, Field(default_factory=info.default_factory))
+        else:
+            definitions[name] = (annotation, info.default)
+    return create_model(f"{schema.__name__}Fields", __config__=ConfigDict(from_attributes=True), **definitions)
+
+
+@lru_cache(maxsize=512)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+class Selection:
+    def __init__(self, fields: Optional[str], include: Optional[str]):
+        self.fields = sorted({path.strip() for path in (fields or "").split(",") if path.strip()})
+        self.include = sorted({path.strip() for path in (include or "").split(",") if path.strip()})
+        if len(self.fields) + len(self.include) > MAX_FIELDS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Too many fields requested")
+
+    @property
+    def key(self) -> str:
+        """Canonical form, for cache keys and validators."""
+        return f"fields={','.join(self.fields)}&include={','.join(self.include)}"
+
+    def tree(self, schema: type[BaseModel]) -> tuple:
+        tree = {}
+        if not self.fields:
+            tree = {name: None for name, info in schema.model_fields.items()
+                    if nested_model(info.annotation) is None}
+        for path in (*self.fields, *self.include):
+            self._add(tree, schema, path)
+        return _freeze(tree)
+
+    def _add(self, tree: dict, schema: type[BaseModel], path: str):
+        node, model = tree, schema
+        parts = path.split(".")
+        for depth, part in enumerate(parts):
+            info = model.model_fields.get(part) if model is not None else None
+            if info is None:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown field: {path}")
+            last = depth == len(parts) - 1
+            if last:
+                node[part] = None
+            else:
+                if node.get(part, ...) is None:
+                    return  # already selected in full
+                node = node.setdefault(part, {})
+                model = nested_model(info.annotation)
+
+    def model(self, schema: type[BaseModel]) -> type[BaseModel]:
+        return sparse_model(schema, self.tree(schema))
+
+    def options(self, entity, schema: type[BaseModel]) -> list:
+        return loader_options(entity, schema, self.tree(schema))
+
+    def dump(self, schema: type[BaseModel], obj) -> bytes:
+        """Serialize an ORM object, or a list of them, with the selected fields."""
+        model = self.model(schema)
+        if isinstance(obj, list):
+            adapter = _adapter(list[model])
+            return adapter.dump_json(adapter.validate_python(obj, from_attributes=True))
+        return model.model_validate(obj).model_dump_json().encode()
+
+    def respond(self, schema: type[BaseModel], obj, headers: dict = None) -> Response:
+        return Response(self.dump(schema, obj), media_type="application/json", headers=headers)
+
+
+def loader_options(entity, schema: type[BaseModel], tree: tuple) -> list:
+    """load_only/selectinload options that fetch exactly what ``tree`` serializes."""
+    mapper = inspect(entity)
+    columns = set()
+    options = []
+    for name, sub in tree:
+        if name in mapper.relationships:
+            relationship = mapper.relationships[name]
+            nested = nested_model(schema.model_fields[name].annotation)
+            target = relationship.mapper.class_
+            options.append(selectinload(getattr(entity, name)).options(
+                *loader_options(target, nested, sub or _full_tree(nested))))
+            # A many-to-one is loaded through the foreign key on this row.
+            columns.update(mapper.get_property_by_column(column).key for column in relationship.local_columns)
+        elif name in mapper.column_attrs:
+            columns.add(name)
+    # load_only always keeps the primary key, so it is never empty.
+    options.insert(0, load_only(*(getattr(entity, name) for name in sorted(columns or {mapper.primary_key[0].key}))))
+    return options
+
+
+def cache_key(path: str, selection: Optional[Selection]) -> str:
+    return path if selection is None else f"{path}?{selection.key}"
+
+
+def variant(validator, selection: Optional[Selection]):
+    """The validator of the representation ``selection`` asks for."""
+    return validator if selection is None else validator.variant(selection.key)
+
+
+def selection(
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; dots select nested fields."),
+    include: Optional[str] = Query(None, description="Nested objects to add to the default fields."),
+) -> Optional[Selection]:
+    """Dependency: None when the client wants the full representation."""
+    if not fields and not include:
+        return None
+    return Selection(fields, include)
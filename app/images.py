@@ -0,0 +1,201 @@
+"""Image uploads: content-addressed originals and resized WebP variants.
+
+An upload is checked (format, size, pixel count) and stored under its BLAKE2b
+digest, which is all the model keeps, e.g. ``User.profile_image``. The same
+bytes always get the same key, so everything under ``/media/<key>/`` can be
+cached forever. Resizing runs in a process pool and is not awaited by the
+upload. A variant requested before it exists is rendered on demand in the
+same pool.
+
+Originals and variants sit behind ``Storage``. ``LocalStorage`` keeps them
+under ``MEDIA_DIR``; an object store only needs ``put``, ``get``, ``exists``
+and, for direct file responses, ``path``.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from .config import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# name: target width in pixels; the height follows the aspect ratio.
+VARIANTS = {"thumb": 160, "small": 480, "medium": 1080}
+FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class Storage(ABC):
+    @abstractmethod
+    def put(self, name: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def get(self, name: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        ...
+
+    def path(self, name: str) -> Optional[str]:
+        """Local file for ``name``, if the backend has one."""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        # Two levels of fan-out keep directories small.
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def put(self, name: str, data: bytes):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, name: str) -> bytes:
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+
+def storage() -> Storage:
+    return LocalStorage(settings.media_dir)
+
+
+def is_key(value: Optional[str]) -> bool:
+    return bool(value) and KEY_PATTERN.match(value) is not None
+
+
+def original_name(key: str) -> str:
+    return f"{key}.original"
+
+
+def variant_name(key: str, variant: str) -> str:
+    return f"{key}.{variant}.webp"
+
+
+def url(key: str, variant: str) -> str:
+    return f"/media/{key}/{variant}.webp"
+
+
+def urls(value: Optional[str]) -> Optional[dict]:
+    """Variant URLs for an uploaded image; None for legacy free-form URLs."""
+    if not is_key(value):
+        return None
+    return {variant: url(value, variant) for variant in VARIANTS}
+
+
+def check(data: bytes):
+    """Raise InvalidImage unless ``data`` is a supported, reasonably sized image."""
+    if Image is None:
+        raise RuntimeError("Image uploads need Pillow")
+    if len(data) > settings.image_max_bytes:
+        raise InvalidImage(f"Image is larger than {settings.image_max_bytes} bytes")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Reads the header only; pixels are decoded in the pool.
+            if image.format not in FORMATS:
+                raise InvalidImage(f"Unsupported image format: {image.format}")
+            width, height = image.size
+            image.verify()
+    except InvalidImage:
+        raise
+    except Exception as e:
+        raise InvalidImage("Not a valid image") from e
+    if width * height > settings.image_max_pixels:
+        raise InvalidImage("Image has too many pixels")
+
+
+def render(data: bytes, width: int, quality: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=quality, method=4)
+        return out.getvalue()
+
+
+def make_variants(store: Storage, key: str, variants: tuple, quality: int):
+    """Process pool task: render ``variants`` of an original that is in ``store``."""
+    data = store.get(original_name(key))
+    for variant in variants:
+        name = variant_name(key, variant)
+        if not store.exists(name):
+            store.put(name, render(data, VARIANTS[variant], quality))
+
+
+_pool = None
+
+
+def pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Forking a process that runs an event loop and threads is unsafe;
+        # forkserver forks from a clean single-threaded server instead.
+        _pool = ProcessPoolExecutor(max_workers=settings.image_workers,
+                                    mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Rendering image variants failed", exc_info=future.exception())
+
+
+def save(data: bytes) -> str:
+    """Store an uploaded image and queue its variants; returns its key."""
+    check(data)
+    key = hashlib.blake2b(data, digest_size=16).hexdigest()
+    store = storage()
+    if not store.exists(original_name(key)):
+        store.put(original_name(key), data)
+    pool().submit(make_variants, store, key, tuple(VARIANTS), settings.image_quality).add_done_callback(_log_failure)
+    return key
+
+
+def save_upload(file: UploadFile) -> str:
+    """save() for a request's upload; problems become 4xx responses."""
+    data = file.file.read(settings.image_max_bytes + 1)
+    if len(data) > settings.image_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Image is larger than {settings.image_max_bytes} bytes")
+    try:
+        return save(data)
+    except InvalidImage as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
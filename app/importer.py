@@ -0,0 +1,363 @@
+"""Bulk import of users, articles and follow edges from NDJSON or CSV.
+
+    python -m app.importer users users.ndjson
+    python -m app.importer articles articles.csv --batch-size 10000
+    python -m app.importer follows follows.ndjson --errors errors.ndjson
+
+On PostgreSQL rows are streamed into the tables with COPY; on SQLite the same
+batches go through executemany. Every step resolves a whole batch at once, so
+the number of round trips depends on the batch count, not on the row count.
+"""
+import argparse
+import csv
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+import orjson
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import Session
+
+from . import content, models, utils
+from .database import SessionLocal
+
+USER_FIELDS = ("first_name", "last_name", "bio", "location", "profile_image", "facebook_url", "twitter_url",
+               "instagram_url", "website_url", "youtube_url", "linkedin_url", "github_url")
+COPY_NULL = "\\N"
+
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, line: int, message: str):
+        self.errors.append({"line": line, "error": message})
+
+    def summary(self) -> dict:
+        return {"inserted": self.inserted, "failed": len(self.errors)}
+
+
+def read_rows(path: str):
+    """Yield (line number, row) from an NDJSON or CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for number, row in enumerate(csv.DictReader(f), start=2):
+                yield number, {key: value for key, value in row.items() if value != ""}
+        else:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, orjson.loads(line)
+
+
+def batches(rows, size: int):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, bytes):
+        return "\\x" + value.hex()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_rows(db: Session, table: str, columns: tuple, rows: list[tuple]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(value) for value in row])
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+    finally:
+        cursor.close()
+
+
+def _parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes")
+    return bool(value)
+
+
+def _parse_topics(value) -> list[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [topic for topic in value.split("|") if topic.strip()]
+    return list(value)
+
+
+def resolve_user_refs(db: Session, refs: set) -> dict:
+    """Map ids, emails and usernames to user ids in one query."""
+    ids = {ref for ref in refs if isinstance(ref, int) or (isinstance(ref, str) and ref.isdigit())}
+    names = {ref for ref in refs if isinstance(ref, str) and ref not in ids}
+    rows = db.execute(
+        select(models.User.id, models.User.email, models.User.username).where(or_(
+            models.User.id.in_([int(ref) for ref in ids]),
+            models.User.email.in_(names),
+            models.User.username.in_(names),
+        )).execution_options(include_inactive=True)
+    ).all()
+
+    resolved = {}
+    for user_id, email, username in rows:
+        resolved[user_id] = resolved[str(user_id)] = resolved[email] = resolved[username] = user_id
+    return resolved
+
+
+def import_users(db: Session, batch: list, report: ImportReport, hash_pool: ThreadPoolExecutor):
+    seen = set()
+    valid = []
+    for line, row in batch:
+        email = (row.get("email") or "").strip()
+        if "@" not in email:
+            report.error(line, "invalid email")
+        elif email in seen:
+            report.error(line, "duplicate email in file")
+        elif not row.get("password") and not row.get("password_hash"):
+            report.error(line, "password or password_hash is required")
+        else:
+            try:
+                row = {**row, "created_at": _parse_datetime(row.get("created_at"))}
+            except (TypeError, ValueError) as exc:
+                report.error(line, f"invalid created_at: {exc}")
+                continue
+            seen.add(email)
+            valid.append((line, email, row))
+
+    requested = {row["username"] for _, _, row in valid if row.get("username")}
+    taken = set(db.execute(
+        select(models.User.username).where(models.User.username.in_(requested))
+        .execution_options(include_inactive=True)).scalars())
+    claimed = set()
+    accepted = []
+    for line, email, row in valid:
+        username = row.get("username")
+        if username and (username in taken or username in claimed):
+            report.error(line, f"username {username!r} already taken")
+            continue
+        claimed.add(username)
+        accepted.append((line, email, row))
+
+    # bcrypt releases the GIL, so a thread pool hashes on every core.
+    plain = [row["password"] for _, _, row in accepted if not row.get("password_hash")]
+    hashes = iter(hash_pool.map(utils.hash, plain))
+    generated = iter(utils.generate_usernames(db, sum(1 for _, _, row in accepted if not row.get("username"))))
+
+    columns = ("email", "password", "username", "is_active", "created_at", "updated_at") + USER_FIELDS
+    now = datetime.now().astimezone()
+    records = []
+    lines = {}
+    for line, email, row in accepted:
+        records.append((
+            email,
+            row.get("password_hash") or next(hashes),
+            row.get("username") or next(generated),
+            True,
+            row["created_at"] or now,
+            now,
+            *(row.get(field) for field in USER_FIELDS),
+        ))
+        lines[email] = line
+
+    if not records:
+        return
+
+    if _is_postgres(db):
+        db.execute(text(
+            f"CREATE TEMP TABLE import_users ON COMMIT DROP AS "
+            f"SELECT {', '.join(columns)} FROM users WITH NO DATA"))
+        copy_rows(db, "import_users", columns, records)
+        inserted = set(db.execute(text(
+            f"INSERT INTO users ({', '.join(columns)}) SELECT {', '.join(columns)} FROM import_users "
+            f"ON CONFLICT DO NOTHING RETURNING email")).scalars())
+    else:
+        existing = set(db.execute(
+            select(models.User.email).where(models.User.email.in_(lines))
+            .execution_options(include_inactive=True)).scalars())
+        fresh = [dict(zip(columns, record)) for record in records if record[0] not in existing]
+        if fresh:
+            db.execute(models.User.__table__.insert(), fresh)
+        inserted = {record["email"] for record in fresh}
+
+    for email, line in lines.items():
+        if email not in inserted:
+            report.error(line, "email or username already registered")
+    report.inserted += len(inserted)
+
+
+def import_articles(db: Session, batch: list, report: ImportReport):
+    authors = resolve_user_refs(db, {row.get("author") or row.get("author_id") for _, row in batch} - {None})
+
+    accepted = []
+    for line, row in batch:
+        author_id = authors.get(row.get("author") or row.get("author_id"))
+        if author_id is None:
+            report.error(line, "unknown author")
+        elif not row.get("title") or row.get("content") is None:
+            report.error(line, "title and content are required")
+        else:
+            # Parse here so a bad value fails its own line, not the whole batch.
+            try:
+                row = {
+                    **row,
+                    "created_at": _parse_datetime(row.get("created_at")),
+                    "updated_at": _parse_datetime(row.get("updated_at")),
+                    "is_published": _parse_bool(row.get("is_published", False)),
+                    "views_count": int(row.get("views_count", 0)),
+                }
+            except (TypeError, ValueError) as exc:
+                report.error(line, f"invalid value: {exc}")
+                continue
+            accepted.append((line, author_id, row))
+
+    if not accepted:
+        return
+
+    topics = {topic.title.lower(): topic.id for topic in utils.resolve_topics(
+        db, [title for _, _, row in accepted for title in _parse_topics(row.get("topics"))])}
+
+    now = datetime.now().astimezone()
+    columns = ("title", "subtitle", "cover_image", "content", "excerpt", "author_id", "is_published",
+               "views_count", "reading_time", "created_at", "updated_at")
+    records = []
+    bodies = []
+    for _, author_id, row in accepted:
+        column_text, excerpt, codec, data = content.encode(row["content"])
+        created_at = row["created_at"] or now
+        records.append((row["title"], row.get("subtitle"), row.get("cover_image"), column_text, excerpt,
+                        author_id, row["is_published"], row["views_count"],
+                        row.get("reading_time"), created_at, row["updated_at"] or created_at))
+        bodies.append((codec, data))
+
+    if _is_postgres(db):
+        # Reserve the ids up front so bodies and topic links can be copied too.
+        ids = db.execute(text(
+            "SELECT nextval(pg_get_serial_sequence('articles', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(records)}).scalars().all()
+        copy_rows(db, "articles", ("id",) + columns, [(article_id, *record) for article_id, record in zip(ids, records)])
+    else:
+        ids = db.execute(
+            models.Article.__table__.insert().returning(models.Article.id, sort_by_parameter_order=True),
+            [dict(zip(columns, record)) for record in records]).scalars().all()
+
+    body_rows = [(article_id, codec, data) for article_id, (codec, data) in zip(ids, bodies) if codec]
+    topic_rows = list({
+        (article_id, topics[utils.normalize_topic_title(title).lower()])
+        for article_id, (_, _, row) in zip(ids, accepted)
+        for title in _parse_topics(row.get("topics"))
+        if utils.normalize_topic_title(title).lower() in topics
+    })
+
+    if _is_postgres(db):
+        if body_rows:
+            copy_rows(db, "article_bodies", ("article_id", "codec", "data"), body_rows)
+        if topic_rows:
+            copy_rows(db, "article_topic_association", ("article_id", "topic_id"), topic_rows)
+    else:
+        if body_rows:
+            db.execute(models.ArticleBody.__table__.insert(),
+                       [{"article_id": a, "codec": c, "data": d} for a, c, d in body_rows])
+        if topic_rows:
+            db.execute(models.article_topic_association.insert(),
+                       [{"article_id": a, "topic_id": t} for a, t in topic_rows])
+
+    report.inserted += len(ids)
+
+
+def import_follows(db: Session, batch: list, report: ImportReport):
+    users = resolve_user_refs(db, {row.get(key) for _, row in batch for key in ("follower", "following")} - {None})
+
+    edges = {}
+    for line, row in batch:
+        follower, following = users.get(row.get("follower")), users.get(row.get("following"))
+        if follower is None or following is None:
+            report.error(line, "unknown follower or following user")
+        elif follower == following:
+            report.error(line, "users cannot follow themselves")
+        else:
+            edges.setdefault((follower, following), line)
+
+    if not edges:
+        return
+
+    table = models.user_follow_association
+    if _is_postgres(db):
+        db.execute(text(
+            "CREATE TEMP TABLE import_follows ON COMMIT DROP AS "
+            "SELECT follower_id, following_id FROM user_follow_association WITH NO DATA"))
+        copy_rows(db, "import_follows", ("follower_id", "following_id"), list(edges))
+        inserted = db.execute(text(
+            "INSERT INTO user_follow_association (follower_id, following_id) "
+            "SELECT follower_id, following_id FROM import_follows ON CONFLICT DO NOTHING")).rowcount
+    else:
+        inserted = db.execute(
+            utils.insert(db, table).on_conflict_do_nothing(),
+            [{"follower_id": a, "following_id": b} for a, b in edges]).rowcount
+
+    report.inserted += max(inserted, 0)
+
+
+IMPORTERS = {"users": import_users, "articles": import_articles, "follows": import_follows}
+
+
+def run(kind: str, path: str, batch_size: int = 5000, workers: int = 4) -> ImportReport:
+    report = ImportReport()
+    with SessionLocal() as db, ThreadPoolExecutor(max_workers=workers) as hash_pool:
+        for batch in batches(read_rows(path), batch_size):
+            try:
+                if kind == "users":
+                    import_users(db, batch, report, hash_pool)
+                else:
+                    IMPORTERS[kind](db, batch, report)
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                for line, _ in batch:
+                    report.error(line, f"batch failed: {exc}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.importer", description="Bulk import NDJSON or CSV data.")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="threads used for password hashing")
+    parser.add_argument("--errors", help="write per-row errors as NDJSON to this file instead of stderr")
+    args = parser.parse_args(argv)
+
+    report = run(args.kind, args.path, args.batch_size, args.workers)
+
+    errors = open(args.errors, "wb") if args.errors else sys.stderr.buffer
+    for error in report.errors:
+        errors.write(orjson.dumps(error) + b"\n")
+    if args.errors:
+        errors.close()
+
+    sys.stdout.buffer.write(orjson.dumps(report.summary()) + b"\n")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
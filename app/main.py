@@ -1,36 +1,73 @@
+from contextlib import asynccontextmanager
+
+from anyio import to_thread
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
-from . import models
+from . import database, trending, conditional, warmup, profiling, metrics, images, purge, partitions, presence, related, compression
+
+from .routers import user, auth, article, topic, bookmark, follow, message, export, media
+from .routers import metrics as metrics_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes belong to Alembic; importing the app never touches the
+    # database. Set CREATE_SCHEMA=true to create tables for a throwaway DB.
+    await to_thread.run_sync(warmup.warm_up)
+    trending.start()
+    metrics.start()
+    purge.start()
+    partitions.start()
+    presence.start()
+    related.start()
+    yield
+    await to_thread.run_sync(trending.stop)
+    await to_thread.run_sync(purge.stop)
+    await to_thread.run_sync(partitions.stop)
+    await to_thread.run_sync(presence.stop)
+    await to_thread.run_sync(related.stop)
+    metrics.stop()
+    images.shutdown()
+    database.dispose_engine()
 
-from .routers import user, auth, article, topic, bookmark, follow, message
 
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app = FastAPI()
+    origins = ["*"]
 
-origins = ["*"]
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(compression.CompressionMiddleware)
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    @app.exception_handler(conditional.NotModified)
+    def not_modified_handler(request, exc):
+        return exc.response()
 
-# Create the database tables
-models.Base.metadata.create_all(bind=engine)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(article.router)
+    app.include_router(topic.router)
+    app.include_router(bookmark.router)
+    app.include_router(follow.router)
+    app.include_router(message.router)
+    app.include_router(export.router)
+    app.include_router(media.router)
+    app.include_router(metrics_router.router)
 
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(article.router)
-app.include_router(topic.router)
-app.include_router(bookmark.router)
-app.include_router(follow.router)
-app.include_router(message.router)
+    @app.get("/")
+    def root():
+        return {"message": "Hello World pushing out to ubuntu"}
 
+    return app
 
 
-@app.get("/")
-def root():
-    return {"message": "Hello World pushing out to ubuntu"}
\ No newline at end of file
+app = create_app()
@@ -0,0 +1,384 @@
+"""Prometheus metrics: request latency, status codes, DB pool, cache stats.
+
+Counters and histograms are written into a per-thread shard, so recording
+takes no lock: each thread only ever touches its own dicts and a scrape sums
+all shards. Point-in-time values (pool usage, cache size, threadpool queue)
+are read when scraped.
+
+With several workers (app.server), set METRICS_DIR, or let the launcher create
+one. Each worker then writes a snapshot there every METRICS_FLUSH_SECONDS and
+on shutdown, and a scrape merges all snapshots. A scrape also folds the
+snapshots of exited workers into one ``retired.json``: their counters and
+histograms are kept, so totals stay monotonic, and their gauges are dropped.
+The directory then holds one file per live worker, however often workers are
+recycled.
+"""
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by route and status code.", None),
+    "http_request_duration_seconds": ("histogram", "Time until the response was fully sent.", LATENCY_BUCKETS),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled.", None),
+    "db_queries_per_request": ("histogram", "SQL statements executed per request.", QUERY_BUCKETS),
+    "ratelimit_rejections_total": ("counter", "Requests rejected with 429, by policy.", None),
+    "password_hashes_in_progress": ("gauge", "bcrypt hashes and password checks currently running.", None),
+    "db_pool_size": ("gauge", "Configured connection pool size.", None),
+    "db_pool_checked_out": ("gauge", "Connections currently checked out.", None),
+    "db_pool_checked_in": ("gauge", "Idle connections in the pool.", None),
+    "db_pool_overflow": ("gauge", "Connections opened beyond the pool size.", None),
+    "threadpool_busy": ("gauge", "Threadpool slots in use by sync endpoints and dependencies.", None),
+    "threadpool_waiting": ("gauge", "Tasks waiting for a threadpool slot.", None),
+    "response_cache_entries": ("gauge", "Entries in the response cache.", None),
+    "response_cache_bytes": ("gauge", "Bytes held by the response cache.", None),
+    "response_cache_hits_total": ("counter", "Response cache hits.", None),
+    "response_cache_misses_total": ("counter", "Response cache misses.", None),
+    "singleflight_leaders_total": ("counter", "Renders that ran.", None),
+    "singleflight_coalesced_total": ("counter", "Renders served from another request's in-flight result.", None),
+    "singleflight_timeouts_total": ("counter", "Followers that gave up waiting for a leader.", None),
+}
+
+
+class _Shard:
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = defaultdict(float)
+        # key -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+
+    def merge_into(self, counters: dict, histograms: dict):
+        for key, value in list(self.counters.items()):
+            counters[key] += value
+        for key, counts in list(self.histograms.items()):
+            total = histograms.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                total[i] += count
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+# Totals of threads that have exited (threadpool threads come and go).
+_retired = _Shard()
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc(name: str, labels: tuple = (), amount: float = 1):
+    """Add to a counter or gauge; labels are ((name, value), ...)."""
+    _shard().counters[(name, labels)] += amount
+
+
+def observe(name: str, value: float, labels: tuple = ()):
+    histograms = _shard().histograms
+    key = (name, labels)
+    buckets = METRICS[name][2]
+    counts = histograms.get(key)
+    if counts is None:
+        counts = histograms[key] = [0] * (len(buckets) + 2)
+    counts[bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+@contextmanager
+def in_progress(name: str):
+    inc(name)
+    try:
+        yield
+    finally:
+        inc(name, amount=-1)
+
+
+def _point_in_time() -> list:
+    from . import cache, database, singleflight
+
+    values = []
+    engine = database._engine
+    if engine is not None and hasattr(engine.pool, "checkedout"):
+        pool = engine.pool
+        values += [("db_pool_size", (), pool.size()), ("db_pool_checked_out", (), pool.checkedout()),
+                   ("db_pool_checked_in", (), pool.checkedin()), ("db_pool_overflow", (), pool.overflow())]
+
+    try:
+        from anyio import from_thread, to_thread
+        try:
+            limiter = to_thread.current_default_thread_limiter()
+        except RuntimeError:
+            # A threadpool thread (the /metrics handler) asks its event loop.
+            limiter = from_thread.run_sync(to_thread.current_default_thread_limiter)
+        values += [("threadpool_busy", (), limiter.borrowed_tokens),
+                   ("threadpool_waiting", (), limiter.statistics().tasks_waiting)]
+    except RuntimeError:
+        pass  # not started from an event loop, like the snapshot thread
+
+    stats = cache.responses.stats()
+    values += [("response_cache_entries", (), stats["entries"]), ("response_cache_bytes", (), stats["bytes"]),
+               ("response_cache_hits_total", (), stats["hits"]), ("response_cache_misses_total", (), stats["misses"])]
+    stats = singleflight.reads.stats()
+    values += [("singleflight_leaders_total", (), stats["leaders"]),
+               ("singleflight_coalesced_total", (), stats["coalesced"]),
+               ("singleflight_timeouts_total", (), stats["timeouts"])]
+    return values
+
+
+def snapshot() -> dict:
+    """This worker's metrics, summed over all threads."""
+    counters = defaultdict(float)
+    histograms = {}
+    with _shards_lock:
+        for shard in [shard for shard in _shards if not shard.thread.is_alive()]:
+            shard.merge_into(_retired.counters, _retired.histograms)
+            _shards.remove(shard)
+        shards = [_retired, *_shards]
+    for shard in shards:
+        shard.merge_into(counters, histograms)
+
+    for name, labels, value in _point_in_time():
+        counters[(name, labels)] = value
+
+    return {
+        "pid": os.getpid(),
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), counts] for (name, labels), counts in histograms.items()],
+    }
+
+
+RETIRED = "retired.json"
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(settings.metrics_dir, f"{pid}.json")
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write(path: str, data: dict):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def write_snapshot():
+    _write(_snapshot_path(os.getpid()), snapshot())
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(snap: dict, counters: dict, histograms: dict, gauges: bool = True):
+    for name, labels, value in snap["counters"]:
+        if gauges or METRICS.get(name, ("gauge",))[0] != "gauge":
+            counters[(name, tuple(map(tuple, labels)))] += value
+    for name, labels, counts in snap["histograms"]:
+        total = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(counts))
+        for i, count in enumerate(counts):
+            total[i] += count
+
+
+def compact():
+    """Fold the snapshots of exited workers into ``RETIRED`` and delete them.
+
+    ``merged`` in the file lists the pids folded in by the last run, so if the
+    process dies before deleting their snapshots, the next run deletes them
+    without counting them twice.
+    """
+    directory = settings.metrics_dir
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        # Scrapes in other workers would otherwise fold the same files.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        path = os.path.join(directory, RETIRED)
+        try:
+            retired = _load(path)
+        except (OSError, ValueError):
+            retired = {"pid": 0, "counters": [], "histograms": [], "merged": []}
+
+        counters = defaultdict(float)
+        histograms = {}
+        _merge(retired, counters, histograms)
+        merged = []
+        for filename in os.listdir(directory):
+            pid = filename[:-len(".json")]
+            if not filename.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid() or _alive(int(pid)):
+                continue
+            if int(pid) in retired["merged"]:
+                os.remove(_snapshot_path(int(pid)))
+                continue
+            try:
+                _merge(_load(_snapshot_path(int(pid))), counters, histograms, gauges=False)
+            except (OSError, ValueError):
+                continue
+            merged.append(int(pid))
+
+        if merged or retired["merged"]:
+            _write(path, {
+                "pid": 0,
+                "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+                "histograms": [[name, list(labels), counts] for (name, labels), counts in histograms.items()],
+                "merged": merged,
+            })
+        for pid in merged:
+            os.remove(_snapshot_path(pid))
+
+
+def _snapshots() -> list:
+    snapshots = [snapshot()]
+    if not settings.metrics_dir:
+        return snapshots
+
+    for filename in os.listdir(settings.metrics_dir):
+        if not filename.endswith(".json") or filename == f"{os.getpid()}.json":
+            continue
+        try:
+            with open(os.path.join(settings.metrics_dir, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced right now
+    return snapshots
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def render() -> str:
+    if settings.metrics_dir:
+        compact()
+    counters = defaultdict(float)
+    histograms = {}
+    for snap in _snapshots():
+        # RETIRED (pid 0) has no gauges; a worker may exit after compact().
+        live = snap["pid"] == os.getpid() or (snap["pid"] != 0 and _alive(snap["pid"]))
+        _merge(snap, counters, histograms, gauges=live)
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip((*buckets, "+Inf"), counts[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {counts[-1]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _run():
+    while not _stop.wait(settings.metrics_flush_seconds):
+        write_snapshot()
+
+
+def start():
+    global _thread
+    if settings.metrics_dir and (_thread is None or not _thread.is_alive()):
+        os.makedirs(settings.metrics_dir, exist_ok=True)
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="metrics", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    if settings.metrics_dir:
+        write_snapshot()
+
+
+_queries = contextvars.ContextVar("metrics_queries", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        counter = [0]
+        token = _queries.set(counter)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        inc("http_requests_in_flight")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _queries.reset(token)
+            inc("http_requests_in_flight", amount=-1)
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path == "/metrics":
+                return
+            labels = (("method", scope["method"]), ("route", path or "unmatched"))
+            inc("http_requests_total", labels + (("status", str(status)),))
+            observe("http_request_duration_seconds", time.perf_counter() - started, labels)
+            observe("db_queries_per_request", counter[0], labels)
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Table, Index, LargeBinary, event, false, func, select
+from sqlalchemy.orm import Session, relationship, deferred, with_loader_criteria
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
@@ -77,6 +77,10 @@ class User(Base):
     is_active = Column(Boolean, default=True, nullable=False)
 
 
+# Deactivated accounts wait here for app.purge; the index stays tiny.
+Index("ix_users_inactive", User.id, postgresql_where=User.is_active == false(), sqlite_where=User.is_active == false())
+
+
 
 class Topic(Base):
     __tablename__ = "topics"
@@ -95,6 +99,8 @@ class Topic(Base):
         "User", secondary="user_topic_association", back_populates="interested_topics")
 
 
+Index("ix_topics_title_lower", func.lower(Topic.title), unique=True)
+
 
 class Article(Base):
     __tablename__ = "articles"
@@ -103,13 +109,18 @@ class Article(Base):
     title = Column(String, nullable=False)
     subtitle = Column(String, nullable=True)
     cover_image = Column(String, nullable=True)
-    content = Column(String, nullable=False)
+    # Only the detail view needs the body; list views use the excerpt.
+    content = deferred(Column(String, nullable=False))
+    excerpt = Column(String, nullable=True)
     author_id = Column(Integer, ForeignKey(
         'users.id', ondelete='CASCADE'), nullable=False)
     is_published = Column(Boolean, default=False, nullable=False)
     topic_id = Column(Integer, ForeignKey(
         'topics.id', ondelete='SET NULL'), nullable=True)
     views_count = Column(Integer, default=0, nullable=False)
+    # Maintained by app.reactions in the same statement as the association row.
+    likes_count = Column(Integer, server_default=text("0"), nullable=False)
+    bookmarks_count = Column(Integer, server_default=text("0"), nullable=False)
     reading_time = Column(Integer, nullable=True)
     created_at = Column(TIMESTAMP(timezone=True),
                         server_default=text('now()'), nullable=False)
@@ -132,6 +143,29 @@ class Article(Base):
     )
     comments = relationship(
         "Comment", back_populates="article", cascade="all, delete")
+    body = relationship(
+        "ArticleBody", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+
+class ArticleBody(Base):
+    __tablename__ = "article_bodies"
+
+    article_id = Column(Integer, ForeignKey(
+        "articles.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String, nullable=False)  # "zlib" or "zstd"
+    data = Column(LargeBinary, nullable=False)
+
+
+class ArticleActivity(Base):
+    __tablename__ = "article_activity"
+
+    article_id = Column(Integer, ForeignKey(
+        "articles.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(TIMESTAMP(timezone=True), primary_key=True, index=True)  # start of the hour
+    likes = Column(Integer, server_default=text("0"), nullable=False)
+    comments = Column(Integer, server_default=text("0"), nullable=False)
+    bookmarks = Column(Integer, server_default=text("0"), nullable=False)
+    views = Column(Integer, server_default=text("0"), nullable=False)
 
 
 class Comment(Base):
@@ -155,16 +189,24 @@ class Comment(Base):
     parent = relationship("Comment", remote_side=[id], backref="replies")
 
 
+Index("ix_comments_article_parent_id", Comment.article_id, Comment.parent_id, Comment.id)
+Index("ix_comments_parent_id_id", Comment.parent_id, Comment.id)
+
+
 class Message(Base):
     __tablename__ = "messages"
+    # Monthly range partitions, managed by app.partitions. The partition key
+    # has to be part of the primary key; id alone is still unique (one sequence).
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+    __mapper_args__ = {"primary_key": ["id"]}
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     content = Column(String, nullable=True)  # Optional caption
     is_read = Column(Boolean, default=False)
     read_at = Column(TIMESTAMP(timezone=True), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"))
+    created_at = Column(TIMESTAMP(timezone=True), primary_key=True, server_default=text("now()"), nullable=False)
     updated_at = Column(TIMESTAMP(timezone=True),
                         server_default=text("now()"), onupdate=text("now()"))
 
@@ -174,17 +216,23 @@ class Message(Base):
                             receiver_id], back_populates="received_messages")
 
 
+Index("ix_messages_receiver_id_created_at", Message.receiver_id, Message.created_at)
+Index("ix_messages_sender_id_created_at", Message.sender_id, Message.created_at)
+
+
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+    __mapper_args__ = {"primary_key": ["id"]}
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     type = Column(String, nullable=False)  # "like", "follow", "comment"
     user_id = Column(Integer, ForeignKey("users.id"),
                      nullable=False)  # who receives it
     triggered_by_id = Column(Integer, ForeignKey(
         "users.id"), nullable=False)  # who triggered it
     article_id = Column(Integer, ForeignKey("articles.id"), nullable=True)
-    created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"))
+    created_at = Column(TIMESTAMP(timezone=True), primary_key=True, server_default=text("now()"), nullable=False)
     updated_at = Column(TIMESTAMP(timezone=True),
                         server_default=text("now()"), onupdate=text("now()"))
     is_read = Column(Boolean, default=False)
@@ -194,6 +242,9 @@ class Notification(Base):
     triggered_by = relationship("User", foreign_keys=[triggered_by_id], back_populates="triggered_notifications")
 
 
+Index("ix_notifications_user_id_created_at", Notification.user_id, Notification.created_at)
+
+
 user_topic_association = Table(
     "user_topic_association",
     Base.metadata,
@@ -231,3 +282,38 @@ article_bookmark_association = Table(
     Column("article_id", ForeignKey("articles.id",
            ondelete="CASCADE"), primary_key=True),
 )
+
+
+class AccountPurge(Base):
+    """Progress of deleting a deactivated account's rows; see app.purge."""
+    __tablename__ = "account_purges"
+
+    # No foreign key: the record outlives the user row.
+    user_id = Column(Integer, primary_key=True)
+    stage = Column(String, nullable=False)
+    rows_deleted = Column(Integer, server_default=text("0"), nullable=False)
+    requested_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=text(
+        "now()"), onupdate=text("now()"), nullable=False)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+
+_inactive_user_ids = select(User.__table__.c.id).where(User.__table__.c.is_active == false())
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _hide_inactive_accounts(state):
+    """Deactivated users, their articles and their comments are invisible until purged.
+
+    Applies to every ORM query and, through propagation, to the relationship
+    loads of what it returns. Queries that need them anyway (uniqueness
+    checks, the purge) pass ``execution_options(include_inactive=True)``.
+    """
+    if (not state.is_select or state.is_column_load or state.is_relationship_load
+            or state.execution_options.get("include_inactive", False)):
+        return
+    state.statement = state.statement.options(
+        with_loader_criteria(User, User.is_active == True, include_aliases=True),
+        with_loader_criteria(Article, lambda cls: cls.author_id.not_in(_inactive_user_ids), include_aliases=True),
+        with_loader_criteria(Comment, lambda cls: cls.user_id.not_in(_inactive_user_ids), include_aliases=True),
+    )
@@ -0,0 +1,218 @@
+"""Monthly range partitions for messages and notifications, and their retention.
+
+Both tables are partitioned by ``created_at`` (PostgreSQL only; see the
+c9e1a5d7f3b2 migration). Each month is its own partition named
+``<table>_pYYYYMM``, and a ``<table>_default`` partition catches anything
+outside the created range, so an insert never fails for want of a partition.
+Queries that bound ``created_at``, or that walk it in order with a LIMIT,
+only touch the partitions they need.
+
+The maintenance job creates the partitions for the next
+``PARTITION_MONTHS_AHEAD`` months. PostgreSQL refuses to create a partition
+while the default partition holds rows for its range, so in that case the
+month's rows are moved out of the default partition into a new table, which
+is then attached. The job also drops (or, with
+``PARTITION_RETENTION_ACTION=detach``, detaches for archiving) whole partitions
+older than the table's retention, which costs one catalog change instead of
+a huge DELETE. Expired rows left in the default partition are first given a
+partition of their own the same way, so retention covers them too.
+
+Every partition is created or removed in its own transaction. A step that
+fails is logged and the rest still run. The job runs at startup and then
+every ``PARTITION_MAINTENANCE_SECONDS``; a session-level advisory lock keeps
+workers from running it at the same time. Run it by hand with
+
+    python -m app.partitions
+"""
+import argparse
+import logging
+import re
+import sys
+import threading
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import get_engine
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("messages", "notifications")
+NAME_PATTERN = re.compile(r"_p(\d{4})(\d{2})$")
+LOCK_KEY = 0x70617274  # "part"
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def retention_months(table: str) -> int:
+    """Months of data to keep; 0 keeps everything."""
+    return {"messages": settings.message_retention_months,
+            "notifications": settings.notification_retention_months}[table]
+
+
+def create_partition(connection: Connection, table: str, month: date) -> bool:
+    """Create ``table``'s partition for ``month``; False if it already exists."""
+    name = partition_name(table, month)
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+    bounds = {"start": month.isoformat(), "end": add_months(month, 1).isoformat()}
+    values = f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    stray = connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE created_at >= :start AND created_at < :end)"),
+        bounds).scalar()
+    if not stray:
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {values}"))
+        return True
+
+    # Build the partition from the month's rows, then attach it; attaching
+    # checks that no row in the range is left in the default partition.
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM {table}_default WHERE created_at >= :start AND created_at < :end "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"), bounds).rowcount
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {values}"))
+    logger.info("Moved %s rows of %s from %s_default to %s", moved, table, table, name)
+    return True
+
+
+def stray_months(connection: Connection, table: str, before: date) -> list[date]:
+    """Months with rows in ``table``'s default partition older than ``before``."""
+    return [month_start(month) for month in connection.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at) FROM {table}_default WHERE created_at < :before"),
+        {"before": before.isoformat()}).scalars()]
+
+
+def partitions(connection: Connection, table: str) -> dict:
+    """Monthly partitions currently attached to ``table``: {month: name}."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass)"), {"table": table}).scalars()
+    found = {}
+    for name in names:
+        match = NAME_PATTERN.search(name)
+        if match:
+            found[date(int(match[1]), int(match[2]), 1)] = name
+    return found
+
+
+def _step(connection: Connection, description: str, fn, *args):
+    """Run ``fn`` in a transaction of its own; a failure is logged and returns None."""
+    try:
+        with connection.begin():
+            return fn(connection, *args)
+    except Exception:
+        logger.warning("Partition maintenance: %s failed", description, exc_info=True)
+        return None
+
+
+def _remove(connection: Connection, table: str, name: str):
+    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+    if settings.partition_retention_action == "drop":
+        connection.execute(text(f"DROP TABLE {name}"))
+    return True
+
+
+def maintain(connection: Connection, now: datetime = None) -> dict:
+    """Create upcoming partitions and apply retention, each step committed on its own."""
+    if connection.dialect.name != "postgresql":
+        return {}
+    with connection.begin():
+        # Session level, so it outlives the steps' transactions.
+        if not connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LOCK_KEY}).scalar():
+            return {}  # another worker is on it
+    try:
+        return {table: _maintain_table(connection, table, month_start(now or datetime.now(timezone.utc)))
+                for table in TABLES}
+    finally:
+        with connection.begin():
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+
+
+def _maintain_table(connection: Connection, table: str, this_month: date) -> dict:
+    _step(connection, f"creating {table}_default",
+          lambda c: c.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")))
+    months = [add_months(this_month, i) for i in range(settings.partition_months_ahead + 1)]
+    keep = retention_months(table)
+    cutoff = add_months(this_month, -keep)
+    if keep:
+        # Expired rows in the default partition get a partition of their own,
+        # which the retention below then removes.
+        months += _step(connection, f"finding expired rows in {table}_default", stray_months, table, cutoff) or []
+
+    created = []
+    for month in sorted(months):
+        name = partition_name(table, month)
+        if _step(connection, f"creating {name}", create_partition, table, month):
+            created.append(name)
+
+    removed = []
+    if keep:
+        for month, name in sorted((_step(connection, f"listing partitions of {table}", partitions, table) or {}).items()):
+            if month >= cutoff:
+                break
+            if _step(connection, f"removing {name}", _remove, table, name):
+                removed.append(name)
+    if created or removed:
+        logger.info("Partitions of %s: created %s, removed %s", table, created, removed)
+    return {"created": created, "removed": removed}
+
+
+def run() -> dict:
+    try:
+        with get_engine().connect() as connection:
+            return maintain(connection)
+    except Exception:
+        logger.exception("Partition maintenance failed")
+        return {}
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _run():
+    while True:
+        run()
+        if _stop.wait(settings.partition_maintenance_seconds):
+            return
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="partitions", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.partitions",
+                                     description="Create upcoming partitions and apply retention.")
+    parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    for table, changes in run().items():
+        print(f"{table}: created {len(changes['created'])}, removed {len(changes['removed'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Last-seen tracking for ``User.last_actived_at``, without a write per request.
+
+Every authenticated request calls ``touch``, which only records the time in
+an in-memory table. A background job writes the pending times to the
+database every ``PRESENCE_FLUSH_SECONDS``, all in one ``UPDATE ... FROM
+(VALUES ...)`` statement. The statement only moves ``last_actived_at``
+forward and leaves ``updated_at`` alone. A user counts as online if they were
+seen within ``PRESENCE_ONLINE_SECONDS``.
+
+Under app.server, ``touch`` also stores the time in app.shared's ``seen``
+table, so every worker can answer for users whose requests went to a
+different worker. The table stores each user's key fingerprint, so a user
+only ever reads their own time; one the table gave up to make room is read
+from ``last_actived_at``, like any user missing from memory. Times outside
+the range a real request could have produced are ignored.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import TIMESTAMP, Integer, column, or_, select, update, values
+from sqlalchemy.orm import Session
+
+from . import models, shared
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Shared times further ahead than this were not written by touch; the margin
+# allows for the system clock being stepped back.
+MAX_CLOCK_SKEW_SECONDS = 60
+
+# Everything seen recently, for presence reads; pruned after each flush.
+_seen: dict[int, datetime] = {}
+# Seen since the last flush, waiting to be written.
+_pending: dict[int, datetime] = {}
+_lock = threading.Lock()
+
+_stop = threading.Event()
+_thread = None
+
+
+def _shared_key(user_id: int) -> str:
+    return f"seen:{user_id}"
+
+
+def touch(user_id: int, now: datetime = None):
+    """Record that ``user_id`` is active now; no database access."""
+    now = now or datetime.now(timezone.utc)
+    with _lock:
+        _seen[user_id] = _pending[user_id] = now
+    if shared.seen is not None:
+        stamp = int(now.timestamp())
+        shared.seen.update(_shared_key(user_id),
+                           lambda old: max(old, stamp) if old <= stamp + MAX_CLOCK_SKEW_SECONDS else stamp)
+
+
+def _seen_shared(user_id: int, now: datetime = None):
+    if shared.seen is None:
+        return None
+    stamp = shared.seen.get(_shared_key(user_id))
+    latest = (now or datetime.now(timezone.utc)).timestamp() + MAX_CLOCK_SKEW_SECONDS
+    return datetime.fromtimestamp(stamp, timezone.utc) if 0 < stamp <= latest else None
+
+
+def last_seen(db: Session, user_ids: list[int]) -> dict[int, datetime]:
+    """Latest activity of each user: memory first, then the database."""
+    with _lock:
+        found = {user_id: _seen[user_id] for user_id in user_ids if user_id in _seen}
+    for user_id in user_ids:
+        stamp = _seen_shared(user_id)
+        if stamp is not None and (user_id not in found or stamp > found[user_id]):
+            found[user_id] = stamp
+
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        users = models.User.__table__
+        found.update(
+            (user_id, stamp) for user_id, stamp in db.execute(
+                select(users.c.id, users.c.last_actived_at)
+                .where(users.c.id.in_(missing), users.c.is_active == True,
+                       users.c.last_actived_at.is_not(None))
+            )
+        )
+    return found
+
+
+def is_online(stamp: datetime, now: datetime = None) -> bool:
+    now = now or datetime.now(timezone.utc)
+    return stamp is not None and now - stamp <= timedelta(seconds=settings.presence_online_seconds)
+
+
+def _restore(pending: dict[int, datetime]):
+    """Put back the times a failed flush took, keeping the newer time per user."""
+    with _lock:
+        for user_id, stamp in pending.items():
+            if user_id not in _pending or _pending[user_id] < stamp:
+                _pending[user_id] = stamp
+
+
+def flush(db: Session, now: datetime = None) -> dict[int, datetime]:
+    """Write the pending times in one statement and return them; the caller commits.
+
+    A failed statement puts the times back. If the commit fails, the caller
+    puts back the returned times with ``_restore``.
+    """
+    global _pending
+    now = now or datetime.now(timezone.utc)
+    with _lock:
+        pending, _pending = _pending, {}
+        # Old entries are in the database now; the next read finds them there.
+        cutoff = now - timedelta(seconds=settings.presence_online_seconds)
+        for user_id in [user_id for user_id, stamp in _seen.items() if stamp < cutoff and user_id not in pending]:
+            del _seen[user_id]
+
+    if not pending:
+        return pending
+
+    users = models.User.__table__
+    seen = values(column("user_id", Integer), column("seen_at", TIMESTAMP(timezone=True)), name="seen") \
+        .data(list(pending.items()))
+    try:
+        db.execute(
+            update(users)
+            .where(users.c.id == seen.c.user_id,
+                   or_(users.c.last_actived_at.is_(None), users.c.last_actived_at < seen.c.seen_at))
+            # Keep updated_at meaning "profile last changed".
+            .values(last_actived_at=seen.c.seen_at, updated_at=users.c.updated_at)
+        )
+    except Exception:
+        _restore(pending)
+        raise
+    return pending
+
+
+def run():
+    db = SessionLocal()
+    pending = {}
+    try:
+        pending = flush(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Retried with the next flush.
+        _restore(pending)
+        logger.exception("Failed to flush user activity")
+    finally:
+        db.close()
+
+
+def _run():
+    while not _stop.wait(settings.presence_flush_seconds):
+        run()
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="presence", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    run()
@@ -0,0 +1,251 @@
+"""On-demand profiling of single requests.
+
+A request is profiled when it carries a valid ``X-Profile-Token`` header, or
+when it falls into the ``PROFILE_SAMPLE_RATE`` fraction of traffic. Tokens are
+signed with the app's secret key and expire; mint one with
+
+    python -m app.profiling --ttl 600
+
+While a profiled request runs, a sampler thread records the stacks of every
+other thread in the process every ``PROFILE_INTERVAL_MS``; idle stacks are
+dropped. The result is written to ``PROFILE_DIR`` as folded stacks
+(``<id>.folded``, readable by flamegraph.pl, speedscope and friends) next to a
+``<id>.json`` with the phase breakdown. Auth, database (cursor execute) and
+response write times are measured. Time in the driver and result handling,
+ORM hydration and serialization is estimated from the share of samples in
+each (the ``*_est`` phases). For requests profiled with a token, the
+breakdown is also returned in a ``Server-Timing`` header; sampled requests
+only write their files, so the timings never reach unauthenticated clients.
+
+Only one request per worker is profiled at a time. The sampler sees the whole
+process, so requests running concurrently in the same worker show up in the
+flame graph too.
+"""
+import argparse
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from anyio import to_thread
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+HEADER = b"x-profile-token"
+
+_current = contextvars.ContextVar("profile", default=None)
+_busy = threading.Lock()
+
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py", "base_events.py")
+CATEGORIES = (
+    ("sql", ("/sqlalchemy/engine/", "/sqlalchemy/pool/", "/psycopg2/")),
+    ("orm", ("/sqlalchemy/",)),
+    ("serialize", ("/pydantic", "/fastapi/encoders.py", "orjson", "/json/")),
+    ("auth", ("/jose/", "/passlib/", "oauth2.py")),
+)
+
+
+def sign(expires: int) -> str:
+    digest = hmac.new(settings.secret_key.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{digest}"
+
+
+def make_token(ttl: int = 600) -> str:
+    return sign(int(time.time()) + ttl)
+
+
+def verify(token: str) -> bool:
+    expires, _, _ = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(token, sign(int(expires)))
+
+
+class Profile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.phases = Counter()
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self.queries = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - started
+
+    def report(self, total: float) -> dict:
+        phases = {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+        if self.samples:
+            # Not timed directly: the share of samples spent there.
+            for name in ("sql", "orm", "serialize"):
+                phases[f"{name}_est"] = round(self.categories[name] / self.samples * total * 1000, 3)
+        phases["total"] = round(total * 1000, 3)
+        return {"id": self.id, "method": self.method, "path": self.path, "queries": self.queries,
+                "samples": self.samples, "interval_ms": settings.profile_interval_ms,
+                "phases_ms": phases, "sampled": dict(self.categories)}
+
+    def server_timing(self, report: dict) -> str:
+        return ", ".join(f"{name};dur={value}" for name, value in report["phases_ms"].items())
+
+
+@contextmanager
+def phase(name: str):
+    """Time a block into the current request's profile; free when not profiling."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    with profile.phase(name):
+        yield
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    filename = "/".join(code.co_filename.rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Sampler(threading.Thread):
+    def __init__(self, profile: Profile):
+        super().__init__(name="profiler", daemon=True)
+        self.profile = profile
+        self.stopped = threading.Event()
+
+    def sample(self):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident or frame.f_code.co_filename.endswith(IDLE_FILES):
+                continue
+            stack = []
+            category = None
+            while frame is not None:
+                filename = frame.f_code.co_filename
+                if category is None:
+                    category = next((name for name, markers in CATEGORIES
+                                     if any(marker in filename for marker in markers)), None)
+                stack.append(_label(frame))
+                frame = frame.f_back
+            self.profile.stacks[";".join(reversed(stack))] += 1
+            self.profile.categories[category or "app"] += 1
+            self.profile.samples += 1
+
+    def run(self):
+        interval = settings.profile_interval_ms / 1000
+        while not self.stopped.wait(interval):
+            self.sample()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and conn.info.get("profile_query_start"):
+        profile.phases["db"] += time.perf_counter() - conn.info["profile_query_start"].pop()
+        profile.queries += 1
+
+
+def save(profile: Profile, report: dict):
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    base = os.path.join(settings.profile_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{profile.id}")
+    with open(base + ".folded", "w") as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".json", "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def _finish(profile: Profile, sampler: Sampler, total: float):
+    try:
+        sampler.join()
+        save(profile, profile.report(total))
+    finally:
+        _busy.release()
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware, so streaming responses keep streaming."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope):
+        """Return (profile the request, it carried a valid token)."""
+        for name, value in scope["headers"]:
+            if name == HEADER:
+                valid = verify(value.decode("latin-1"))
+                return valid, valid
+        rate = settings.profile_sample_rate
+        return rate > 0 and random.random() < rate, False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        wanted, requested = self._wanted(scope)
+        if not wanted or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+        token = _current.set(profile)
+        sampler = Sampler(profile)
+        sampler.start()
+        write_started = None
+
+        async def send_wrapper(message):
+            nonlocal write_started
+            if message["type"] == "http.response.start":
+                write_started = time.perf_counter()
+                profile.phases["handler"] = write_started - profile.started
+                if requested:
+                    report = profile.report(write_started - profile.started)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", profile.server_timing(report).encode()),
+                        (b"x-profile-id", profile.id.encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            sampler.stopped.set()
+            _current.reset(token)
+            if write_started is not None:
+                profile.phases["write"] = finished - write_started
+            # Joining the sampler and writing the files block; keep them off the event loop.
+            await to_thread.run_sync(_finish, profile, sampler, finished - profile.started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.profiling", description="Mint an X-Profile-Token value.")
+    parser.add_argument("--ttl", type=int, default=600, help="seconds the token stays valid")
+    args = parser.parse_args(argv)
+    print(make_token(args.ttl))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""Background deletion of deactivated accounts, in bounded batches.
+
+Deleting a user is a soft delete: the request flips ``User.is_active`` and
+records an AccountPurge, and from then on no ORM query returns the user, their
+articles or their comments (see models._hide_inactive_accounts). This job
+then removes the rows stage by stage, at most ``PURGE_BATCH_SIZE`` rows per
+transaction, so no single statement holds locks for long. The stage and the
+running row count are saved with every batch, so a restart picks up where it
+left off. Likes and bookmarks the user gave are removed first, and the
+counters on the articles they pointed at are decremented in the same
+transaction.
+
+Several workers can run the job; each batch locks its AccountPurge row with
+SKIP LOCKED, so two workers never work on the same account at once. Run it by
+hand with
+
+    python -m app.purge
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, delete, or_, select, tuple_, union, update
+from sqlalchemy.orm import Session
+
+from . import cache, models
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+likes = models.article_like_association
+bookmarks = models.article_bookmark_association
+follows = models.user_follow_association
+
+
+def _stages(user_id: int) -> list:
+    """(name, table, rows to delete, counter to decrement on the liked article)."""
+    articles = select(models.Article.__table__.c.id).where(models.Article.__table__.c.author_id == user_id)
+    notifications = models.Notification.__table__
+    messages = models.Message.__table__
+    comments = models.Comment.__table__
+    return [
+        ("likes", likes, likes.c.user_id == user_id, "likes_count"),
+        ("bookmarks", bookmarks, bookmarks.c.user_id == user_id, "bookmarks_count"),
+        ("follows", follows, or_(follows.c.follower_id == user_id, follows.c.following_id == user_id), None),
+        ("topics", models.user_topic_association, models.user_topic_association.c.user_id == user_id, None),
+        ("notifications", notifications, or_(notifications.c.user_id == user_id,
+                                             notifications.c.triggered_by_id == user_id,
+                                             notifications.c.article_id.in_(articles)), None),
+        ("messages", messages, or_(messages.c.sender_id == user_id, messages.c.receiver_id == user_id), None),
+        ("comments", comments, or_(comments.c.user_id == user_id, comments.c.article_id.in_(articles)), None),
+        ("article_likes", likes, likes.c.article_id.in_(articles), None),
+        ("article_bookmarks", bookmarks, bookmarks.c.article_id.in_(articles), None),
+        ("article_topics", models.article_topic_association,
+         models.article_topic_association.c.article_id.in_(articles), None),
+        ("article_activity", models.ArticleActivity.__table__,
+         models.ArticleActivity.__table__.c.article_id.in_(articles), None),
+        ("article_bodies", models.ArticleBody.__table__, models.ArticleBody.__table__.c.article_id.in_(articles), None),
+        ("articles", models.Article.__table__, models.Article.__table__.c.author_id == user_id, None),
+        ("user", models.User.__table__, models.User.__table__.c.id == user_id, None),
+    ]
+
+
+FIRST_STAGE = "likes"
+
+
+def affected_tags(db: Session, user_id: int) -> list[str]:
+    """Cache tags of every response that shows the user or something they wrote or touched."""
+    comments = models.Comment.__table__
+    article_ids = set(db.execute(union(
+        select(models.Article.__table__.c.id).where(models.Article.__table__.c.author_id == user_id),
+        select(likes.c.article_id).where(likes.c.user_id == user_id),
+        select(bookmarks.c.article_id).where(bookmarks.c.user_id == user_id),
+        select(comments.c.article_id).where(comments.c.user_id == user_id),
+    )).scalars())
+    follow_ids = set(db.execute(union(
+        select(follows.c.following_id).where(follows.c.follower_id == user_id),
+        select(follows.c.follower_id).where(follows.c.following_id == user_id),
+    )).scalars())
+    return [f"user:{user_id}", *(f"article:{i}" for i in article_ids), *(f"user:{i}" for i in follow_ids)]
+
+
+def deactivate(db: Session, user: models.User):
+    """Soft-delete ``user`` and queue the purge; the caller commits."""
+    user.is_active = False
+    if db.get(models.AccountPurge, user.id) is None:
+        db.add(models.AccountPurge(user_id=user.id, stage=FIRST_STAGE))
+
+
+def _decrement(db: Session, column: str, article_ids: Counter):
+    table = models.Article.__table__
+    db.execute(
+        update(table).where(table.c.id == bindparam("article_id"))
+        .values({column: table.c[column] - bindparam("amount")}),
+        [{"article_id": article_id, "amount": amount} for article_id, amount in article_ids.items()],
+    )
+
+
+def run_batch(db: Session) -> bool:
+    """Delete one batch of one pending purge and commit; False when nothing is pending."""
+    purge = (db.query(models.AccountPurge)
+             .filter(models.AccountPurge.finished_at.is_(None))
+             .order_by(models.AccountPurge.requested_at)
+             .with_for_update(skip_locked=True)
+             .first())
+    if purge is None:
+        db.rollback()
+        return False
+
+    stages = _stages(purge.user_id)
+    names = [stage[0] for stage in stages]
+    name, table, where, counter = stages[names.index(purge.stage)]
+
+    key = list(table.primary_key.columns)
+    batch = select(*key).where(where).limit(settings.purge_batch_size)
+    stmt = delete(table).where((key[0] if len(key) == 1 else tuple_(*key)).in_(batch))
+    touched = Counter()
+    if counter:
+        touched.update(db.execute(stmt.returning(table.c.article_id)).scalars())
+        deleted = sum(touched.values())
+        if touched:
+            _decrement(db, counter, touched)
+    else:
+        deleted = db.execute(stmt).rowcount
+
+    purge.rows_deleted += deleted
+    if deleted < settings.purge_batch_size:
+        if name == names[-1]:
+            purge.finished_at = datetime.now(timezone.utc)
+            logger.info("Purged user %s: %s rows", purge.user_id, purge.rows_deleted)
+        else:
+            purge.stage = names[names.index(name) + 1]
+    db.commit()
+
+    if touched:
+        cache.invalidate(*(f"article:{article_id}" for article_id in touched))
+    return True
+
+
+def run_pending(limit: int = None) -> int:
+    """Work through pending purges; returns the number of batches run."""
+    batches = 0
+    db = SessionLocal()
+    try:
+        while (limit is None or batches < limit) and not _stop.is_set():
+            if not run_batch(db):
+                break
+            batches += 1
+            # Leave room for other traffic between batches.
+            time.sleep(settings.purge_pause_seconds)
+    except Exception:
+        db.rollback()
+        logger.exception("Account purge failed")
+    finally:
+        db.close()
+    return batches
+
+
+_stop = threading.Event()
+_wake = threading.Event()
+_thread = None
+
+
+def wake():
+    """Start on newly queued purges now instead of at the next interval."""
+    _wake.set()
+
+
+def _run():
+    while not _stop.is_set():
+        run_pending()
+        _wake.wait(settings.purge_interval_seconds)
+        _wake.clear()
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="purge", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.purge", description="Purge deactivated accounts.")
+    parser.add_argument("--status", action="store_true", help="list purges and exit")
+    args = parser.parse_args(argv)
+
+    if not args.status:
+        logging.basicConfig(level=logging.INFO)
+        run_pending()
+    with SessionLocal() as db:
+        for purge in db.query(models.AccountPurge).order_by(models.AccountPurge.requested_at):
+            state = "done" if purge.finished_at else f"at {purge.stage}"
+            print(f"user {purge.user_id}: {state}, {purge.rows_deleted} rows deleted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
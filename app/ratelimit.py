@@ -0,0 +1,153 @@
+"""Per-route rate limits keyed by client IP and authenticated user.
+
+Limits use GCRA (the generic cell rate algorithm), which is a token bucket
+stored as a single number per key: the theoretical arrival time (TAT) of the
+next request. A request is allowed while ``TAT - (burst - 1) * interval <= now``;
+each allowed request pushes TAT forward by one interval.
+
+State lives in a store. The default is a bounded in-process LRU. Under
+app.server a shared-memory table is used instead, so all workers count
+against the same budget. Limits are route dependencies, so they run before
+the endpoint body, and before password hashing in particular.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+
+from . import metrics, shared
+from .config import settings
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Rate:
+    def __init__(self, spec: str):
+        count, _, period = spec.partition("/")
+        self.count = int(count)
+        self.period = PERIODS[period]
+        self.interval = self.period / self.count
+        # A full period's worth of requests may arrive at once.
+        self.tolerance = self.interval * (self.count - 1)
+
+
+class MemoryStore:
+    """Bounded LRU of TATs; the least recently seen keys are forgotten first."""
+
+    def __init__(self, max_keys: int = None):
+        self._max_keys = max_keys
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_keys(self) -> int:
+        return self._max_keys if self._max_keys is not None else settings.ratelimit_max_keys
+
+    def update(self, key: str, fn) -> float:
+        with self._lock:
+            tat = self._tats.pop(key, 0.0)
+            self._tats[key] = tat = fn(tat)
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+            return tat
+
+
+class SharedStore:
+    """TATs in app.shared's rate table, in microseconds, visible to every worker."""
+
+    def __init__(self, table: shared.SharedTable):
+        self.table = table
+
+    def update(self, key: str, fn) -> float:
+        return self.table.update(key, lambda tat: int(fn(tat / 1e6) * 1e6)) / 1e6
+
+
+_memory = MemoryStore()
+
+
+def store():
+    return SharedStore(shared.rates) if shared.rates is not None else _memory
+
+
+def acquire(key: str, rate: Rate, now: float = None) -> float:
+    """Take one request from ``key``'s budget; returns 0, or seconds to wait."""
+    # CLOCK_MONOTONIC is system wide, so forked workers agree on it.
+    now = time.monotonic() if now is None else now
+    wait = 0.0
+
+    def step(tat):
+        nonlocal wait
+        tat = max(tat, now)
+        allowed_at = tat - rate.tolerance
+        if allowed_at > now:
+            wait = allowed_at - now
+            return tat
+        return tat + rate.interval
+
+    store().update(key, step)
+    return wait
+
+
+def client_ip(request: Request) -> str:
+    if settings.ratelimit_trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def token_user_id(request: Request):
+    """User id from the bearer token, without touching the database."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("user_id")
+    except JWTError:
+        return None
+
+
+def limit(name: str, ip: str = None, user: str = None):
+    """Route dependency enforcing ``ip`` and/or ``user`` rates such as "10/minute".
+
+    Requests without a valid token are counted against the ``user`` rate by
+    IP, so anonymous clients can't skip it.
+    """
+    ip_rate = Rate(ip) if ip else None
+    user_rate = Rate(user) if user else None
+
+    async def dependency(request: Request):
+        # async: runs on the event loop, so a rejected request never waits for a thread.
+        if not settings.ratelimit_enabled:
+            return
+
+        checks = []
+        address = client_ip(request)
+        if ip_rate:
+            checks.append((f"{name}:ip:{address}", ip_rate))
+        if user_rate:
+            user_id = token_user_id(request)
+            checks.append((f"{name}:user:{user_id}" if user_id is not None else f"{name}:anon:{address}", user_rate))
+
+        for key, rate in checks:
+            wait = acquire(key, rate)
+            if wait > 0:
+                metrics.inc("ratelimit_rejections_total", (("policy", name),))
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+
+    return dependency
+
+
+login = limit("login", ip="10/minute")
+signup = limit("signup", ip="5/minute")
+search = limit("search", ip="120/minute", user="60/minute")
+messages = limit("messages", user="30/minute")
+comments = limit("comments", user="20/minute")
+writes = limit("writes", user="120/minute")
@@ -0,0 +1,64 @@
+from typing import Optional
+
+from sqlalchemy import delete, exists, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+# kind -> (association table, counter column on articles, trending counter)
+REACTIONS = {
+    "like": (models.article_like_association, "likes_count", "likes"),
+    "bookmark": (models.article_bookmark_association, "bookmarks_count", "bookmarks"),
+}
+
+
+def _apply(db: Session, kind: str, changed, article_id: int, sign: int) -> Optional[tuple[int, bool]]:
+    # One statement: the data-modifying CTE touches the association row and
+    # the UPDATE moves the counter by however many rows it actually changed.
+    _, counter, _ = REACTIONS[kind]
+    articles = models.Article.__table__
+    changed_count = select(func.count()).select_from(changed).scalar_subquery()
+    row = db.execute(
+        update(articles)
+        .add_cte(changed)
+        .where(articles.c.id == article_id)
+        .values({counter: articles.c[counter] + sign * changed_count,
+                 "updated_at": articles.c.updated_at})
+        .returning(articles.c[counter], changed_count)
+    ).first()
+    if row is None:
+        return None
+    return row[0], bool(row[1])
+
+
+def add(db: Session, kind: str, article_id: int, user_id: int) -> Optional[tuple[int, bool]]:
+    """Idempotently add the reaction; returns (new count, changed) or None if the article is missing."""
+    table = REACTIONS[kind][0]
+    changed = (
+        insert(table)
+        .from_select(["user_id", "article_id"],
+                     select(literal(user_id), models.Article.id).where(models.Article.id == article_id))
+        .on_conflict_do_nothing()
+        .returning(table.c.article_id)
+        .cte("changed")
+    )
+    return _apply(db, kind, changed, article_id, 1)
+
+
+def remove(db: Session, kind: str, article_id: int, user_id: int) -> Optional[tuple[int, bool]]:
+    table = REACTIONS[kind][0]
+    changed = (
+        delete(table)
+        .where(table.c.user_id == user_id, table.c.article_id == article_id)
+        .returning(table.c.article_id)
+        .cte("changed")
+    )
+    return _apply(db, kind, changed, article_id, -1)
+
+
+def has(db: Session, kind: str, article_id: int, user_id: int) -> bool:
+    table = REACTIONS[kind][0]
+    return db.execute(
+        select(exists().where(table.c.user_id == user_id, table.c.article_id == article_id))
+    ).scalar()
@@ -0,0 +1,454 @@
+"""Related articles from a precomputed TF-IDF similarity index.
+
+Each published article becomes a TF-IDF vector over its title, subtitle,
+body and topics. Title and topic terms count more than body terms. Cosine
+similarities are computed in blocks of rows with sparse matrix products, and
+only the top ``RELATED_TOP_K`` neighbours of each article are kept. Terms
+that occur in more than ``RELATED_MAX_DF`` of the articles are dropped; they
+say little about similarity and make the products dense.
+
+The result is a single ``.npy`` file at ``RELATED_INDEX_PATH``: one record per
+article with its id, its neighbours' ids and their scores, sorted by id.
+Workers memory-map the file and reload it when it is replaced, so a lookup is
+a binary search and a slice, with no database access.
+
+The builder keeps the term counts, IDF and neighbours in a corpus file next
+to the index (``<index>.corpus.npz``). Only one worker builds at a time (a
+PostgreSQL advisory lock); whichever gets the lock continues from the saved
+corpus, reading it from disk unless it saved that one itself, and the others
+just read the index. Each run only re-vectorizes articles whose
+``updated_at`` moved and drops those that were unpublished or deleted. It
+then recomputes the neighbours of the rows that can have changed: the
+changed articles, every article that listed one of them, and every article a
+changed article now beats.
+
+A term's IDF is fixed when the term is first seen, so the rows that are not
+recomputed keep exactly the neighbours a recomputation would give them. It
+also means IDF drifts from the current document frequencies, and scores
+drift with it. A full rebuild every ``RELATED_REBUILD_SECONDS`` brings them
+back in line. Publishing or editing an article wakes the job. Build by hand
+with
+
+    python -m app.related
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from . import content, models
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 0x72656c61  # "rela"
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{2,}")
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does for from had has
+have he her his how if in into is it its just more most my no not of on one or our out over she so some than
+that the their them then there these they this to up us was we were what when which who will with would you
+your
+""".split())
+# Term weight of each field; topic terms are prefixed so "python" the topic
+# and "python" the word are different terms.
+WEIGHTS = {"title": 3, "subtitle": 2, "content": 1, "topic": 3}
+
+
+def tokens(value: Optional[str]) -> list[str]:
+    if not value:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(value.lower()) if token not in STOPWORDS]
+
+
+def terms(title: str, subtitle: Optional[str], body: str, topics: list[str]) -> Counter:
+    """Weighted term counts of one article."""
+    counts = Counter()
+    for field, words in (("title", tokens(title)), ("subtitle", tokens(subtitle)), ("content", tokens(body)),
+                         ("topic", [f"#{topic.lower()}" for topic in topics])):
+        for word in words:
+            counts[word] += WEIGHTS[field]
+    return counts
+
+
+def dtype(k: int) -> np.dtype:
+    return np.dtype([("id", "<i4"), ("neighbours", "<i4", (k,)), ("scores", "<f4", (k,))])
+
+
+class Corpus:
+    """Term counts of every published article and their current neighbours."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.vocabulary: dict[str, int] = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.counts = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.neighbours = np.empty((0, k), dtype=np.int32)
+        self.scores = np.empty((0, k), dtype=np.float32)
+        # IDF of each vocabulary term, fixed when the term is first seen.
+        self.idf = np.empty(0, dtype=np.float32)
+        self.watermark = None
+        self.built_at = None
+        self.generation = 0
+
+    def vectorize(self, documents: list[Counter]) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for counts in documents:
+            indices.extend(self.vocabulary.setdefault(term, len(self.vocabulary)) for term in counts)
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(documents), len(self.vocabulary)))
+        # Sublinear TF: the tenth mention of a word adds less than the first.
+        matrix.data = 1 + np.log(matrix.data)
+        return matrix
+
+    def _idf(self, terms: np.ndarray) -> np.ndarray:
+        """IDF of the vocabulary columns ``terms`` over the current counts."""
+        n = self.counts.shape[0]
+        df = np.bincount(self.counts.indices, minlength=self.counts.shape[1])[terms]
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        idf[df > max(1, settings.related_max_df * n)] = 0
+        return idf
+
+    def weighted(self) -> sparse.csr_matrix:
+        """Rows L2-normalized TF-IDF, so a dot product is the cosine similarity."""
+        matrix = self.counts.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = sparse.diags((1 / norms).astype(np.float32)) @ matrix
+        matrix.eliminate_zeros()
+        return matrix.tocsr()
+
+    def top_k(self, matrix: sparse.csr_matrix, rows: np.ndarray):
+        """Neighbour ids and scores of ``rows``, best first, -1 padded."""
+        n = matrix.shape[0]
+        neighbours = np.full((len(rows), self.k), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), self.k), dtype=np.float32)
+        k = min(self.k, n - 1)
+        if k <= 0:
+            return neighbours, scores
+
+        transposed = matrix.T.tocsr()
+        block = max(1, settings.related_block_cells // n)
+        for start in range(0, len(rows), block):
+            part = rows[start:start + block]
+            similarity = (matrix[part] @ transposed).toarray()
+            similarity[np.arange(len(part)), part] = -1
+            top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            keep = (top_scores > 0) & (top_scores >= settings.related_min_score)
+            neighbours[start:start + len(part), :k] = np.where(keep, self.ids[top], -1)
+            scores[start:start + len(part), :k] = np.where(keep, top_scores, 0)
+        return neighbours, scores
+
+    def rebuild(self, ids: np.ndarray, documents: list[Counter]):
+        self.vocabulary = {}
+        order = np.argsort(ids)
+        self.ids = ids[order]
+        self.counts = self.vectorize([documents[i] for i in order])
+        self.idf = self._idf(np.arange(len(self.vocabulary)))
+        self.neighbours, self.scores = self.top_k(self.weighted(), np.arange(len(self.ids)))
+
+    def update(self, ids: np.ndarray, documents: list[Counter], published: np.ndarray):
+        """Replace the changed articles, drop the unpublished ones, refresh affected rows."""
+        changed = np.unique(ids)
+        stale = self.ids[~np.isin(self.ids, published) | np.isin(self.ids, changed)]
+        if not len(changed) and not len(stale):
+            return
+
+        keep = ~np.isin(self.ids, stale)
+        added = self.vectorize(documents)
+        counts = self.counts[keep]
+        counts.resize((counts.shape[0], len(self.vocabulary)))
+        merged_ids = np.concatenate([self.ids[keep], ids])
+        order = np.argsort(merged_ids, kind="stable")
+        self.ids = merged_ids[order]
+        self.counts = sparse.vstack([counts, added]).tocsr()[order]
+        # Known terms keep their IDF, so unchanged rows keep their vectors and
+        # their similarities to each other.
+        self.idf = np.concatenate([self.idf, self._idf(np.arange(len(self.idf), len(self.vocabulary)))])
+
+        old_neighbours = np.full((len(merged_ids), self.k), -1, dtype=np.int32)
+        old_scores = np.zeros((len(merged_ids), self.k), dtype=np.float32)
+        old_neighbours[:keep.sum()] = self.neighbours[keep]
+        old_scores[:keep.sum()] = self.scores[keep]
+        self.neighbours, self.scores = old_neighbours[order], old_scores[order]
+
+        matrix = self.weighted()
+        changed_rows = np.searchsorted(self.ids, changed)
+        affected = np.zeros(len(self.ids), dtype=bool)
+        affected[changed_rows] = True
+        affected |= np.isin(self.neighbours, np.union1d(changed, stale)).any(axis=1)
+        if len(changed_rows):
+            # Rows a changed article would now enter: it beats their k-th neighbour.
+            best = np.asarray((matrix[changed_rows] @ matrix.T).max(axis=0).todense()).ravel()
+            affected |= best > np.maximum(self.scores[:, -1], settings.related_min_score)
+        rows = np.flatnonzero(affected)
+        self.neighbours[rows], self.scores[rows] = self.top_k(matrix, rows)
+
+    def save(self, path: str):
+        """Write the whole corpus to ``path`` atomically, for the next worker to build from."""
+        # Vocabulary terms in column order; terms never contain NUL.
+        vocabulary = "\0".join(self.vocabulary).encode()
+        _replace(path, lambda f: np.savez(
+            f, k=self.k, generation=self.generation, built_at=self.built_at,
+            watermark=self.watermark.isoformat() if self.watermark else "",
+            vocabulary=np.frombuffer(vocabulary, dtype=np.uint8), idf=self.idf, ids=self.ids,
+            data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+            shape=np.asarray(self.counts.shape), neighbours=self.neighbours, scores=self.scores))
+
+    @classmethod
+    def load(cls, path: str) -> "Corpus":
+        with np.load(path) as stored:
+            corpus = cls(int(stored["k"]))
+            corpus.generation = int(stored["generation"])
+            corpus.built_at = float(stored["built_at"])
+            watermark = str(stored["watermark"])
+            corpus.watermark = datetime.fromisoformat(watermark) if watermark else None
+            vocabulary = stored["vocabulary"].tobytes().decode()
+            corpus.vocabulary = {term: i for i, term in enumerate(vocabulary.split("\0"))} if vocabulary else {}
+            corpus.idf = stored["idf"]
+            corpus.ids = stored["ids"]
+            corpus.counts = sparse.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]), shape=tuple(stored["shape"]))
+            corpus.neighbours = stored["neighbours"]
+            corpus.scores = stored["scores"]
+        return corpus
+
+    def records(self) -> np.ndarray:
+        out = np.empty(len(self.ids), dtype=dtype(self.k))
+        out["id"] = self.ids
+        out["neighbours"] = self.neighbours
+        out["scores"] = self.scores
+        return out
+
+
+def documents(db: Session, since=None) -> tuple[np.ndarray, list[Counter], Optional[object]]:
+    """Published articles (changed since ``since``) as term counts, and their newest updated_at."""
+    article = models.Article
+    wanted = [article.is_published == True]
+    if since is not None:
+        wanted.append(article.updated_at >= since)
+
+    assoc = models.article_topic_association
+    topics = {}
+    for article_id, title in db.execute(
+            select(assoc.c.article_id, models.Topic.title)
+            .join(models.Topic, models.Topic.id == assoc.c.topic_id)
+            .join(article, article.id == assoc.c.article_id)
+            .where(*wanted)):
+        topics.setdefault(article_id, []).append(title)
+
+    ids, docs, watermark = [], [], since
+    # Streamed, so only the term counts of the whole corpus are held at once.
+    for row in db.execute(
+            select(article.id, article.title, article.subtitle, article.content, article.updated_at,
+                   models.ArticleBody.codec, models.ArticleBody.data)
+            .outerjoin(models.ArticleBody, models.ArticleBody.article_id == article.id)
+            .where(*wanted)
+            .execution_options(yield_per=1000)):
+        body = content.decompress(row.data, row.codec) if row.data is not None else row.content
+        ids.append(row.id)
+        docs.append(terms(row.title, row.subtitle, body, topics.get(row.id, [])))
+        if watermark is None or row.updated_at > watermark:
+            watermark = row.updated_at
+    return np.asarray(ids, dtype=np.int64), docs, watermark
+
+
+def _replace(path: str, save):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(path)[1])
+    with os.fdopen(fd, "wb") as f:
+        save(f)
+    os.replace(tmp, path)
+
+
+def write(records: np.ndarray, path: str):
+    """Replace the index file atomically; readers keep their old mapping until they reload."""
+    _replace(path, lambda f: np.save(f, records))
+
+
+class Index:
+    """Read side: the memory-mapped index file, reloaded when it changes."""
+
+    def __init__(self, path: str = None):
+        self._path = path
+        self._records = None
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.related_index_path
+
+    def _load(self):
+        now = time.monotonic()
+        if now - self._checked < 1:
+            return self._records
+        with self._lock:
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._records, self._stamp = None, None
+                return None
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+            if stamp != self._stamp:
+                records = np.load(self.path, mmap_mode="r")
+                # Field views, taken once rather than on every lookup.
+                self._records = (records["id"], records["neighbours"]) if len(records) else None
+                self._stamp = stamp
+        return self._records
+
+    def related(self, article_id: int, limit: int) -> list[int]:
+        records = self._load()
+        if records is None:
+            return []
+        ids, neighbours = records
+        position = int(np.searchsorted(ids, article_id))
+        if position == len(ids) or ids[position] != article_id:
+            return []
+        neighbours = neighbours[position]
+        return neighbours[neighbours >= 0][:limit].tolist()
+
+
+index = Index()
+# The corpus this process last built or loaded.
+_corpus = None
+
+
+def corpus_path() -> str:
+    return os.path.splitext(settings.related_index_path)[0] + ".corpus.npz"
+
+
+def _latest_corpus() -> Optional[Corpus]:
+    """The last saved corpus: this process's copy if it is that one, else read from disk."""
+    path = corpus_path()
+    try:
+        with np.load(path) as stored:
+            generation = int(stored["generation"])
+        if _corpus is not None and _corpus.generation == generation:
+            return _corpus
+        return Corpus.load(path)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Could not read %s; rebuilding the related-articles index", path, exc_info=True)
+        return None
+
+
+def refresh(db: Session, full: bool = False) -> Optional[int]:
+    """Bring the index up to date; returns the number of indexed articles, or None if another worker is on it."""
+    global _corpus
+    if db.get_bind().dialect.name == "postgresql" and not db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": LOCK_KEY}).scalar():
+        return None
+
+    # Whichever worker holds the lock continues from the corpus the last
+    # builder saved, so updates stay incremental across workers.
+    corpus = _latest_corpus()
+    due = corpus is None or corpus.k != settings.related_top_k or (
+        time.time() - corpus.built_at >= settings.related_rebuild_seconds)
+    if full or due:
+        generation = corpus.generation if corpus is not None else 0
+        corpus = Corpus(settings.related_top_k)
+        ids, docs, corpus.watermark = documents(db)
+        corpus.rebuild(ids, docs)
+        corpus.built_at = time.time()
+        corpus.generation = generation
+    else:
+        ids, docs, watermark = documents(db, since=corpus.watermark)
+        published = np.fromiter(db.execute(
+            select(models.Article.id).where(models.Article.is_published == True)).scalars(), dtype=np.int64)
+        corpus.update(ids, docs, published)
+        corpus.watermark = watermark
+
+    corpus.generation += 1
+    write(corpus.records(), settings.related_index_path)
+    corpus.save(corpus_path())
+    _corpus = corpus
+    return len(corpus.ids)
+
+
+def run(full: bool = False) -> Optional[int]:
+    global _corpus
+    db = SessionLocal()
+    try:
+        return refresh(db, full)
+    except Exception:
+        # The copy in memory may be half updated; start from the saved one.
+        _corpus = None
+        logger.exception("Failed to build the related-articles index")
+        return None
+    finally:
+        # Read only; ending the transaction releases the lock.
+        db.rollback()
+        db.close()
+
+
+_stop = threading.Event()
+_wake = threading.Event()
+_thread = None
+
+
+def wake():
+    """Index new or edited articles now instead of at the next interval."""
+    _wake.set()
+
+
+def _run():
+    while not _stop.is_set():
+        run()
+        _wake.wait(settings.related_refresh_seconds)
+        _wake.clear()
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="related", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    _wake.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.related", description="Rebuild the related-articles index.")
+    parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    started = time.perf_counter()
+    count = run(full=True)
+    if count is None:
+        print("Index not built; see the log, or another worker holds the lock", file=sys.stderr)
+        return 1
+    print(f"Indexed {count} articles in {time.perf_counter() - started:.1f}s into {settings.related_index_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
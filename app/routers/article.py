@@ -1,7 +1,8 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from .. import models, schemas, oauth2
+from typing import Optional
+from fastapi import File, Query, Request, Response, UploadFile, status, HTTPException, Depends, APIRouter
+from sqlalchemy.orm import Session, joinedload, undefer
+from sqlalchemy import or_, select
+from .. import models, schemas, oauth2, utils, trending, content, conditional, cache, singleflight, comment_tree, reactions, ratelimit, fields, batch, images, related
 from ..database import get_db
 
 router = APIRouter(
@@ -10,36 +11,37 @@ router = APIRouter(
 )
 
 
-@router.post("/", response_model=schemas.ArticleOut)
+@router.post("/", response_model=schemas.ArticleOut, dependencies=[Depends(ratelimit.writes)])
 def create_article(article: schemas.ArticleCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     article_data = article.model_dump()
     article_data.pop('topics', None)  
+    article_content = article_data.pop('content')
 
     db_article = models.Article(**article_data, author_id=current_user.id)
+    content.store(db_article, article_content)
     db.add(db_article)
-    db.commit()
-    db.refresh(db_article)
+    db.flush()
 
-    topic_objects = []
-    for topic_title in article.topics:
-        topic = db.query(models.Topic).filter(
-            models.Topic.title.ilike(topic_title)
-        ).first()
+    topics = utils.resolve_topics(db, article.topics)
+    utils.set_article_topics(db, db_article.id, topics)
 
-        if not topic:
-            topic = models.Topic(title=topic_title)
-            db.add(topic)
-            db.flush()  
-        topic_objects.append(topic)
-
-    db_article.topic = topic_objects
     db.commit()
+    cache.invalidate(f"user:{current_user.id}", *(f"topic:{topic.id}" for topic in topics))
+    if db_article.is_published:
+        related.wake()
     db.refresh(db_article)
 
-    return db_article
+    return content.to_schema(db_article)
+
+def _cache_tags(db: Session, article: models.Article) -> list[str]:
+    """Tags of every cached read that lists the article: its own, its author's and its topics'."""
+    topic_ids = db.execute(select(models.article_topic_association.c.topic_id).where(
+        models.article_topic_association.c.article_id == article.id)).scalars()
+    return [f"article:{article.id}", f"user:{article.author_id}", *(f"topic:{topic_id}" for topic_id in topic_ids)]
 
-@router.get("/search", status_code=status.HTTP_200_OK, response_model=schemas.SearchOut)
-def global_search(search_string: str, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+
+@router.get("/search", status_code=status.HTTP_200_OK, response_model=schemas.SearchOut, dependencies=[Depends(ratelimit.search)])
+def global_search(search_string: str, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user), loader: batch.Loader = Depends(batch.get_loader)):
     if not search_string:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Search string cannot be empty")
@@ -63,8 +65,8 @@ def global_search(search_string: str, db: Session = Depends(get_db), current_use
     ).all()
 
     topic_articles = []
-    for topic in topics:
-        published_articles = [article for article in topic.articles if article.is_published]
+    for topic_list in loader.relationship(topics, "articles") if topics else []:
+        published_articles = [article for article in topic_list if article.is_published]
         topic_articles.extend(published_articles)
 
     all_articles = articles + topic_articles
@@ -72,29 +74,106 @@ def global_search(search_string: str, db: Session = Depends(get_db), current_use
     final_articles = list(unique_articles.values())
 
     return {
-        "articles": final_articles,
+        "articles": loader.load(final_articles, schemas.ArticleSummaryOut),
         "users": users,
-        "topics": topics
+        "topics": loader.load(topics, schemas.TopicOut)
     }
 
 
-@router.get("/user/{user_id}", response_model=list[schemas.ArticleOut])
-def get_user_articles(user_id: int, db: Session = Depends(get_db)):
-    articles = db.query(models.Article).filter(
-        models.Article.author_id == user_id).all()
-    return articles
-
-
-@router.get("/{article_id}", response_model=schemas.ArticleOut)
-def get_article(article_id: int, db: Session = Depends(get_db)):
-    article = db.query(models.Article).filter(
+@router.get("/trending", response_model=list[schemas.ArticleSummaryOut])
+def get_trending_articles(limit: int = 20, db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection), loader: batch.Loader = Depends(batch.get_loader)):
+    article_ids = trending.trending_article_ids(limit)
+    if not article_ids:
+        return []
+
+    query = db.query(models.Article)
+    if selection:
+        query = query.options(*selection.options(models.Article, schemas.ArticleSummaryOut))
+    articles = query.filter(models.Article.id.in_(article_ids)).all()
+    by_id = {article.id: article for article in articles}
+    articles = [by_id[article_id] for article_id in article_ids if article_id in by_id]
+    if selection:
+        return selection.respond(schemas.ArticleSummaryOut, articles)
+    return loader.load(articles, schemas.ArticleSummaryOut)
+
+
+@router.get("/user/{user_id}", response_model=list[schemas.ArticleSummaryOut])
+def get_user_articles(user_id: int, request: Request, response: Response, db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection), loader: batch.Loader = Depends(batch.get_loader)):
+    versions = cache.responses.snapshot([f"user:{user_id}"])
+    article_ids = db.query(models.Article.id).filter(models.Article.author_id == user_id).all()
+    versions.update(cache.responses.snapshot(f"article:{article_id}" for article_id, in article_ids))
+    conditional.check(request, response, fields.variant(cache.responses.validator("user_articles", versions), selection))
+
+    query = db.query(models.Article)
+    if selection:
+        query = query.options(*selection.options(models.Article, schemas.ArticleSummaryOut))
+    articles = query.filter(models.Article.author_id == user_id).all()
+    if selection:
+        return selection.respond(schemas.ArticleSummaryOut, articles, headers=dict(response.headers))
+    return loader.load(articles, schemas.ArticleSummaryOut)
+
+
+def _article_options(selection: Optional[fields.Selection]) -> list:
+    if selection is None:
+        return [undefer(models.Article.content), joinedload(models.Article.body)]
+    options = selection.options(models.Article, schemas.ArticleOut)
+    if "content" in selection.model(schemas.ArticleOut).model_fields:
+        options.append(joinedload(models.Article.body))
+    return options
+
+
+def _article_versions(db: Session, article_id: int) -> Optional[dict]:
+    """Versions of the tags the article's page depends on; None if there is no such article."""
+    # Tag versions are read before the rows they cover. The article's own tag
+    # comes first, since changing its topics bumps it.
+    versions = cache.responses.snapshot([f"article:{article_id}"])
+    # Tags come from the association table, so a sparse render doesn't load the topics.
+    assoc = models.article_topic_association
+    rows = db.query(models.Article.author_id, assoc.c.topic_id).outerjoin(
+        assoc, assoc.c.article_id == models.Article.id).filter(models.Article.id == article_id).all()
+    if not rows:
+        return None
+    versions.update(cache.responses.snapshot(
+        [f"user:{rows[0].author_id}", *(f"topic:{row.topic_id}" for row in rows if row.topic_id is not None)]))
+    return versions
+
+
+@singleflight.reads.coalesce("{key}")
+def _render_article(db: Session, key: str, article_id: int, validator: conditional.Validator, versions: dict, selection: Optional[fields.Selection]):
+    article = db.query(models.Article).options(*_article_options(selection)).filter(
         models.Article.id == article_id).first()
     if not article:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
-    return article
+    if selection is None:
+        batch.Loader(db).load([article], schemas.ArticleOut)
+    model = selection.model(schemas.ArticleOut) if selection else schemas.ArticleOut
+    return cache.responses.set(
+        key, content.to_schema(article, model).model_dump_json().encode(), validator, versions)
+
+
+@router.get("/{article_id}", response_model=schemas.ArticleOut)
+def get_article(article_id: int, request: Request, db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection)):
+    key = fields.cache_key(f"/articles/{article_id}", selection)
+    entry = cache.responses.get(key)
+    if entry is None:
+        versions = _article_versions(db, article_id)
+        if versions is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
+        validator = fields.variant(cache.responses.validator("article", versions), selection)
+        trending.record_view(article_id)
+        if conditional.is_fresh(request, validator):
+            raise conditional.NotModified(validator)
+
+        entry = _render_article(db=db, key=key, article_id=article_id, validator=validator, versions=versions,
+                                selection=selection)
+    else:
+        trending.record_view(article_id)
+
+    return cache.respond(request, entry)
 
-@router.patch("/{article_id}", response_model=schemas.ArticleOut)
+@router.patch("/{article_id}", response_model=schemas.ArticleOut, dependencies=[Depends(ratelimit.writes)])
 def update_article(article_id: int, article: schemas.ArticleUpdate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     db_article = db.query(models.Article).filter(
         models.Article.id == article_id, models.Article.author_id == current_user.id).first()
@@ -103,7 +182,12 @@ def update_article(article_id: int, article: schemas.ArticleUpdate, db: Session
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Article not found or you do not have permission to edit it")
 
+    # Taken before the topics are replaced, so the topics it leaves are refreshed too.
+    tags = _cache_tags(db, db_article)
     article_data = article.model_dump()
+    article_content = article_data.pop('content', None)
+    if article_content is not None:
+        content.store(db_article, article_content)
 
     if hasattr(article, 'topics') and article.topics is not None:
         article_data.pop('topics', None)
@@ -112,49 +196,127 @@ def update_article(article_id: int, article: schemas.ArticleUpdate, db: Session
             if value is not None:
                  setattr(db_article, key, value)
 
-        topic_objects = []
-        for topic_title in article.topics:
-            topic = db.query(models.Topic).filter(
-                models.Topic.title.ilike(topic_title)
-            ).first()
-
-            if not topic:
-                topic = models.Topic(title=topic_title)
-                db.add(topic)
-                db.flush()  
-            topic_objects.append(topic)
-
-        db_article.topic = topic_objects
+        topics = utils.resolve_topics(db, article.topics)
+        utils.set_article_topics(db, db_article.id, topics, replace=True)
+        tags += [f"topic:{topic.id}" for topic in topics]
     else:
         for key, value in article_data.items():
             if value is not None:  
                 setattr(db_article, key, value)
 
     db.commit()
+    # Only after the commit, or a reader could cache the old rows under the new versions.
+    cache.invalidate(*set(tags))
+    related.wake()
     db.refresh(db_article)
-    return db_article
+    return content.to_schema(db_article)
 
 
-@router.post("/{article_id}/like", status_code=status.HTTP_201_CREATED)
-def like_article(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    article = db.query(models.Article).filter(
-        models.Article.id == article_id).first()
-    if not article:
+@router.get("/{article_id}/related", response_model=list[schemas.ArticleSummaryOut])
+def get_related_articles(article_id: int, limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection), loader: batch.Loader = Depends(batch.get_loader)):
+    article_ids = related.index.related(article_id, limit)
+    if not article_ids:
+        return []
+
+    query = db.query(models.Article)
+    if selection:
+        query = query.options(*selection.options(models.Article, schemas.ArticleSummaryOut))
+    articles = query.filter(models.Article.id.in_(article_ids), models.Article.is_published == True).all()
+    by_id = {article.id: article for article in articles}
+    articles = [by_id[related_id] for related_id in article_ids if related_id in by_id]
+    if selection:
+        return selection.respond(schemas.ArticleSummaryOut, articles)
+    return loader.load(articles, schemas.ArticleSummaryOut)
+
+
+@router.put("/{article_id}/cover_image", response_model=schemas.ArticleOut, dependencies=[Depends(ratelimit.writes)])
+def upload_cover_image(article_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    db_article = db.query(models.Article).filter(
+        models.Article.id == article_id, models.Article.author_id == current_user.id).first()
+    if not db_article:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
+            status_code=status.HTTP_404_NOT_FOUND, detail="Article not found or you do not have permission to edit it")
+
+    db_article.cover_image = images.save_upload(file)
+    tags = _cache_tags(db, db_article)
+    db.commit()
+    cache.invalidate(*tags)
+    db.refresh(db_article)
+    return content.to_schema(db_article)
+
 
-    if current_user in article.liked_by:
-        article.liked_by.remove(current_user)
-        db.commit()
-        db.refresh(article)
-        return {"message": "Article unliked successfully"}
+def _set_like(db: Session, article_id: int, user_id: int, liked: bool) -> dict:
+    if liked:
+        result = reactions.add(db, "like", article_id, user_id)
     else:
-        article.liked_by.append(current_user)
-        db.commit()
-        db.refresh(article)
+        result = reactions.remove(db, "like", article_id, user_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
+
+    likes_count, changed = result
+    if changed:
+        trending.record(db, article_id, "likes", 1 if liked else -1)
+    db.commit()
+    if changed:
+        cache.invalidate(f"article:{article_id}", f"user:{user_id}")
+    return {"liked": liked, "likes_count": likes_count}
+
+
+@router.put("/{article_id}/like", response_model=schemas.LikeOut, dependencies=[Depends(ratelimit.writes)])
+def like_article_idempotent(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    return _set_like(db, article_id, current_user.id, True)
+
+
+@router.delete("/{article_id}/like", response_model=schemas.LikeOut, dependencies=[Depends(ratelimit.writes)])
+def unlike_article(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    return _set_like(db, article_id, current_user.id, False)
+
+
+@router.post("/{article_id}/like", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.writes)])
+def like_article(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    # Toggle kept for existing clients; new clients should use PUT/DELETE.
+    liked = not reactions.has(db, "like", article_id, current_user.id)
+    _set_like(db, article_id, current_user.id, liked)
+    if liked:
         return {"message": "Article liked successfully"}
+    return {"message": "Article unliked successfully"}
+
+@router.get("/{article_id}/comments", response_model=schemas.CommentPage)
+def get_article_comments(
+    article_id: int,
+    cursor: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    reply_limit: int = Query(3, ge=0, le=50),
+    depth: int = Query(3, ge=0, le=10),
+    db: Session = Depends(get_db)
+):
+    if not db.query(models.Article.id).filter(models.Article.id == article_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
+
+    return comment_tree.load_page(db, article_id, None, cursor, limit, reply_limit, depth)
+
+
+@router.get("/{article_id}/comments/{comment_id}/replies", response_model=schemas.CommentPage)
+def get_comment_replies(
+    article_id: int,
+    comment_id: int,
+    cursor: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    reply_limit: int = Query(3, ge=0, le=50),
+    depth: int = Query(2, ge=0, le=10),
+    db: Session = Depends(get_db)
+):
+    parent_comment = db.query(models.Comment.id).filter(
+        models.Comment.id == comment_id, models.Comment.article_id == article_id).first()
+    if not parent_comment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+
+    return comment_tree.load_page(db, article_id, comment_id, cursor, limit, reply_limit, depth)
 
-@router.post("/{article_id}/comment", status_code=status.HTTP_201_CREATED)
+@router.post("/{article_id}/comment", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.comments)])
 def comment_on_article(article_id: int, comment: schemas.CommentCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     article = db.query(models.Article).filter(
         models.Article.id == article_id).first()
@@ -165,12 +327,14 @@ def comment_on_article(article_id: int, comment: schemas.CommentCreate, db: Sess
     new_comment = models.Comment(
         **comment.model_dump(), article_id=article.id, user_id=current_user.id)
     db.add(new_comment)
+    trending.record(db, article.id, "comments")
     db.commit()
+    cache.invalidate(f"article:{article_id}")
     db.refresh(new_comment)
     return new_comment
 
 
-@router.post("/{article_id}/comment/{comment_id}/reply", status_code=status.HTTP_201_CREATED)
+@router.post("/{article_id}/comment/{comment_id}/reply", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.comments)])
 def reply_to_comment(article_id: int, comment_id: int, reply: schemas.CommentCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     article = db.query(models.Article).filter(
         models.Article.id == article_id).first()
@@ -187,7 +351,9 @@ def reply_to_comment(article_id: int, comment_id: int, reply: schemas.CommentCre
     new_reply = models.Comment(**reply.model_dump(), article_id=article.id,
                                user_id=current_user.id, parent_id=parent_comment.id)
     db.add(new_reply)
+    trending.record(db, article.id, "comments")
     db.commit()
+    cache.invalidate(f"article:{article_id}")
     db.refresh(new_reply)
     return new_reply
 
@@ -2,7 +2,7 @@ from fastapi import status, HTTPException, Depends, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from .. import utils
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, ratelimit
 from ..database import get_db
 
 router = APIRouter(
@@ -10,7 +10,7 @@ router = APIRouter(
     tags=["auth"]
 )
 
-@router.post("/login", response_model=schemas.Token)
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(ratelimit.login)])
 def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(
         models.User.email == user_credentials.username).first()
@@ -1,6 +1,7 @@
+from typing import Optional
 from fastapi import status, HTTPException, Depends, APIRouter
 from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, trending, cache, reactions, ratelimit, fields, batch
 from ..database import get_db
 
 router = APIRouter(
@@ -8,27 +9,49 @@ router = APIRouter(
     tags=["bookmarks"]
 )
 
-@router.get("/", response_model=list[schemas.ArticleOut])
+@router.get("/", response_model=list[schemas.ArticleSummaryOut])
 def get_bookmarked_articles(db: Session = Depends(get_db), current_user: int = Depends
-(oauth2.get_current_user)):
+(oauth2.get_current_user), selection: Optional[fields.Selection] = Depends(fields.selection),
+loader: batch.Loader = Depends(batch.get_loader)):
     
-    articles = db.query(models.Article).filter(models.Article.bookmarked_by.any(id=current_user.id)).all()
-    return articles
+    query = db.query(models.Article)
+    if selection:
+        query = query.options(*selection.options(models.Article, schemas.ArticleSummaryOut))
+    articles = query.filter(models.Article.bookmarked_by.any(id=current_user.id)).all()
+    if selection:
+        return selection.respond(schemas.ArticleSummaryOut, articles)
+    return loader.load(articles, schemas.ArticleSummaryOut)
 
-@router.post("/{article_id}", status_code=status.HTTP_201_CREATED)
-def bookmark_article(article_id: int, db: Session = Depends(get_db), current_user:
-int = Depends(oauth2.get_current_user)):
-    article = db.query(models.Article).filter(models.Article.id == article_id).first()
-    if not article:
+def _set_bookmark(db: Session, article_id: int, user_id: int, bookmarked: bool) -> dict:
+    if bookmarked:
+        result = reactions.add(db, "bookmark", article_id, user_id)
+    else:
+        result = reactions.remove(db, "bookmark", article_id, user_id)
+    if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Article not found")
 
-    if current_user in article.bookmarked_by:
-        article.bookmarked_by.remove(current_user)
-        db.commit()
-        db.refresh(article)
-        return {"message": "Article removed from bookmarks"}
-
-    article.bookmarked_by.append(current_user)
+    bookmarks_count, changed = result
+    if changed:
+        trending.record(db, article_id, "bookmarks", 1 if bookmarked else -1)
     db.commit()
-    db.refresh(article)
-    return {"message": "Article bookmarked successfully"}
\ No newline at end of file
+    if changed:
+        cache.invalidate(f"article:{article_id}", f"user:{user_id}")
+    return {"bookmarked": bookmarked, "bookmarks_count": bookmarks_count}
+
+@router.put("/{article_id}", response_model=schemas.BookmarkOut, dependencies=[Depends(ratelimit.writes)])
+def add_bookmark(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    return _set_bookmark(db, article_id, current_user.id, True)
+
+@router.delete("/{article_id}", response_model=schemas.BookmarkOut, dependencies=[Depends(ratelimit.writes)])
+def remove_bookmark(article_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    return _set_bookmark(db, article_id, current_user.id, False)
+
+@router.post("/{article_id}", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.writes)])
+def bookmark_article(article_id: int, db: Session = Depends(get_db), current_user:
+int = Depends(oauth2.get_current_user)):
+    # Toggle kept for existing clients; new clients should use PUT/DELETE.
+    bookmarked = not reactions.has(db, "bookmark", article_id, current_user.id)
+    _set_bookmark(db, article_id, current_user.id, bookmarked)
+    if bookmarked:
+        return {"message": "Article bookmarked successfully"}
+    return {"message": "Article removed from bookmarks"}
@@ -0,0 +1,100 @@
+from typing import Optional
+
+import orjson
+from fastapi import Depends, APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_, select
+
+from .. import models, oauth2, content
+from ..database import SessionLocal
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"]
+)
+
+# Rows fetched per server-side cursor round trip.
+BATCH_SIZE = 1000
+
+
+def _stream(stmt, transform=None):
+    # The request's session is closed before the body is streamed, so the
+    # export holds its own session (and server-side cursor) for its lifetime.
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=BATCH_SIZE))
+        for partition in result.mappings().partitions():
+            chunk = bytearray()
+            for row in partition:
+                row = transform(row) if transform else dict(row)
+                chunk += orjson.dumps(row)
+                chunk += b"\n"
+            yield bytes(chunk)
+
+
+def _ndjson(stmt, transform=None) -> StreamingResponse:
+    return StreamingResponse(_stream(stmt, transform), media_type="application/x-ndjson")
+
+
+@router.get("/users")
+def export_users(after_id: int = 0, current_user: int = Depends(oauth2.get_current_user)):
+    stmt = select(
+        models.User.id,
+        models.User.email,
+        models.User.username,
+        models.User.first_name,
+        models.User.last_name,
+        models.User.profile_image,
+        models.User.bio,
+        models.User.created_at,
+    ).where(models.User.id > after_id).order_by(models.User.id)
+    return _ndjson(stmt)
+
+
+def _article_row(row) -> dict:
+    row = dict(row)
+    codec, data = row.pop("codec"), row.pop("data")
+    if codec is not None:
+        row["content"] = content.decompress(data, codec)
+    return row
+
+
+@router.get("/articles")
+def export_articles(user_id: Optional[int] = None, after_id: int = 0, current_user: int = Depends(oauth2.get_current_user)):
+    user_id = user_id or current_user.id
+    stmt = select(
+        models.Article.id,
+        models.Article.author_id,
+        models.Article.title,
+        models.Article.subtitle,
+        models.Article.content,
+        models.Article.cover_image,
+        models.Article.reading_time,
+        models.Article.is_published,
+        models.Article.views_count,
+        models.Article.created_at,
+        models.Article.updated_at,
+        models.ArticleBody.codec,
+        models.ArticleBody.data,
+    ).outerjoin(models.ArticleBody).where(
+        models.Article.author_id == user_id,
+        models.Article.id > after_id,
+    ).order_by(models.Article.id)
+    if user_id != current_user.id:
+        stmt = stmt.where(models.Article.is_published == True)
+    return _ndjson(stmt, _article_row)
+
+
+@router.get("/messages")
+def export_messages(after_id: int = 0, current_user: int = Depends(oauth2.get_current_user)):
+    stmt = select(
+        models.Message.id,
+        models.Message.sender_id,
+        models.Message.receiver_id,
+        models.Message.content,
+        models.Message.is_read,
+        models.Message.created_at,
+    ).where(
+        or_(models.Message.sender_id == current_user.id, models.Message.receiver_id == current_user.id),
+        models.Message.id > after_id,
+    ).order_by(models.Message.id)
+    return _ndjson(stmt)
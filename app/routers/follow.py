@@ -1,6 +1,6 @@
 from fastapi import Response, status, HTTPException, Depends, APIRouter
 from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, cache, ratelimit
 from ..database import get_db
 
 router = APIRouter(
@@ -8,7 +8,7 @@ router = APIRouter(
     tags=["follow"]
 )
 
-@router.post("/users/{user_id}", status_code=status.HTTP_201_CREATED)
+@router.post("/users/{user_id}", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.writes)])
 def follow_user(
     user_id: int, 
     db: Session = Depends(get_db), 
@@ -24,13 +24,15 @@ def follow_user(
     if current_user in target_user.followers:
             target_user.followers.remove(current_user)
             db.commit()
+            cache.invalidate(f"user:{user_id}", f"user:{current_user.id}")
             return {"message": f"You are not following {target_user.username}"}
     else: 
         target_user.followers.append(current_user)
         db.commit()
+        cache.invalidate(f"user:{user_id}", f"user:{current_user.id}")
         return {"message": f"You are now following {target_user.username}"}
 
-@router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(ratelimit.writes)])
 def unfollow_user(
     user_id: int, 
     db: Session = Depends(get_db), 
@@ -45,6 +47,7 @@ def unfollow_user(
     
     target_user.followers.remove(current_user)
     db.commit()
+    cache.invalidate(f"user:{user_id}", f"user:{current_user.id}")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/users/{user_id}/followers", response_model=list[schemas.UserOut])
@@ -0,0 +1,36 @@
+import asyncio
+
+from fastapi import HTTPException, APIRouter, status
+from fastapi.responses import FileResponse, Response
+
+from .. import images
+from ..config import settings
+
+router = APIRouter(
+    prefix="/media",
+    tags=["media"]
+)
+
+# Keys are content hashes, so a URL never changes meaning.
+IMMUTABLE = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+
+@router.get("/{key}/{filename}")
+async def get_image(key: str, filename: str):
+    variant, _, extension = filename.partition(".")
+    if not images.is_key(key) or variant not in images.VARIANTS or extension != "webp":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    store = images.storage()
+    name = images.variant_name(key, variant)
+    if not store.exists(name):
+        if not store.exists(images.original_name(key)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+        # Not rendered yet (the upload's task is still queued): render just this one.
+        await asyncio.wrap_future(images.pool().submit(
+            images.make_variants, store, key, (variant,), settings.image_quality))
+
+    path = store.path(name)
+    if path is not None:
+        return FileResponse(path, media_type="image/webp", headers=IMMUTABLE)
+    return Response(store.get(name), media_type="image/webp", headers=IMMUTABLE)
@@ -1,6 +1,10 @@
-from fastapi import status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Query, status, HTTPException, Depends, APIRouter
+from sqlalchemy import and_, or_, select, union_all
+from sqlalchemy.orm import Session, aliased
+from .. import models, schemas, oauth2, ratelimit
 from ..database import get_db
 
 router = APIRouter(
@@ -8,23 +12,61 @@ router = APIRouter(
     tags=["messages"]
 )
 
+
+def _latest(db: Session, conditions: list, before: Optional[datetime], before_id: Optional[int], limit: int):
+    """Newest messages matching any of ``conditions``, before the (created_at, id) cursor.
+
+    Each condition gets its own ordered, limited scan of a (user, created_at)
+    index, so the planner reads only the newest partitions and stops after
+    ``limit`` rows. One OR over both columns would have to read and sort every
+    message the user ever exchanged.
+    """
+    Message = models.Message
+    bounds = []
+    if before is not None:
+        # A plain bound on the partition key prunes later partitions at plan time.
+        bounds.append(Message.created_at <= before)
+        bounds.append(Message.created_at < before if before_id is None else
+                      or_(Message.created_at < before, and_(Message.created_at == before, Message.id < before_id)))
+    parts = [
+        select(
+            select(Message).where(condition, *bounds)
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).subquery()
+        )
+        for condition in conditions
+    ]
+    messages = aliased(Message, union_all(*parts).subquery())
+    return db.query(messages).order_by(messages.created_at.desc(), messages.id.desc()).limit(limit).all()
+
+
 @router.get("/", response_model=list[schemas.MessageOut])
-def get_user_messages (db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    messages = db.query(models.Message).filter(
-        (models.Message.sender_id == current_user.id) | 
-        (models.Message.receiver_id == current_user.id)
-    ).all()
-    return messages
+def get_user_messages (
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user)
+):
+    return _latest(db, [
+        models.Message.sender_id == current_user.id,
+        models.Message.receiver_id == current_user.id,
+    ], before, before_id, limit)
 
 @router.get("/{user_id}", response_model=list[schemas.MessageOut])
-def get_messages_with_user(user_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    messages = db.query(models.Message).filter(
-        ((models.Message.sender_id == current_user.id) & (models.Message.receiver_id == user_id)) |
-         ((models.Message.sender_id == user_id) & (models.Message.receiver_id == current_user.id))
-    ).all()
-    return messages
-
-@router.post("/{user_id}", response_model=schemas.MessageOut)
+def get_messages_with_user(
+    user_id: int,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user)
+):
+    return _latest(db, [
+        (models.Message.sender_id == current_user.id) & (models.Message.receiver_id == user_id),
+        (models.Message.sender_id == user_id) & (models.Message.receiver_id == current_user.id),
+    ], before, before_id, limit)
+
+@router.post("/{user_id}", response_model=schemas.MessageOut, dependencies=[Depends(ratelimit.messages)])
 def send_message(user_id: int, message: schemas.MessageCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot send a message to yourself")
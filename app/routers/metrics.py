@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from .. import metrics
+
+router = APIRouter(
+    tags=['Metrics']
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    # Sync, so compact()'s file lock and reads run in the threadpool, not on the event loop.
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
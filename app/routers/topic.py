@@ -1,6 +1,8 @@
-from fastapi import status, HTTPException, Depends, APIRouter
+from typing import Optional
+from fastapi import Request, status, HTTPException, Depends, APIRouter
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, utils, trending, conditional, cache, singleflight, ratelimit, fields, batch
 from ..database import get_db
 
 router = APIRouter(
@@ -9,18 +11,68 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=list[schemas.TopicOut])
-def get_all_topics(db: Session = Depends(get_db)):
+def get_all_topics(db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection), loader: batch.Loader = Depends(batch.get_loader)):
+    if selection:
+        topics = db.query(models.Topic).options(*selection.options(models.Topic, schemas.TopicOut)).all()
+        return selection.respond(schemas.TopicOut, topics)
     topics = db.query(models.Topic).all()
-    return topics
+    return loader.load(topics, schemas.TopicOut)
 
-@router.get("/{topic_title}", response_model=schemas.TopicOut)
-def get_topic_by_title(topic_title: str, db: Session = Depends(get_db)):
-    topic = db.query(models.Topic).filter(models.Topic.title.ilike(topic_title)).first()
+@router.get("/trending", response_model=list[schemas.Topic])
+def get_trending_topics(limit: int = 20, db: Session = Depends(get_db), loader: batch.Loader = Depends(batch.get_loader)):
+    topic_ids = trending.trending_topic_ids(limit)
+    if not topic_ids:
+        return []
+
+    topics = db.query(models.Topic).filter(models.Topic.id.in_(topic_ids)).all()
+    by_id = {topic.id: topic for topic in topics}
+    return loader.load([by_id[topic_id] for topic_id in topic_ids if topic_id in by_id], schemas.Topic)
+
+def _topic_versions(db: Session, topic_key: str) -> Optional[tuple[int, dict]]:
+    """The topic's id and the versions of the tags its page depends on; None if there is no such topic."""
+    topic_id = db.query(models.Topic.id).filter(func.lower(models.Topic.title) == topic_key).scalar()
+    if topic_id is None:
+        return None
+    # Tag versions are read before the rows they cover, the topic's own first.
+    versions = cache.responses.snapshot([f"topic:{topic_id}"])
+    article_ids = db.query(models.article_topic_association.c.article_id).filter(
+        models.article_topic_association.c.topic_id == topic_id).all()
+    versions.update(cache.responses.snapshot(f"article:{article_id}" for article_id, in article_ids))
+    return topic_id, versions
+
+@singleflight.reads.coalesce("{key}")
+def _render_topic(db: Session, key: str, topic_id: int, validator: conditional.Validator, versions: dict, selection: Optional[fields.Selection]):
+    query = db.query(models.Topic)
+    if selection:
+        query = query.options(*selection.options(models.Topic, schemas.TopicOut))
+    topic = query.filter(models.Topic.id == topic_id).first()
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return topic
+    if selection is None:
+        batch.Loader(db).load([topic], schemas.TopicOut)
+    model = selection.model(schemas.TopicOut) if selection else schemas.TopicOut
+    return cache.responses.set(key, model.model_validate(topic).model_dump_json().encode(), validator, versions)
+
+@router.get("/{topic_title}", response_model=schemas.TopicOut)
+def get_topic_by_title(topic_title: str, request: Request, db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection)):
+    topic_key = utils.normalize_topic_title(topic_title).lower()
+    key = fields.cache_key(f"/topics/{topic_key}", selection)
+    entry = cache.responses.get(key)
+    if entry is None:
+        found = _topic_versions(db, topic_key)
+        if found is None:
+            raise HTTPException(status_code=404, detail="Topic not found")
+        topic_id, versions = found
+        validator = fields.variant(cache.responses.validator("topic", versions), selection)
+        if conditional.is_fresh(request, validator):
+            raise conditional.NotModified(validator)
+
+        entry = _render_topic(db=db, key=key, topic_id=topic_id, validator=validator, versions=versions,
+                              selection=selection)
+
+    return cache.respond(request, entry)
 
-@router.post("/", response_model=schemas.TopicOut)
+@router.post("/", response_model=schemas.TopicOut, dependencies=[Depends(ratelimit.writes)])
 def create_topic(topic: schemas.SingleTopic, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     user_query = db.query(models.User).filter(
     models.User.id == current_user.id)
@@ -30,20 +82,25 @@ def create_topic(topic: schemas.SingleTopic, db: Session = Depends(get_db), curr
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
-    topic_query = db.query(models.Topic).filter(models.Topic.title.ilike(f"%{topic.topic}%"))
+    title = utils.normalize_topic_title(topic.topic)
+    if not title:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Topic title cannot be empty")
+
+    topic_query = db.query(models.Topic).filter(func.lower(models.Topic.title) == title.lower())
     existing_topic = topic_query.first()
     if existing_topic:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Topic already exist")
 
 
-    new_topic = models.Topic(title=topic.topic)
+    new_topic = models.Topic(title=title)
     db.add(new_topic)
     db.commit()
     db.refresh(new_topic)
     return new_topic
 
-@router.post("/follow/{topic_id}", status_code=status.HTTP_201_CREATED)
+@router.post("/follow/{topic_id}", status_code=status.HTTP_201_CREATED, dependencies=[Depends(ratelimit.writes)])
 def topic_following(topic_id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     existing_topic = db.query(models.Topic).filter(models.Topic.id == topic_id).first()
     if not existing_topic:
@@ -53,10 +110,12 @@ def topic_following(topic_id: int, db: Session = Depends(get_db), current_user:
     if current_user in existing_topic.interested_users:
         existing_topic.interested_users.remove(current_user)
         db.commit()
+        cache.invalidate(f"topic:{topic_id}", f"user:{current_user.id}")
         message = f"Unfollowed topic '{existing_topic.title}'"
     else:
         existing_topic.interested_users.append(current_user)
         db.commit()
+        cache.invalidate(f"topic:{topic_id}", f"user:{current_user.id}")
         message = f"Following topic '{existing_topic.title}'"
 
     return {"message": message}
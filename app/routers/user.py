@@ -1,8 +1,11 @@
-from fastapi import Response, status, HTTPException, Depends, APIRouter
+from typing import Optional
+
+from fastapi import File, Query, Request, Response, UploadFile, status, HTTPException, Depends, APIRouter
 from sqlalchemy.orm import Session
 
 from .. import utils
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, conditional, cache, singleflight, ratelimit, fields, batch, images, purge, presence, ranking
+from ..config import settings
 from ..database import get_db
 
 router = APIRouter(
@@ -11,10 +14,10 @@ router = APIRouter(
 )
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.AuthUserOut)
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.AuthUserOut, dependencies=[Depends(ratelimit.signup)])
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     existing_user = db.query(models.User).filter(
-        models.User.email == user.email).first()
+        models.User.email == user.email).execution_options(include_inactive=True).first()
 
     if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,7 +51,7 @@ def get_all_users(db: Session = Depends(get_db)):
     return users
 
 
-@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(ratelimit.writes)])
 def delete_user(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
     user = db.query(models.User).filter(
         models.User.id == current_user.id).first()
@@ -56,13 +59,17 @@ def delete_user(db: Session = Depends(get_db), current_user: int = Depends(oauth
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    db.delete(user)
+    # The rows go in the background (app.purge); hiding the account is immediate.
+    tags = purge.affected_tags(db, user.id)
+    purge.deactivate(db, user)
     db.commit()
+    cache.invalidate(*tags)
+    purge.wake()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.put("/", response_model=schemas.UserOut, status_code=status.HTTP_200_OK)
+@router.put("/", response_model=schemas.UserOut, status_code=status.HTTP_200_OK, dependencies=[Depends(ratelimit.writes)])
 def update_user(user: schemas.UserUpdate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
 
     user_query = db.query(models.User).filter(
@@ -83,11 +90,21 @@ def update_user(user: schemas.UserUpdate, db: Session = Depends(get_db), current
     if update_data:
         user_query.update(update_data, synchronize_session=False)
         db.commit()
+        cache.invalidate(f"user:{current_user.id}")
 
     return user_query.first()
 
 
-@router.put("/add_topics", response_model=schemas.UserOut, status_code=status.HTTP_200_OK)
+@router.put("/profile_image", response_model=schemas.UserOut, dependencies=[Depends(ratelimit.writes)])
+def upload_profile_image(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+    current_user.profile_image = images.save_upload(file)
+    db.commit()
+    cache.invalidate(f"user:{current_user.id}")
+    db.refresh(current_user)
+    return current_user
+
+
+@router.put("/add_topics", response_model=schemas.UserOut, status_code=status.HTTP_200_OK, dependencies=[Depends(ratelimit.writes)])
 def update_user_topics(
     topics_data: schemas.TopicCreate,
     db: Session = Depends(get_db),
@@ -101,36 +118,44 @@ def update_user_topics(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
-    existing_titles = {t.title.lower() for t in user.interested_topics}
-    new_topics = []
-    for topic in topics_data.topics:
-        if topic.lower() not in existing_titles:
-            existing_topic = db.query(models.Topic).filter(
-                models.Topic.title.ilike(topic)).first()
-            if not existing_topic:
-                existing_topic = models.Topic(title=topic)
-                db.add(existing_topic)
-                db.flush()  
-            new_topics.append(existing_topic)
-    user.interested_topics.extend(new_topics)
+    topics = utils.resolve_topics(db, topics_data.topics)
+    if topics:
+        db.execute(
+            utils.insert(db, models.user_topic_association)
+            .values([{"user_id": user.id, "topic_id": topic.id} for topic in topics])
+            .on_conflict_do_nothing()
+        )
 
     db.commit()
+    cache.invalidate(f"user:{current_user.id}", *(f"topic:{topic.id}" for topic in topics))
     db.refresh(user)
     return user
 
 
-@router.get("/feeds", response_model=list[schemas.ArticleOut])
+@router.get("/feeds", response_model=list[schemas.ArticleSummaryOut])
 def get_user_feeds(
-    current_user: int = Depends(oauth2.get_current_user)
+    order: str = Query("latest", pattern="^(latest|ranked)$", description="latest, or ranked for the personalized order"),
+    limit: int = Query(50, ge=1, le=200, description="Page size of the ranked feed"),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+    loader: batch.Loader = Depends(batch.get_loader)
 ):
-    
+    if order == "ranked":
+        article_ids = ranking.ranked_ids(db, current_user.id, limit)
+        articles = db.query(models.Article).filter(models.Article.id.in_(article_ids)).all()
+        by_id = {article.id: article for article in articles}
+        return loader.load([by_id[article_id] for article_id in article_ids if article_id in by_id],
+                           schemas.ArticleSummaryOut)
+
+    topics, = loader.relationship([current_user], "interested_topics")
+    following, = loader.relationship([current_user], "following")
     feeds = []
-    for topic in current_user.interested_topics:
-        published_articles = [article for article in topic.articles if article.is_published]
+    for articles in loader.relationship(topics, "articles") if topics else []:
+        published_articles = [article for article in articles if article.is_published]
         feeds.extend(published_articles)
         
-    for followed_user in current_user.following:
-        published_articles = [article for article in followed_user.articles if article.is_published]
+    for articles in loader.relationship(following, "articles") if following else []:
+        published_articles = [article for article in articles if article.is_published]
         feeds.extend(published_articles)
 
     current_user_articles = [article for article in current_user.articles if article.is_published]
@@ -139,20 +164,28 @@ def get_user_feeds(
     feeds = list(set(feeds))
     feeds.sort(key=lambda x: x.created_at, reverse=True)
 
-    return feeds
+    return loader.load(feeds, schemas.ArticleSummaryOut)
 
 @router.get("/dashboard", response_model=schemas.UserDashboard)
 def get_user_dashboard(
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    current_user: int = Depends(oauth2.get_current_user),
+    selection: Optional[fields.Selection] = Depends(fields.selection),
+    loader: batch.Loader = Depends(batch.get_loader)
 ):
-    user = db.query(models.User).filter(
-        models.User.id == current_user.id).first()
+    query = db.query(models.User)
+    if selection:
+        # current_user is already in the session; populate_existing applies the options to it.
+        query = query.options(*selection.options(models.User, schemas.UserDashboard)).populate_existing()
+    user = query.filter(models.User.id == current_user.id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
+    if selection:
+        return selection.respond(schemas.UserDashboard, user)
+    loader.load([user], schemas.UserDashboard)
     return user
 
 
@@ -161,20 +194,76 @@ def check_username_availability(
     username: str,
     db: Session = Depends(get_db)
 ):
-    user = db.query(models.User).filter(
-        models.User.username == username).first()
-    if user:
+    # Deactivated accounts keep their usernames until purged.
+    if utils.is_username_taken(db, username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken"
         )
     
     return {"username": username, "available": True}
 
-@router.get("/{username}", response_model=schemas.UserDashboard)
-def get_user(username: str, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == username).first()
+
+@router.get("/presence", response_model=list[schemas.PresenceOut])
+def get_presence(
+    ids: str = Query(..., description="Comma-separated user ids."),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    try:
+        user_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be comma-separated integers")
+    if len(user_ids) > settings.presence_max_ids:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {settings.presence_max_ids} ids per request")
+
+    seen = presence.last_seen(db, user_ids)
+    return [{"user_id": user_id, "online": presence.is_online(seen.get(user_id)), "last_seen": seen.get(user_id)}
+            for user_id in user_ids]
+
+def _user_versions(db: Session, username: str) -> Optional[tuple[int, dict]]:
+    """The user's id and the versions of the tags their page depends on; None if there is no such user."""
+    user_id = db.query(models.User.id).filter(models.User.username == username).scalar()
+    if user_id is None:
+        return None
+    # Tag versions are read before the rows they cover, the user's own first.
+    versions = cache.responses.snapshot([f"user:{user_id}"])
+    article_ids = db.query(models.Article.id).filter(models.Article.author_id == user_id).all()
+    versions.update(cache.responses.snapshot(f"article:{article_id}" for article_id, in article_ids))
+    return user_id, versions
+
+
+@singleflight.reads.coalesce("{key}")
+def _render_user(db: Session, key: str, user_id: int, username: str, validator: conditional.Validator, versions: dict, selection: Optional[fields.Selection]):
+    query = db.query(models.User)
+    if selection:
+        query = query.options(*selection.options(models.User, schemas.UserDashboard))
+    # Still matching the username, in case it changed after the lookup.
+    user = query.filter(models.User.id == user_id, models.User.username == username).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return user 
+    if selection is None:
+        batch.Loader(db).load([user], schemas.UserDashboard)
+    model = selection.model(schemas.UserDashboard) if selection else schemas.UserDashboard
+    return cache.responses.set(key, model.model_validate(user).model_dump_json().encode(), validator, versions)
 
+
+@router.get("/{username}", response_model=schemas.UserDashboard)
+def get_user(username: str, request: Request, db: Session = Depends(get_db), selection: Optional[fields.Selection] = Depends(fields.selection)):
+    key = fields.cache_key(f"/users/{username}", selection)
+    entry = cache.responses.get(key)
+    if entry is None:
+        found = _user_versions(db, username)
+        if found is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        user_id, versions = found
+        validator = fields.variant(cache.responses.validator("user", versions), selection)
+        if conditional.is_fresh(request, validator):
+            raise conditional.NotModified(validator)
+
+        entry = _render_user(db=db, key=key, user_id=user_id, username=username, validator=validator,
+                             versions=versions, selection=selection)
+
+    return cache.respond(request, entry)
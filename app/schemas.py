@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, computed_field
 from datetime import datetime
 from typing import Optional
 
+from . import images
+
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -32,6 +34,12 @@ class UserOut(UserBase):
     username: str
     first_name: Optional[str] = None
     last_name: Optional[str] = None
+
+    @computed_field
+    @property
+    def profile_image_urls(self) -> Optional[dict[str, str]]:
+        return images.urls(self.profile_image)
+
     class Config:
         from_attributes = True
 class AuthUserOut(UserBase):
@@ -70,6 +78,19 @@ class CommentOut(CommentBase):
     class Config:
         from_attributes = True
 
+class CommentNode(CommentBase):
+    id: int
+    user: UserOut
+    parent_id: Optional[int] = None
+    created_at: datetime
+    reply_count: int = 0
+    replies: list["CommentNode"] = []
+    replies_cursor: Optional[int] = None
+
+class CommentPage(BaseModel):
+    comments: list[CommentNode] = []
+    next_cursor: Optional[int] = None
+
 class ArticleBase(BaseModel):
     title: str
     content: str
@@ -95,17 +116,43 @@ class Topic(TopicBase):
     class Config:
         from_attributes = True
 
-class ArticleOut(ArticleBase):
+class ArticleSummaryOut(BaseModel):
     id: int
+    title: str
+    excerpt: Optional[str] = None
+    cover_image: Optional[str] = None
+    reading_time: Optional[int] = None
+    is_published: bool = False
     created_at: datetime
     updated_at: datetime
     comments: list[CommentOut] = []
     views_count: int = 0
+    likes_count: int = 0
+    bookmarks_count: int = 0
     author: UserOut
     bookmarked_by: list[UserOut] = []
     liked_by: list[UserOut] = []
     topic: list[Topic] = []
 
+    @computed_field
+    @property
+    def cover_image_urls(self) -> Optional[dict[str, str]]:
+        return images.urls(self.cover_image)
+
+    class Config:
+        from_attributes = True
+
+class LikeOut(BaseModel):
+    liked: bool
+    likes_count: int
+
+class BookmarkOut(BaseModel):
+    bookmarked: bool
+    bookmarks_count: int
+
+class ArticleOut(ArticleSummaryOut):
+    content: str
+
     class Config:
         from_attributes = True
 
@@ -113,7 +160,7 @@ class TopicOut(TopicBase):
     id: int
     created_at: datetime
     interested_users: list[UserOut] = []
-    articles: list[ArticleOut] = []
+    articles: list[ArticleSummaryOut] = []
     class Config:
         from_attributes = True
 
@@ -123,7 +170,7 @@ class UserDashboard(BaseModel):
     email: EmailStr
     username: str
     topics: list[TopicOut] = []
-    articles: list[ArticleOut] = []
+    articles: list[ArticleSummaryOut] = []
     followers: list[UserOut] = []
     following: list[UserOut] = []
     twitter_url: Optional[str] = None
@@ -136,8 +183,13 @@ class UserDashboard(BaseModel):
     profile_image: Optional[str] = None
     interested_topics: list[TopicOut] = []
     bio: Optional[str] = None
-    bookmarked_articles: list[ArticleOut] = []
-    liked_articles: list[ArticleOut] = []
+    bookmarked_articles: list[ArticleSummaryOut] = []
+    liked_articles: list[ArticleSummaryOut] = []
+
+    @computed_field
+    @property
+    def profile_image_urls(self) -> Optional[dict[str, str]]:
+        return images.urls(self.profile_image)
 
     class Config:
         from_attributes = True
@@ -156,6 +208,11 @@ class MessageOut(MessageBase):
     class Config:
         from_attributes = True
 
+class PresenceOut(BaseModel):
+    user_id: int
+    online: bool
+    last_seen: Optional[datetime] = None
+
 class UserSearchOut(BaseModel):
     username: str
     first_name: Optional[str] = None
@@ -168,7 +225,7 @@ class UserSearchOut(BaseModel):
 
 
 class SearchOut(BaseModel):
-    articles: list[ArticleOut] = []
+    articles: list[ArticleSummaryOut] = []
     users: list[UserSearchOut] = []
     topics: list[TopicOut] = []
 
@@ -0,0 +1,194 @@
+"""Production launcher: preload the app once, then fork uvicorn workers.
+
+    python -m app.server --workers 4 --port 8000 --max-requests 10000
+
+The master imports app.main before forking, so the imported modules are shared
+copy-on-write instead of being loaded once per worker. It also creates the
+shared-memory counters (app.shared) the workers use for cache invalidation and
+rate limits, and a metrics directory if METRICS_DIR is unset. Workers exit
+after --max-requests requests (plus a random jitter so they don't all restart
+together) and are replaced by a fresh fork. A worker that crashes soon after
+starting is replaced after an exponential backoff; when the same slot fails
+that way MAX_FAST_FAILURES times in a row, the master gives up and exits.
+Database connections and background threads are only created in the workers,
+by the app's lifespan, because neither survives a fork.
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+from . import shared
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# A worker that exits with an error sooner than this after its fork failed fast.
+FAST_FAILURE_SECONDS = 10
+MAX_FAST_FAILURES = 5
+RESPAWN_BACKOFF_SECONDS = 0.5
+MAX_RESPAWN_BACKOFF_SECONDS = 30
+
+
+def bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(app, sock: socket.socket, args) -> int:
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    max_requests = None
+    if args.max_requests:
+        max_requests = args.max_requests + random.randint(0, args.max_requests_jitter)
+    config = uvicorn.Config(
+        app,
+        limit_max_requests=max_requests,
+        timeout_keep_alive=args.keep_alive,
+        log_level=args.log_level,
+        access_log=args.access_log,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+    return 0
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        # pid -> (slot, fork time); a slot keeps its failure count across respawns.
+        self.workers = {}
+        self.failures = [0] * args.workers
+        # slot -> time its replacement is due
+        self.pending = {}
+        self.stopping = False
+        self.failed = False
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = serve_worker(self.app, self.sock, self.args)
+            except BaseException:
+                logger.exception("Worker crashed")
+            finally:
+                os._exit(code)
+        self.workers[pid] = (slot, time.monotonic())
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        self.pending.clear()
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+
+        while self.workers or self.pending:
+            self.spawn_due()
+            try:
+                if self.pending:
+                    # Poll, so a backed-off respawn isn't held up by a blocking wait.
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                else:
+                    pid, status = os.wait()
+            except ChildProcessError:
+                pid = 0
+            except InterruptedError:
+                continue
+            if pid == 0:
+                if not self.pending:
+                    break
+                # Nothing exited; sleep until the next respawn, waking twice a second to reap.
+                time.sleep(min(max(min(self.pending.values()) - time.monotonic(), 0), 0.5))
+                continue
+            slot, started = self.workers.pop(pid, (None, None))
+            if slot is not None and not self.stopping:
+                self.exited(slot, time.monotonic() - started, status)
+        return 1 if self.failed else 0
+
+    def exited(self, slot: int, uptime: float, status: int):
+        """Schedule the slot's replacement, or give up if it keeps crashing on start."""
+        if status != 0 and uptime < FAST_FAILURE_SECONDS:
+            self.failures[slot] += 1
+        else:
+            self.failures[slot] = 0
+
+        if self.failures[slot] >= MAX_FAST_FAILURES:
+            logger.error("Worker slot %s failed %s times within %ss of starting; shutting down",
+                         slot, self.failures[slot], FAST_FAILURE_SECONDS)
+            self.failed = True
+            self.stop(None, None)
+            return
+
+        delay = 0
+        if self.failures[slot]:
+            delay = min(RESPAWN_BACKOFF_SECONDS * 2 ** (self.failures[slot] - 1), MAX_RESPAWN_BACKOFF_SECONDS)
+        # Recycled after max-requests, or crashed: replace it either way.
+        logger.info("Worker in slot %s exited with status %s; starting a new one in %ss", slot, status, delay)
+        self.pending[slot] = time.monotonic() + delay
+
+    def spawn_due(self):
+        now = time.monotonic()
+        for slot, due in list(self.pending.items()):
+            if due <= now and not self.stopping:
+                del self.pending[slot]
+                self.spawn(slot)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.server")
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-requests", type=int, default=10000, help="recycle a worker after this many requests; 0 disables")
+    parser.add_argument("--max-requests-jitter", type=int, default=1000)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--shared-slots", type=int, default=65536, help="slots in each shared-memory segment")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    shared.setup(args.shared_slots)
+    # Workers merge their metrics through snapshot files in this directory.
+    metrics_dir = None
+    if not settings.metrics_dir:
+        metrics_dir = settings.metrics_dir = tempfile.mkdtemp(prefix="metrics-")
+    try:
+        app = import_from_string(args.app)
+        sock = bind(args.host, args.port, args.backlog)
+        logger.info("Listening on %s:%s with %s workers", args.host, args.port, args.workers)
+        return Master(app, sock, args).run()
+    finally:
+        shared.teardown()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
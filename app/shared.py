@@ -0,0 +1,152 @@
+"""Counters and tables in shared-memory segments, visible to every forked worker.
+
+The launcher in app.server creates the segments before forking; workers
+inherit the mappings, so a write in one process is read by all the others
+with no external service. Each kind of key gets its own segment, so values in
+different units never land in the same slot.
+
+- ``counters`` holds cache tag versions in a SharedCounters. Keys are hashed
+  onto int64 slots and two tags can share a slot. That is safe because tag
+  versions are only ever incremented and only compared for equality: a shared
+  slot costs an extra invalidation, never a missed one.
+- ``rates`` holds rate limit TATs in a SharedTable. A TAT is overwritten, not
+  incremented, so two keys in one slot would not simply add up: a strict
+  route's TAT would block the other key. Each slot stores the key's
+  fingerprint next to the value, and a key only ever reads its own entry.
+- ``seen`` holds presence last-seen times, in epoch seconds, in a second
+  SharedTable for the same reason: ``touch`` keeps the larger of two times.
+"""
+import hashlib
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+from . import cache
+
+SLOT_SIZE = 8
+LOCK_STRIPES = 64
+# SharedTable slots per bucket; a key can live in any slot of its bucket.
+BUCKET_SIZE = 8
+
+counters = None
+rates = None
+seen = None
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+class _Segment:
+    def __init__(self, size: int):
+        self._segment = shared_memory.SharedMemory(create=True, size=size * SLOT_SIZE)
+        self._values = self._segment.buf.cast("q")
+        # Fork-inherited locks, striped so unrelated keys rarely contend.
+        context = multiprocessing.get_context("fork")
+        self._locks = [context.Lock() for _ in range(LOCK_STRIPES)]
+
+    def close(self, unlink: bool = False):
+        self._values.release()
+        self._segment.close()
+        if unlink:
+            self._segment.unlink()
+
+
+class SharedCounters(_Segment):
+    """Hashed int64 counters; keys may share a slot, so only for add-only counters."""
+
+    def __init__(self, slots: int = 65536):
+        super().__init__(slots)
+        self.slots = slots
+
+    def _slot(self, key: str) -> int:
+        return _hash(key) % self.slots
+
+    def get(self, key: str) -> int:
+        return self._values[self._slot(key)]
+
+    def add(self, key: str, amount: int = 1) -> int:
+        slot = self._slot(key)
+        with self._locks[slot % LOCK_STRIPES]:
+            self._values[slot] += amount
+            return self._values[slot]
+
+
+class SharedTable(_Segment):
+    """Map of key to int64 in buckets of ``BUCKET_SIZE`` (fingerprint, value) slots.
+
+    The values must grow with time (timestamps, TATs): when a bucket is full,
+    the entry with the smallest value is the stalest and is given up. Missing
+    keys read as 0.
+    """
+
+    def __init__(self, slots: int = 65536):
+        self.buckets = max(slots // BUCKET_SIZE, 1)
+        super().__init__(self.buckets * BUCKET_SIZE * 2)
+
+    def _locate(self, key: str):
+        digest = _hash(key)
+        # 0 marks an empty slot.
+        return digest % self.buckets, (digest >> 1) or 1
+
+    def _find(self, bucket: int, fingerprint: int):
+        base = bucket * BUCKET_SIZE * 2
+        for i in range(base, base + BUCKET_SIZE * 2, 2):
+            if self._values[i] == fingerprint:
+                return i
+        return None
+
+    def get(self, key: str) -> int:
+        bucket, fingerprint = self._locate(key)
+        with self._locks[bucket % LOCK_STRIPES]:
+            i = self._find(bucket, fingerprint)
+            return self._values[i + 1] if i is not None else 0
+
+    def update(self, key: str, fn) -> int:
+        """Replace the value with ``fn(old)`` atomically; returns the new value."""
+        bucket, fingerprint = self._locate(key)
+        with self._locks[bucket % LOCK_STRIPES]:
+            i = self._find(bucket, fingerprint)
+            if i is None:
+                i = self._find(bucket, 0)
+            if i is None:
+                base = bucket * BUCKET_SIZE * 2
+                i = min(range(base, base + BUCKET_SIZE * 2, 2), key=lambda j: self._values[j + 1])
+            if self._values[i] != fingerprint:
+                self._values[i], self._values[i + 1] = fingerprint, 0
+            self._values[i + 1] = fn(self._values[i + 1])
+            return self._values[i + 1]
+
+
+class SharedTagVersions(cache.TagVersions):
+    """Cache tag versions kept in shared memory, so invalidations reach all workers."""
+
+    def __init__(self, store: SharedCounters):
+        self.store = store
+        # Made before the fork, so every worker hands out the same validators.
+        self.epoch = os.urandom(8).hex()
+
+    def get(self, tag: str) -> int:
+        return self.store.get(tag)
+
+    def bump(self, tag: str):
+        self.store.add(tag)
+
+
+def setup(slots: int = 65536):
+    """Create the segments and point the response cache at them; call before forking."""
+    global counters, rates, seen
+    counters = SharedCounters(slots)
+    rates = SharedTable(slots)
+    seen = SharedTable(slots)
+    cache.responses.versions = SharedTagVersions(counters)
+
+
+def teardown():
+    global counters, rates, seen
+    if counters is not None:
+        cache.responses.versions = cache.TagVersions()
+    for segment in (counters, rates, seen):
+        if segment is not None:
+            segment.close(unlink=True)
+    counters = rates = seen = None
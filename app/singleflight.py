@@ -0,0 +1,105 @@
+import functools
+import threading
+import time
+from collections import deque
+
+from .config import settings
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "done_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers of the same key.
+
+    Callers arriving while the leader is running wait for its result. A finished
+    result is also handed out for ``grace`` seconds to callers that just missed it.
+    Results are shared between requests, so they must not hold session-bound
+    objects; serialized bytes or cache entries are the intended payload.
+    """
+
+    def __init__(self, grace: float = None, timeout: float = None):
+        self._grace = grace
+        self._timeout = timeout
+        self._calls = {}
+        self._finished = deque()
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    @property
+    def grace(self) -> float:
+        return self._grace if self._grace is not None else settings.singleflight_grace_seconds
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout if self._timeout is not None else settings.singleflight_wait_timeout_seconds
+
+    def _prune(self, now: float):
+        while self._finished and now - self._finished[0][0] > self.grace:
+            _, key, call = self._finished.popleft()
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key, fn):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.event.wait(self.timeout):
+                # The leader is stuck; don't let it take every follower down with it.
+                with self._lock:
+                    self.timeouts += 1
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                call.done_at = time.monotonic()
+                self._finished.append((call.done_at, key, call))
+                if call.error is not None and self._calls.get(key) is call:
+                    # Errors are passed to current waiters but never replayed.
+                    del self._calls[key]
+            call.event.set()
+
+    def coalesce(self, key: str):
+        """Decorator; ``key`` is formatted with the call's keyword arguments."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(**kwargs):
+                return self.do(key.format(**kwargs), lambda: fn(**kwargs))
+            return wrapper
+        return decorator
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = sum(1 for call in self._calls.values() if call.done_at is None)
+        return {"leaders": self.leaders, "coalesced": self.coalesced,
+                "timeouts": self.timeouts, "in_flight": in_flight}
+
+
+reads = SingleFlight()
@@ -0,0 +1,216 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each interaction in the trending score, in the same
+# column order as COUNTERS.
+COUNTERS = ("likes", "comments", "bookmarks", "views")
+WEIGHTS = np.array([4.0, 6.0, 8.0, 1.0])
+LOCK_KEY = 0x7472656e  # "tren"
+
+_pending_views = Counter()
+_pending_lock = threading.Lock()
+
+# Precomputed read path, swapped atomically by recompute().
+_top_articles: list[int] = []
+_top_topics: list[int] = []
+
+_stop = threading.Event()
+_thread = None
+
+
+def current_bucket(now: datetime = None) -> datetime:
+    now = now or datetime.now(timezone.utc)
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def _bump(db: Session, counts: dict[int, int], kind: str):
+    stmt = insert(models.ArticleActivity).values([
+        {"article_id": article_id, "bucket": current_bucket(), kind: amount}
+        for article_id, amount in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.ArticleActivity.article_id, models.ArticleActivity.bucket],
+        set_={kind: getattr(models.ArticleActivity, kind) + stmt.excluded[kind]},
+    )
+    db.execute(stmt)
+
+
+def record(db: Session, article_id: int, kind: str, amount: int = 1):
+    """Add to the current hour's counter; committed with the caller's transaction.
+
+    A negative amount (an unlike, a removed bookmark) only takes back from an
+    existing bucket for this hour, and never below zero: the like it undoes
+    may have been counted in an earlier bucket, or before the window.
+    """
+    if amount > 0:
+        _bump(db, {article_id: amount}, kind)
+        return
+    activity = models.ArticleActivity
+    column = getattr(activity, kind)
+    db.execute(
+        update(activity)
+        .where(activity.article_id == article_id, activity.bucket == current_bucket(), column > 0)
+        .values({kind: func.greatest(column + amount, 0)})
+    )
+
+
+def record_view(article_id: int):
+    # Views are the hottest counter, so they are buffered in memory and
+    # written by the background job instead of on every read.
+    with _pending_lock:
+        _pending_views[article_id] += 1
+
+
+def take_views() -> Counter:
+    """The buffered views, leaving the buffer empty."""
+    global _pending_views
+    with _pending_lock:
+        pending, _pending_views = _pending_views, Counter()
+    return pending
+
+
+def restore_views(pending: Counter):
+    """Put back views whose flush failed, so the next flush retries them."""
+    with _pending_lock:
+        _pending_views.update(pending)
+
+
+def flush_views(db: Session, pending: Counter):
+    if not pending:
+        return
+
+    _bump(db, pending, "views")
+    articles = models.Article.__table__
+    db.execute(
+        articles.update()
+        .where(articles.c.id == bindparam("article_id"))
+        # Keep updated_at meaning "content last changed".
+        .values(views_count=articles.c.views_count + bindparam("amount"),
+                updated_at=articles.c.updated_at),
+        [{"article_id": article_id, "amount": amount} for article_id, amount in pending.items()],
+    )
+
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> list[int]:
+    if len(ids) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(ids))
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return ids[order].tolist()
+
+
+def recompute(db: Session, now: datetime = None):
+    global _top_articles, _top_topics
+
+    now = now or datetime.now(timezone.utc)
+    since = current_bucket(now) - timedelta(hours=settings.trending_window_hours)
+    activity = models.ArticleActivity
+
+    # Workers all build their own read path, but only one prunes.
+    if db.get_bind().dialect.name != "postgresql" or db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": LOCK_KEY}).scalar():
+        db.execute(delete(activity).where(activity.bucket < since))
+
+    rows = db.execute(
+        select(activity.article_id, activity.bucket, *(getattr(activity, c) for c in COUNTERS))
+        .join(models.Article, models.Article.id == activity.article_id)
+        .where(activity.bucket >= since, models.Article.is_published == True)
+    ).all()
+
+    if not rows:
+        _top_articles, _top_topics = [], []
+        return
+
+    article_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    ages = np.fromiter(((now - row[1]).total_seconds() for row in rows), dtype=np.float64, count=len(rows))
+    counts = np.array([row[2:] for row in rows], dtype=np.float64)
+
+    # Each hourly bucket loses half its weight every half-life.
+    decay = np.exp2(-(ages / 3600.0) / settings.trending_half_life_hours)
+    bucket_scores = (counts @ WEIGHTS) * decay
+
+    ids, inverse = np.unique(article_ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=bucket_scores)
+
+    assoc = models.article_topic_association
+    links = db.execute(
+        select(assoc.c.article_id, assoc.c.topic_id).where(assoc.c.article_id.in_(ids.tolist()))
+    ).all()
+
+    top_topics = []
+    if links:
+        link_articles = np.fromiter((link[0] for link in links), dtype=np.int64, count=len(links))
+        link_topics = np.fromiter((link[1] for link in links), dtype=np.int64, count=len(links))
+        topic_ids, topic_inverse = np.unique(link_topics, return_inverse=True)
+        topic_scores = np.bincount(
+            topic_inverse, weights=scores[np.searchsorted(ids, link_articles)])
+        top_topics = _top_k(topic_ids, topic_scores, settings.trending_top_k)
+
+    _top_articles = _top_k(ids, scores, settings.trending_top_k)
+    _top_topics = top_topics
+
+
+def trending_article_ids(limit: int) -> list[int]:
+    return _top_articles[:limit]
+
+
+def trending_topic_ids(limit: int) -> list[int]:
+    return _top_topics[:limit]
+
+
+def refresh():
+    db = SessionLocal()
+    try:
+        pending = take_views()
+        try:
+            flush_views(db, pending)
+            db.commit()
+        except Exception:
+            db.rollback()
+            restore_views(pending)
+            logger.exception("Failed to flush article views")
+
+        try:
+            recompute(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Failed to refresh trending scores")
+    finally:
+        db.close()
+
+
+def _run():
+    while True:
+        refresh()
+        if _stop.wait(settings.trending_refresh_seconds):
+            return
+
+
+def start():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="trending", daemon=True)
+        _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    refresh()
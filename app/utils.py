@@ -1,18 +1,22 @@
-from random import random
+import random
 from passlib.context import CryptContext
 from names_generator import generate_name
-from . import models
+from . import metrics, models
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def hash(password: str):
-    return pwd_context.hash(password)
+    with metrics.in_progress("password_hashes_in_progress"):
+        return pwd_context.hash(password)
 
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with metrics.in_progress("password_hashes_in_progress"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def generate_username(db: Session) -> str:
     while True:
@@ -20,11 +24,81 @@ def generate_username(db: Session) -> str:
 
         username = f"{username}_{random.randint(10, 99)}"
 
-        existing_user = db.query(models.User).filter(models.User.username == username).first()
+        existing_user = db.query(models.User).filter(
+            models.User.username == username).execution_options(include_inactive=True).first()
         if not existing_user:
             return username
 
 def is_username_taken(db: Session, username: str) -> bool:
-    return db.query(models.User).filter(models.User.username == username).first() is not None
+    return db.query(models.User).filter(
+        models.User.username == username).execution_options(include_inactive=True).first() is not None
 
-        
+
+def generate_usernames(db: Session, count: int) -> list[str]:
+    """Generate ``count`` distinct free usernames with one lookup per round."""
+    usernames = set()
+    while len(usernames) < count:
+        candidates = {
+            f"{generate_name(style='underscore').lower()}_{random.randint(10, 99)}"
+            for _ in range(count - len(usernames))
+        } - usernames
+        taken = set(db.execute(
+            select(models.User.username).where(models.User.username.in_(candidates))
+            .execution_options(include_inactive=True)
+        ).scalars())
+        usernames |= candidates - taken
+    return list(usernames)
+
+
+def insert(db: Session, table):
+    """INSERT construct with ON CONFLICT support for the session's dialect."""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+
+def normalize_topic_title(title: str) -> str:
+    return " ".join(title.split())
+
+
+def resolve_topics(db: Session, titles: list[str]) -> list[models.Topic]:
+    # One INSERT ... ON CONFLICT for the missing titles plus one SELECT for the
+    # ones that already existed, regardless of how many titles are passed in.
+    wanted = {}
+    for title in titles:
+        title = normalize_topic_title(title)
+        if title:
+            wanted.setdefault(title.lower(), title)
+
+    if not wanted:
+        return []
+
+    created = db.execute(
+        insert(db, models.Topic)
+        .values([{"title": title} for title in wanted.values()])
+        .on_conflict_do_nothing(index_elements=[func.lower(models.Topic.title)])
+        .returning(models.Topic)
+    ).scalars().all()
+
+    found = {topic.title.lower(): topic for topic in created}
+    missing = [key for key in wanted if key not in found]
+    if missing:
+        existing = db.execute(
+            select(models.Topic).where(func.lower(models.Topic.title).in_(missing))
+        ).scalars().all()
+        found.update((topic.title.lower(), topic) for topic in existing)
+
+    return [found[key] for key in wanted if key in found]
+
+
+def set_article_topics(db: Session, article_id: int, topics: list[models.Topic], replace: bool = False):
+    if replace:
+        db.execute(models.article_topic_association.delete().where(
+            models.article_topic_association.c.article_id == article_id))
+
+    if topics:
+        db.execute(
+            insert(db, models.article_topic_association)
+            .values([{"article_id": article_id, "topic_id": topic.id} for topic in topics])
+            .on_conflict_do_nothing()
+        )
@@ -0,0 +1,55 @@
+import logging
+import time
+
+from sqlalchemy.orm import Session, joinedload, undefer
+
+from . import models, partitions
+from .config import settings
+from .database import Base, get_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _hot_queries(db: Session):
+    # Same statement shapes as the hot request paths, with keys that match
+    # nothing; running them fills SQLAlchemy's compiled-statement caches.
+    db.query(models.User).filter(models.User.id == -1).first()
+    db.query(models.User).filter(models.User.username == "").first()
+    db.query(models.Article).options(
+        undefer(models.Article.content), joinedload(models.Article.body)).filter(
+        models.Article.id == -1).first()
+
+
+def warm_up(connections: int = None) -> float:
+    """Open pool connections and compile hot queries; returns seconds spent."""
+    connections = settings.database_warm_connections if connections is None else connections
+    started = time.perf_counter()
+    engine = get_engine()
+
+    if settings.create_schema:
+        Base.metadata.create_all(bind=engine)
+        partitions.run()
+
+    # Connections beyond the pool size are overflow: they are closed when
+    # returned, and past max_overflow connect() would block until pool_timeout.
+    size = engine.pool.size() if hasattr(engine.pool, "size") else connections
+    if connections > size:
+        logger.info("Warming %s connections, the pool size, instead of %s", size, connections)
+        connections = size
+    if connections <= 0:
+        return time.perf_counter() - started
+
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+        with Session(bind=opened[0]) as db:
+            _hot_queries(db)
+    except Exception:
+        # The app still starts and connects lazily once the database is back.
+        logger.warning("Database warm-up failed", exc_info=True)
+    finally:
+        for connection in opened:
+            connection.close()
+
+    return time.perf_counter() - started
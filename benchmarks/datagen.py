@@ -0,0 +1,235 @@
+"""Deterministic benchmark dataset.
+
+    python -m benchmarks.datagen --scale small --reset
+
+The same scale and seed always produce the same rows with the same ids, so
+numbers from different runs (and different branches) are comparable. Shapes
+follow what a real instance looks like rather than uniform noise: follower
+counts and article popularity are power-law distributed, a few authors write
+most of the articles, and comments come in threads.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import content, importer, models, utils
+from app.database import SessionLocal
+
+SCALES = {
+    "tiny": dict(users=200, topics=20, articles=1_000, follows=15, subscriptions=4,
+                 likes=5_000, bookmarks=1_500, comments=3_000, threads=300, messages=8),
+    "small": dict(users=2_000, topics=60, articles=10_000, follows=30, subscriptions=6,
+                  likes=60_000, bookmarks=15_000, comments=30_000, threads=3_000, messages=12),
+    "medium": dict(users=20_000, topics=200, articles=100_000, follows=60, subscriptions=8,
+                   likes=800_000, bookmarks=150_000, comments=300_000, threads=30_000, messages=16),
+    "large": dict(users=100_000, topics=500, articles=600_000, follows=80, subscriptions=10,
+                  likes=5_000_000, bookmarks=1_000_000, comments=2_000_000, threads=150_000, messages=20),
+}
+
+PASSWORD = "benchmark"
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HISTORY_DAYS = 180
+BATCH_SIZE = 10_000
+WORDS = (
+    "python database query latency cache index async worker design system scale "
+    "postgres feed search ranking network memory profile startup thread process "
+    "vector graph stream batch model layer api server client request response "
+    "storage queue event schema migration deploy review test release metric trace"
+).split()
+
+TABLES = ("messages", "comments", "article_bookmark_association", "article_like_association",
+          "article_topic_association", "article_bodies", "article_activity", "articles",
+          "user_topic_association", "user_follow_association", "topics", "notifications", "account_purges",
+          "users")
+
+
+def username(user_id: int) -> str:
+    return f"bench_user_{user_id}"
+
+
+def topic_title(topic_id: int) -> str:
+    return f"{WORDS[topic_id % len(WORDS)].title()} {topic_id}"
+
+
+def zipf_weights(n: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """Power-law popularity over a shuffled order, normalised to probabilities."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def unique_pairs(left: np.ndarray, right: np.ndarray, distinct: bool = False) -> np.ndarray:
+    pairs = np.unique(np.stack([left, right], axis=1), axis=0)
+    return pairs[pairs[:, 0] != pairs[:, 1]] if distinct else pairs
+
+
+def timestamps(rng: np.random.Generator, n: int) -> list[datetime]:
+    seconds = np.sort(rng.integers(0, HISTORY_DAYS * 86400, size=n))
+    return [EPOCH + timedelta(seconds=int(s)) for s in seconds]
+
+
+def sentence(rng: np.random.Generator, n: int) -> str:
+    return " ".join(WORDS[i] for i in rng.integers(0, len(WORDS), size=n))
+
+
+class Writer:
+    def __init__(self, db: Session):
+        self.db = db
+        self.postgres = db.get_bind().dialect.name == "postgresql"
+        self.counts = {}
+
+    def write(self, table: str, columns: tuple, rows):
+        rows = list(rows)
+        for start in range(0, len(rows), BATCH_SIZE):
+            chunk = rows[start:start + BATCH_SIZE]
+            if self.postgres:
+                importer.copy_rows(self.db, table, columns, chunk)
+            else:
+                self.db.execute(models.Base.metadata.tables[table].insert(),
+                                [dict(zip(columns, row)) for row in chunk])
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+
+def reset(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+    else:
+        for table in TABLES:
+            db.execute(models.Base.metadata.tables[table].delete())
+
+
+def _fix_sequences(db: Session):
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in ("users", "topics", "articles", "comments", "messages"):
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"))
+
+
+def generate(db: Session, scale: str = "small", seed: int = 42) -> dict:
+    """Fill an empty database; returns the number of rows written per table."""
+    size = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    out = Writer(db)
+    password = utils.hash(PASSWORD)
+
+    n_users, n_topics, n_articles = size["users"], size["topics"], size["articles"]
+    user_ids = np.arange(1, n_users + 1)
+    popularity = zipf_weights(n_users, 1.1, rng)
+
+    created = timestamps(rng, n_users)
+    out.write("users", ("id", "email", "password", "username", "first_name", "bio", "is_active",
+                        "created_at", "updated_at"), (
+        (int(uid), f"{username(uid)}@example.com", password, username(uid), f"User {uid}",
+         sentence(rng, 12), True, created[i], created[i])
+        for i, uid in enumerate(user_ids)))
+
+    out.write("topics", ("id", "title", "description", "created_at", "updated_at"), (
+        (t, topic_title(t), sentence(rng, 10), EPOCH, EPOCH) for t in range(1, n_topics + 1)))
+
+    # Followers: out-degree is heavy tailed, targets are picked by popularity,
+    # which gives the usual few-celebrities-many-lurkers in-degree curve.
+    degrees = np.minimum(rng.pareto(1.5, size=n_users) * size["follows"] / 2 + 1, n_users - 1).astype(np.int64)
+    followers = np.repeat(user_ids, degrees)
+    followees = rng.choice(user_ids, size=len(followers), p=popularity)
+    follows = unique_pairs(followers, followees, distinct=True)
+    out.write("user_follow_association", ("follower_id", "following_id"), map(tuple, follows.tolist()))
+
+    topic_weights = zipf_weights(n_topics, 0.9, rng)
+    subscribers = np.repeat(user_ids, rng.poisson(size["subscriptions"], size=n_users))
+    subscriptions = unique_pairs(subscribers, rng.choice(np.arange(1, n_topics + 1), size=len(subscribers), p=topic_weights))
+    out.write("user_topic_association", ("user_id", "topic_id"), map(tuple, subscriptions.tolist()))
+
+    article_ids = np.arange(1, n_articles + 1)
+    authors = rng.choice(user_ids, size=n_articles, p=popularity)
+    published = rng.random(n_articles) < 0.85
+    article_created = timestamps(rng, n_articles)
+    article_weights = zipf_weights(n_articles, 1.0, rng)
+
+    likes = unique_pairs(rng.choice(user_ids, size=size["likes"]),
+                         rng.choice(article_ids, size=size["likes"], p=article_weights))
+    bookmarks = unique_pairs(rng.choice(user_ids, size=size["bookmarks"]),
+                             rng.choice(article_ids, size=size["bookmarks"], p=article_weights))
+    likes_count = np.bincount(likes[:, 1], minlength=n_articles + 1)
+    bookmarks_count = np.bincount(bookmarks[:, 1], minlength=n_articles + 1)
+
+    articles, bodies = [], []
+    for i, article_id in enumerate(article_ids.tolist()):
+        paragraphs = "\n\n".join(sentence(rng, int(n)) for n in rng.integers(40, 160, size=int(rng.integers(2, 12))))
+        column_text, excerpt, codec, data = content.encode(paragraphs)
+        articles.append((article_id, sentence(rng, int(rng.integers(3, 9))).capitalize(), sentence(rng, 8),
+                         column_text, excerpt, int(authors[i]), bool(published[i]), int(rng.integers(0, 5000)),
+                         int(likes_count[article_id]), int(bookmarks_count[article_id]),
+                         max(1, len(paragraphs.split()) // 200), article_created[i], article_created[i]))
+        if codec:
+            bodies.append((article_id, codec, data))
+    out.write("articles", ("id", "title", "subtitle", "content", "excerpt", "author_id", "is_published",
+                           "views_count", "likes_count", "bookmarks_count", "reading_time",
+                           "created_at", "updated_at"), articles)
+    out.write("article_bodies", ("article_id", "codec", "data"), bodies)
+
+    tagged = np.repeat(article_ids, rng.integers(1, 4, size=n_articles))
+    article_topics = unique_pairs(tagged, rng.choice(np.arange(1, n_topics + 1), size=len(tagged), p=topic_weights))
+    out.write("article_topic_association", ("article_id", "topic_id"), map(tuple, article_topics.tolist()))
+    out.write("article_like_association", ("user_id", "article_id"), map(tuple, likes.tolist()))
+    out.write("article_bookmark_association", ("user_id", "article_id"), map(tuple, bookmarks.tolist()))
+
+    # Comments: a third are replies to an earlier comment on the same article.
+    comment_articles = rng.choice(article_ids, size=size["comments"], p=article_weights)
+    comment_users = rng.choice(user_ids, size=size["comments"])
+    comment_created = timestamps(rng, size["comments"])
+    last_on_article = {}
+    comments = []
+    for i in range(size["comments"]):
+        article_id = int(comment_articles[i])
+        earlier = last_on_article.get(article_id)
+        parent_id = None
+        if earlier and rng.random() < 0.35:
+            parent_id = earlier[int(rng.integers(0, len(earlier)))]
+        comment_id = i + 1
+        last_on_article.setdefault(article_id, []).append(comment_id)
+        comments.append((comment_id, sentence(rng, int(rng.integers(5, 40))), int(comment_users[i]), article_id,
+                         parent_id, comment_created[i], comment_created[i]))
+    out.write("comments", ("id", "content", "user_id", "article_id", "parent_id", "created_at", "updated_at"), comments)
+
+    # Message threads run along follow edges, alternating between both sides.
+    thread_edges = follows[rng.choice(len(follows), size=min(size["threads"], len(follows)), replace=False)]
+    messages = []
+    message_id = 0
+    for sender, receiver in thread_edges.tolist():
+        start = EPOCH + timedelta(seconds=int(rng.integers(0, HISTORY_DAYS * 86400)))
+        for n in range(int(rng.integers(1, size["messages"] * 2))):
+            message_id += 1
+            at = start + timedelta(minutes=n * int(rng.integers(1, 120)))
+            pair = (sender, receiver) if n % 2 == 0 else (receiver, sender)
+            messages.append((message_id, *pair, sentence(rng, int(rng.integers(3, 25))), True, at, at))
+    out.write("messages", ("id", "sender_id", "receiver_id", "content", "is_read", "created_at", "updated_at"), messages)
+
+    _fix_sequences(db)
+    return out.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.datagen")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="empty the benchmark tables first")
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        if args.reset:
+            reset(db)
+        counts = generate(db, args.scale, args.seed)
+        db.commit()
+
+    for table, count in counts.items():
+        print(f"{table:>30}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Load benchmark: throughput, latency percentiles and queries per request.
+
+    python -m benchmarks.datagen --scale small --reset
+    python -m benchmarks.run --scale small                     # in-process
+    python -m benchmarks.run --target http://127.0.0.1:8000    # running server
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+
+In-process runs drive the app through httpx's ASGI transport, so there is no
+socket in the way and every SQL statement can be attributed to the request
+that issued it. Over HTTP the query count is not available. Rate limits are
+switched off for in-process runs; start the server with
+RATELIMIT_ENABLED=false to benchmark it over HTTP.
+
+With --baseline the results are compared endpoint by endpoint, and the exit
+status is 1 if any p95 or throughput got worse by more than --threshold.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+from sqlalchemy import event
+
+from . import datagen, scenarios
+
+_queries = contextvars.ContextVar("benchmark_queries", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+async def _send(client: httpx.AsyncClient, tokens: scenarios.Tokens, request: scenarios.Request) -> tuple:
+    counter = [0]
+    _queries.set(counter)
+    started = time.perf_counter()
+    response = await client.request(request.method, request.path, json=request.json,
+                                    headers=tokens.headers(request.user_id))
+    await response.aread()
+    return time.perf_counter() - started, response.status_code, counter[0]
+
+
+async def run_scenario(client, tokens, scenario: scenarios.Scenario, size: dict, args) -> dict:
+    rng = random.Random(f"{args.seed}:{scenario.name}")
+    requests = [scenario.build(rng, size) for _ in range(args.warmup + args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(request):
+        async with semaphore:
+            return await _send(client, tokens, request)
+
+    for request in requests[:args.warmup]:
+        await one(request)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(request) for request in requests[args.warmup:]))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([r[0] for r in results]) * 1000
+    errors = sum(1 for r in results if r[1] >= 500)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    report = {
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "statuses": {str(code): sum(1 for r in results if r[1] == code) for code in sorted({r[1] for r in results})},
+    }
+    if args.target == "asgi":
+        report["queries_per_request"] = round(sum(r[2] for r in results) / len(results), 2)
+    return report
+
+
+async def run(args) -> dict:
+    size = datagen.SCALES[args.scale]
+    tokens = scenarios.Tokens()
+    selected = [scenarios.BY_NAME[name] for name in args.scenario] if args.scenario else scenarios.SCENARIOS
+
+    if args.target == "asgi":
+        from app.config import settings
+        from app.database import get_engine
+        from app.main import app
+
+        settings.ratelimit_enabled = False
+        event.listen(get_engine(), "before_cursor_execute", _count_query)
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                return {s.name: await run_scenario(client, tokens, s, size, args) for s in selected}
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=30) as client:
+        return {s.name: await run_scenario(client, tokens, s, size, args) for s in selected}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print the change against the baseline; return the regressed endpoints."""
+    regressions = []
+    print(f"\n{'endpoint':<15}{'p95 before':>12}{'p95 now':>10}{'change':>9}{'rps before':>12}{'rps now':>10}{'change':>9}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        p95_change = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+        rps_change = (now["rps"] - before["rps"]) / before["rps"] * 100 if before["rps"] else 0.0
+        print(f"{name:<15}{before['p95_ms']:>12.2f}{now['p95_ms']:>10.2f}{p95_change:>+8.1f}%"
+              f"{before['rps']:>12.1f}{now['rps']:>10.1f}{rps_change:>+8.1f}%")
+        if p95_change > threshold or rps_change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--target", default="asgi", help='"asgi" for in-process, or a base URL')
+    parser.add_argument("--scale", choices=sorted(datagen.SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios.BY_NAME),
+                        help="run only this scenario; repeatable")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against a results file")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+
+    print(f"{'endpoint':<15}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+    for name, r in results.items():
+        queries = r.get("queries_per_request")
+        print(f"{name:<15}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{queries if queries is not None else '-':>9}{r['errors']:>8}")
+
+    document = {"target": args.target, "scale": args.scale, "seed": args.seed,
+                "concurrency": args.concurrency, "results": results}
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        if regressions:
+            print(f"\nRegressed beyond {args.threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Request mixes for the load benchmark, one scenario per endpoint.
+
+Each scenario turns a seeded RNG into the next request to send. Ids and names
+are drawn from the same scale table as benchmarks.datagen, so the requests
+always hit rows that exist in the generated dataset.
+"""
+import random
+from typing import Callable, NamedTuple, Optional
+
+from app import oauth2
+
+from . import datagen
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    user_id: Optional[int] = None  # authenticate as this user
+    json: Optional[dict] = None
+
+
+class Scenario(NamedTuple):
+    name: str
+    build: Callable[[random.Random, dict], Request]
+
+
+def _user(rng: random.Random, size: dict) -> int:
+    # Skew towards low ids a little so some users repeat, like real traffic.
+    return min(int(rng.paretovariate(1.2)), size["users"]) if rng.random() < 0.3 else rng.randint(1, size["users"])
+
+
+def _article(rng: random.Random, size: dict) -> int:
+    return rng.randint(1, size["articles"])
+
+
+def _word(rng: random.Random) -> str:
+    return rng.choice(datagen.WORDS)
+
+
+SCENARIOS = [
+    Scenario("feeds", lambda rng, size: Request("GET", "/users/feeds", _user(rng, size))),
+    Scenario("feeds_ranked", lambda rng, size: Request("GET", "/users/feeds?order=ranked", _user(rng, size))),
+    Scenario("dashboard", lambda rng, size: Request("GET", "/users/dashboard", _user(rng, size))),
+    Scenario("search", lambda rng, size: Request("GET", f"/articles/search?search_string={_word(rng)}", _user(rng, size))),
+    Scenario("article", lambda rng, size: Request("GET", f"/articles/{_article(rng, size)}")),
+    Scenario("user_articles", lambda rng, size: Request("GET", f"/articles/user/{_user(rng, size)}")),
+    Scenario("profile", lambda rng, size: Request("GET", f"/users/{datagen.username(_user(rng, size))}")),
+    Scenario("topic", lambda rng, size: Request("GET", f"/topics/{datagen.topic_title(rng.randint(1, size['topics']))}")),
+    Scenario("comments", lambda rng, size: Request("GET", f"/articles/{_article(rng, size)}/comments")),
+    Scenario("trending", lambda rng, size: Request("GET", "/articles/trending")),
+    Scenario("followers", lambda rng, size: Request("GET", f"/follow/users/{_user(rng, size)}/followers")),
+    Scenario("messages", lambda rng, size: Request("GET", "/messages/", _user(rng, size))),
+    Scenario("like", lambda rng, size: Request(
+        rng.choice(("PUT", "DELETE")), f"/articles/{_article(rng, size)}/like", _user(rng, size))),
+]
+
+BY_NAME = {scenario.name: scenario for scenario in SCENARIOS}
+
+
+class Tokens:
+    """Bearer tokens minted locally, so the benchmark doesn't measure bcrypt."""
+
+    def __init__(self):
+        self._tokens = {}
+
+    def headers(self, user_id: Optional[int]) -> dict:
+        if user_id is None:
+            return {}
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = self._tokens[user_id] = oauth2.create_access_token({"user_id": user_id})
+        return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,63 @@
+"""Cold-start benchmark: how long a fresh worker takes to become ready.
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --runs 10 --json startup.json
+
+Each run is a new interpreter, so nothing is shared with earlier runs. It
+reports the time to import app.main and the time for the lifespan startup
+(pool warm-up, background jobs) separately.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def startup():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def measure(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {}
+    for phase in ("import_ms", "startup_ms"):
+        values = sorted(sample[phase] for sample in samples)
+        report[phase] = {
+            "median": round(statistics.median(values), 2),
+            "min": round(values[0], 2),
+            "max": round(values[-1], 2),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = measure(args.runs)
+    for phase, stats in report.items():
+        print(f"{phase:>11}: median {stats['median']:8.2f}  min {stats['min']:8.2f}  max {stats['max']:8.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
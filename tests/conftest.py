@@ -0,0 +1,76 @@
+"""Fixtures: the app on an in-memory SQLite database.
+
+PostgreSQL-only statements (upserts, RETURNING in CTEs, partition DDL) are
+not exercised here; tests that need them say so and write rows directly.
+"""
+import os
+
+for _name, _value in {
+    "DATABASE_HOSTNAME": "localhost", "DATABASE_PORT": "5432", "DATABASE_PASSWORD": "test",
+    "DATABASE_NAME": "test", "DATABASE_USERNAME": "test", "SECRET_KEY": "test",
+    "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cache, database, models, oauth2
+from app.config import settings
+
+# SQLite can't autoincrement part of a composite key; the partitioned tables'
+# ids are assigned by the tests instead.
+for _table in (models.Message.__table__, models.Notification.__table__):
+    _table.c.id.autoincrement = False
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def _functions(connection, record):
+        connection.create_function("now", 0, lambda: datetime.now().isoformat(" "))
+        connection.create_function("greatest", -1, max)
+
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "_engine", engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    from app.main import app
+
+    monkeypatch.setattr(settings, "ratelimit_enabled", False)
+    monkeypatch.setattr(cache, "responses", cache.ResponseCache())
+    # Reads repeated right after a write must not share the earlier result.
+    monkeypatch.setattr(settings, "singleflight_grace_seconds", 0)
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(name: str) -> models.User:
+        user = models.User(email=f"{name}@example.com", password="x", username=name)
+        db.add(user)
+        db.commit()
+        return user
+    return make_user
+
+
+def auth(user: models.User) -> dict:
+    return {"Authorization": "Bearer " + oauth2.create_access_token({"user_id": user.id})}
@@ -0,0 +1,85 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache, conditional, models
+from app.routers import article as article_router
+
+from .conftest import auth
+
+
+def test_entry_is_not_stored_when_a_tag_moved_during_the_render():
+    responses = cache.ResponseCache()
+    versions = responses.snapshot(["article:1", "user:2"])
+    responses.invalidate("user:2")
+
+    entry = responses.set("/articles/1", b"{}", conditional.Validator('W/"x"'), versions)
+    assert entry.body == b"{}"
+    assert responses.get("/articles/1") is None
+
+
+def test_entry_is_stored_with_the_snapshot_versions():
+    responses = cache.ResponseCache()
+    responses.invalidate("article:1")
+    responses.set("/articles/1", b"{}", conditional.Validator('W/"x"'), responses.snapshot(["article:1"]))
+    assert responses.get("/articles/1") is not None
+
+    responses.invalidate("article:1")
+    assert responses.get("/articles/1") is None
+
+
+def test_update_invalidates_after_the_commit(client, db, make_user, monkeypatch):
+    author = make_user("author")
+    article = models.Article(title="old", content="body", author_id=author.id, is_published=True)
+    db.add(article)
+    db.commit()
+    events = []
+
+    def after_commit(session):
+        events.append("commit")
+
+    event.listen(Session, "after_commit", after_commit)
+    monkeypatch.setattr(cache, "invalidate", lambda *tags: events.append(tags))
+    monkeypatch.setattr(article_router.related, "wake", lambda: None)
+    try:
+        response = client.patch(f"/articles/{article.id}", json={"title": "new", "topics": ["python"]},
+                                headers=auth(author))
+    finally:
+        event.remove(Session, "after_commit", after_commit)
+    assert response.status_code == 200
+    assert events[0] == "commit"
+    assert f"article:{article.id}" in events[1]
+
+
+def test_topic_change_invalidates_old_and_new_topics(client, db, make_user, monkeypatch):
+    author = make_user("author")
+    article = models.Article(title="t", content="body", author_id=author.id, is_published=True)
+    db.add(article)
+    db.commit()
+    monkeypatch.setattr(article_router.related, "wake", lambda: None)
+    client.patch(f"/articles/{article.id}", json={"topics": ["python"]}, headers=auth(author))
+    old = db.query(models.Topic).filter(models.Topic.title == "python").one()
+    tags = []
+    monkeypatch.setattr(cache, "invalidate", lambda *invalidated: tags.extend(invalidated))
+
+    response = client.patch(f"/articles/{article.id}", json={"topics": ["rust"]}, headers=auth(author))
+    assert response.status_code == 200
+    new = db.query(models.Topic).filter(models.Topic.title == "rust").one()
+    assert sorted(tags) == sorted([f"article:{article.id}", f"user:{author.id}", f"topic:{old.id}", f"topic:{new.id}"])
+
+
+def test_cover_upload_invalidates_author_and_topics(client, db, make_user, monkeypatch):
+    author = make_user("author")
+    article = models.Article(title="t", content="body", author_id=author.id, is_published=True)
+    topic = models.Topic(title="python")
+    db.add_all([article, topic])
+    db.commit()
+    db.execute(models.article_topic_association.insert().values(article_id=article.id, topic_id=topic.id))
+    db.commit()
+    tags = []
+    monkeypatch.setattr(cache, "invalidate", lambda *invalidated: tags.extend(invalidated))
+    monkeypatch.setattr(article_router.images, "save_upload", lambda file: "/static/covers/x.jpg")
+
+    response = client.put(f"/articles/{article.id}/cover_image", files={"file": ("x.jpg", b"jpeg")},
+                          headers=auth(author))
+    assert response.status_code == 200
+    assert sorted(tags) == sorted([f"article:{article.id}", f"user:{author.id}", f"topic:{topic.id}"])
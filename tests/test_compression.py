@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import compression
+from app.config import settings
+
+BODY = b'{"items": [' + b",".join(b'{"id": %d}' % i for i in range(200)) + b"]}"
+
+
+@pytest.fixture(autouse=True)
+def codecs(monkeypatch):
+    # brotli and zstandard are optional; pretend both are installed.
+    monkeypatch.setattr(compression, "brotli", compression.brotli or object())
+    monkeypatch.setattr(compression, "zstandard", compression.zstandard or object())
+    monkeypatch.setattr(settings, "compression_codecs", "zstd,br,gzip")
+    monkeypatch.setattr(settings, "compression_min_bytes", 100)
+
+
+@pytest.mark.parametrize("header, codec", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("gzip;q=1.0, br;q=0.5, zstd;q=0", "br"),
+    ("GZIP;Q=0.8", "gzip"),
+    ("*", "zstd"),
+    ("*;q=0, gzip", "gzip"),
+    ("zstd;q=0, br;q=0, *;q=0.1", "gzip"),
+    ("identity", None),
+    ("gzip;q=0", None),
+    ("gzip;q=abc", None),
+])
+def test_negotiate(header, codec):
+    assert compression.negotiate(header) == codec
+
+
+def test_negotiate_skips_codecs_that_are_not_installed(monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+    assert compression.negotiate("zstd, gzip") == "gzip"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "compression_codecs", "gzip")
+
+    def lines():
+        for i in range(50):
+            yield b'{"line": %d}\n' % i
+
+    app = Starlette(routes=[
+        Route("/json", lambda request: Response(BODY, media_type="application/json")),
+        Route("/small", lambda request: Response(b'{"ok": true}', media_type="application/json")),
+        Route("/png", lambda request: Response(b"\x89PNG" * 100, media_type="image/png")),
+        Route("/stream", lambda request: StreamingResponse(lines(), media_type="application/x-ndjson")),
+        Route("/encoded", lambda request: Response(gzip.compress(BODY), media_type="application/json",
+                                                   headers={"Content-Encoding": "gzip"})),
+    ])
+    app.add_middleware(compression.CompressionMiddleware)
+    return TestClient(app)
+
+
+def _raw(client, path, encoding="gzip"):
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_middleware_compresses_json(client):
+    response, raw = _raw(client, "/json")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(raw)
+    assert gzip.decompress(raw) == BODY
+
+
+def test_middleware_streams_compressed_chunks(client):
+    response, raw = _raw(client, "/stream")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw) == b"".join(b'{"line": %d}\n' % i for i in range(50))
+
+
+@pytest.mark.parametrize("path", ["/small", "/png"])
+def test_middleware_leaves_small_and_binary_bodies_alone(client, path):
+    response, raw = _raw(client, path)
+    assert "content-encoding" not in response.headers
+    assert raw in (b'{"ok": true}', b"\x89PNG" * 100)
+
+
+def test_middleware_passes_encoded_responses_through(client):
+    response, raw = _raw(client, "/encoded")
+    assert gzip.decompress(raw) == BODY
+
+
+def test_middleware_without_accept_encoding(client):
+    response, raw = _raw(client, "/json", encoding="identity")
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert raw == BODY
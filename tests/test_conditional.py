@@ -0,0 +1,111 @@
+from app import cache, models, purge
+from app.config import settings
+
+from .conftest import auth
+
+likes = models.article_like_association
+
+
+def _article(db, author, **values) -> models.Article:
+    article = models.Article(title="t", content="body", author_id=author.id, is_published=True, **values)
+    db.add(article)
+    db.commit()
+    return article
+
+
+def _revalidate(client, path, etag):
+    # A worker that never rendered the page: same tag versions, empty cache,
+    # so the answer rests on the validator alone.
+    cache.responses = cache.ResponseCache(versions=cache.responses.versions)
+    return client.get(path, headers={"If-None-Match": etag})
+
+
+def test_unchanged_article_is_not_modified(client, db, make_user):
+    article = _article(db, make_user("author"))
+    first = client.get(f"/articles/{article.id}")
+    assert first.status_code == 200
+    assert "last-modified" not in first.headers
+    assert _revalidate(client, f"/articles/{article.id}", first.headers["etag"]).status_code == 304
+
+
+def test_like_swap_with_same_count_changes_article(client, db, make_user):
+    author, a, b = make_user("author"), make_user("a"), make_user("b")
+    article = _article(db, author, likes_count=1)
+    db.execute(likes.insert().values(user_id=a.id, article_id=article.id))
+    db.commit()
+    etag = client.get(f"/articles/{article.id}").headers["etag"]
+
+    db.execute(likes.delete().where(likes.c.user_id == a.id))
+    db.execute(likes.insert().values(user_id=b.id, article_id=article.id))
+    db.commit()
+    # As the like endpoints do after their commit.
+    cache.invalidate(f"article:{article.id}", f"user:{a.id}", f"user:{b.id}")
+
+    response = _revalidate(client, f"/articles/{article.id}", etag)
+    assert response.status_code == 200
+    assert [user["username"] for user in response.json()["liked_by"]] == ["b"]
+
+
+def test_follower_swap_changes_profile(client, db, make_user):
+    user, a, b = make_user("user"), make_user("a"), make_user("b")
+    assert client.post(f"/follow/users/{user.id}", headers=auth(a)).status_code == 201
+    etag = client.get("/users/user").headers["etag"]
+
+    client.post(f"/follow/users/{user.id}", headers=auth(a))
+    client.post(f"/follow/users/{user.id}", headers=auth(b))
+
+    response = _revalidate(client, "/users/user", etag)
+    assert response.status_code == 200
+    assert [follower["username"] for follower in response.json()["followers"]] == ["b"]
+
+
+def test_untagged_change_shows_after_one_ttl(client, db, make_user, monkeypatch):
+    author, commenter = make_user("author"), make_user("commenter")
+    article = _article(db, author)
+    db.add(models.Comment(content="hi", article_id=article.id, user_id=commenter.id))
+    db.commit()
+    now = 1_000_000 * settings.response_cache_ttl_seconds
+    monkeypatch.setattr(cache.time, "time", lambda: now)
+    etag = client.get(f"/articles/{article.id}").headers["etag"]
+
+    # Renaming the commenter bumps only their own tag.
+    commenter.first_name = "Renamed"
+    db.commit()
+    assert _revalidate(client, f"/articles/{article.id}", etag).status_code == 304
+
+    monkeypatch.setattr(cache.time, "time", lambda: now + settings.response_cache_ttl_seconds)
+    response = _revalidate(client, f"/articles/{article.id}", etag)
+    assert response.status_code == 200
+    assert response.json()["comments"][0]["user"]["first_name"] == "Renamed"
+
+
+def test_deactivated_commenter_changes_article(client, db, make_user):
+    author, commenter = make_user("author"), make_user("commenter")
+    article = _article(db, author)
+    db.add(models.Comment(content="hi", article_id=article.id, user_id=commenter.id))
+    db.commit()
+    etag = client.get(f"/articles/{article.id}").headers["etag"]
+
+    # As the account deletion endpoint does.
+    tags = purge.affected_tags(db, commenter.id)
+    purge.deactivate(db, commenter)
+    db.commit()
+    cache.invalidate(*tags)
+
+    response = _revalidate(client, f"/articles/{article.id}", etag)
+    assert response.status_code == 200
+    assert response.json()["comments"] == []
+
+
+def test_new_tag_store_never_matches_old_validators(client, db, make_user):
+    article = _article(db, make_user("author"))
+    etag = client.get(f"/articles/{article.id}").headers["etag"]
+    # A restart starts every version over at 0.
+    cache.responses = cache.ResponseCache()
+    assert client.get(f"/articles/{article.id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_if_modified_since_is_ignored(client, db, make_user):
+    article = _article(db, make_user("author"))
+    response = client.get(f"/articles/{article.id}", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
@@ -0,0 +1,44 @@
+import pytest
+
+from app import fields, models, schemas
+
+
+@pytest.fixture
+def article(db, make_user):
+    article = models.Article(title="t", content="body", author_id=make_user("author").id, is_published=True)
+    db.add(article)
+    db.commit()
+    return article
+
+
+@pytest.mark.parametrize("query", [
+    "fields=nope", "fields=author.nope", "fields=title.length", "include=id,comments.user.nope",
+    "fields=" + ",".join(f"f{n}" for n in range(fields.MAX_FIELDS + 1)),
+])
+def test_invalid_selection_is_400(client, article, query):
+    response = client.get(f"/articles/{article.id}?{query}")
+    assert response.status_code == 400
+
+
+def test_fields_return_exactly_the_selection(client, article):
+    body = client.get(f"/articles/{article.id}?fields=title,id,author.username").json()
+    assert body == {"id": article.id, "title": "t", "author": {"username": "author"}}
+
+    # A nested object named without sub-fields comes whole.
+    body = client.get(f"/articles/{article.id}?fields=author").json()
+    assert set(body) == {"author"} and set(body["author"]) == set(schemas.UserOut.model_fields) | {"profile_image_urls"}
+
+
+def test_include_adds_nested_objects_to_the_plain_fields(client, article):
+    body = client.get(f"/articles/{article.id}?include=author").json()
+    assert body["author"]["username"] == "author"
+    assert body["content"] == "body"
+    assert "comments" not in body and "liked_by" not in body
+
+
+def test_each_selection_has_its_own_validator(client, article):
+    full = client.get(f"/articles/{article.id}").headers["etag"]
+    sparse = client.get(f"/articles/{article.id}?fields=id").headers["etag"]
+    # The same selection written another way is the same representation.
+    reordered = client.get(f"/articles/{article.id}?fields=id,%20id").headers["etag"]
+    assert full != sparse == reordered
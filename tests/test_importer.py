@@ -0,0 +1,73 @@
+import orjson
+import pytest
+
+from app import importer, models
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(name: str, rows: list[dict]) -> str:
+        path = tmp_path / name
+        path.write_bytes(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+        return str(path)
+    return write
+
+
+def test_malformed_rows_fail_alone(db, make_user, write):
+    author = make_user("author")
+    path = write("articles.ndjson", [
+        {"author": "author", "title": "good", "content": "body", "views_count": "3"},
+        {"author": "author", "title": "bad count", "content": "body", "views_count": "many"},
+        {"author": "author", "title": "bad date", "content": "body", "created_at": "yesterday"},
+        {"author": "nobody", "title": "orphan", "content": "body"},
+    ])
+
+    report = importer.run("articles", path, batch_size=10)
+
+    assert report.inserted == 1
+    assert [error["line"] for error in report.errors] == [2, 3, 4]
+    assert not any("batch failed" in error["error"] for error in report.errors)
+    article = db.query(models.Article).one()
+    assert (article.title, article.views_count, article.author_id) == ("good", 3, author.id)
+
+
+def test_duplicate_emails_are_rejected(db, make_user, write):
+    gone = make_user("gone")
+    gone.is_active = False
+    db.commit()
+    path = write("users.ndjson", [
+        {"email": "new@example.com", "password_hash": "x"},
+        {"email": "new@example.com", "password_hash": "x"},
+        # Deactivated accounts still own their email until they are purged.
+        {"email": "gone@example.com", "password_hash": "x"},
+        {"email": "other@example.com", "password_hash": "x", "username": "gone"},
+    ])
+
+    report = importer.run("users", path)
+
+    assert report.inserted == 1
+    assert {error["line"]: error["error"] for error in report.errors} == {
+        2: "duplicate email in file",
+        3: "email or username already registered",
+        4: "username 'gone' already taken",
+    }
+    emails = db.query(models.User.email).execution_options(include_inactive=True).order_by(models.User.id)
+    assert [email for email, in emails] == ["gone@example.com", "new@example.com"]
+
+
+def test_follow_edges_resolve_ids_emails_and_usernames(db, make_user, write):
+    a, b, c = make_user("a"), make_user("b"), make_user("c")
+    path = write("follows.ndjson", [
+        {"follower": "a", "following": "b@example.com"},
+        {"follower": a.id, "following": "c"},
+        {"follower": "a", "following": "b"},
+        {"follower": "c", "following": "c"},
+        {"follower": "c", "following": "nobody"},
+    ])
+
+    report = importer.run("follows", path)
+
+    assert report.inserted == 2
+    assert [error["line"] for error in report.errors] == [4, 5]
+    edges = db.execute(models.user_follow_association.select()).all()
+    assert sorted((row.follower_id, row.following_id) for row in edges) == [(a.id, b.id), (a.id, c.id)]
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from app import models
+
+from .conftest import auth
+
+
+def _page_through(client, path, user, limit) -> list[int]:
+    ids, params = [], {"limit": limit}
+    while page := client.get(path, params=params, headers=auth(user)).json():
+        assert len(page) <= limit
+        ids += [message["id"] for message in page]
+        params = {"limit": limit, "before": page[-1]["created_at"], "before_id": page[-1]["id"]}
+    return ids
+
+
+def test_pages_split_inside_a_run_of_equal_timestamps(client, db, make_user):
+    me, friend, other = make_user("me"), make_user("friend"), make_user("other")
+    start = datetime(2026, 1, 1, 12)
+    # Ids 2-6 share one created_at, so page boundaries fall inside the run.
+    stamps = [start, *[start + timedelta(minutes=1)] * 5, start + timedelta(minutes=2)]
+    for n, stamp in enumerate(stamps, start=1):
+        sender, receiver = (me, friend) if n % 2 else (friend, me)
+        db.add(models.Message(id=n, sender_id=sender.id, receiver_id=receiver.id, content=f"m{n}", created_at=stamp))
+    db.add(models.Message(id=8, sender_id=friend.id, receiver_id=other.id, content="not mine",
+                          created_at=start + timedelta(minutes=1)))
+    db.commit()
+
+    newest_first = [7, 6, 5, 4, 3, 2, 1]
+    for limit in (1, 2, 3):
+        assert _page_through(client, "/messages/", me, limit) == newest_first
+        assert _page_through(client, f"/messages/{friend.id}", me, limit) == newest_first
+    assert _page_through(client, f"/messages/{other.id}", me, 2) == []
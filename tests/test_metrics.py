@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import metrics
+from app.config import settings
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_dir", str(tmp_path))
+    return tmp_path
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _write(directory, pid, requests, in_flight):
+    (directory / f"{pid}.json").write_text(json.dumps({
+        "pid": pid,
+        "counters": [["ratelimit_rejections_total", [["policy", "login"]], requests],
+                     ["http_requests_in_flight", [], in_flight]],
+        "histograms": [["db_queries_per_request", [["route", "/"]], [1] + [0] * 11 + [3]]],
+    }))
+
+
+def _value(text: str, prefix: str) -> float:
+    lines = [line for line in text.splitlines() if line.startswith(prefix)]
+    return float(lines[0].rsplit(" ", 1)[1]) if lines else 0.0
+
+
+def test_exited_workers_are_folded_into_one_file(metrics_dir):
+    first, second = _dead_pid(), _dead_pid()
+    _write(metrics_dir, first, 2, 5)
+    _write(metrics_dir, second, 3, 7)
+
+    text = metrics.render()
+    assert _value(text, 'ratelimit_rejections_total{policy="login"}') == 5
+    assert _value(text, 'db_queries_per_request_count{route="/"}') == 2
+    assert _value(text, "http_requests_in_flight ") == 0
+    assert sorted(os.listdir(metrics_dir)) == [".lock", metrics.RETIRED]
+
+    # A later scrape, with another worker gone, counts nothing twice.
+    third = _dead_pid()
+    _write(metrics_dir, third, 1, 1)
+    text = metrics.render()
+    assert _value(text, 'ratelimit_rejections_total{policy="login"}') == 6
+    assert _value(text, 'db_queries_per_request_count{route="/"}') == 3
+
+
+def test_snapshots_already_folded_are_deleted_not_recounted(metrics_dir):
+    pid = _dead_pid()
+    _write(metrics_dir, pid, 2, 0)
+    metrics.render()
+    # As if the process had died between writing RETIRED and deleting the file.
+    _write(metrics_dir, pid, 2, 0)
+    retired = json.loads((metrics_dir / metrics.RETIRED).read_text())
+    assert retired["merged"] == [pid]
+
+    assert _value(metrics.render(), 'ratelimit_rejections_total{policy="login"}') == 2
+    assert not (metrics_dir / f"{pid}.json").exists()
+
+
+def test_endpoint_reports_threadpool_gauges(client, metrics_dir):
+    text = client.get("/metrics").text
+    # The handler runs in the threadpool, including itself in the busy count.
+    assert _value(text, "threadpool_busy ") >= 1
+    assert (metrics_dir / ".lock").exists()
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import presence, shared
+
+from .conftest import auth
+
+
+@pytest.fixture
+def seen(monkeypatch):
+    table = shared.SharedTable(64)
+    monkeypatch.setattr(shared, "seen", table)
+    monkeypatch.setattr(presence, "_seen", {})
+    monkeypatch.setattr(presence, "_pending", {})
+    yield table
+    table.close(unlink=True)
+
+
+def test_shared_time_is_read_by_other_workers(seen):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    presence.touch(7, now)
+    presence._seen.clear()
+    assert presence._seen_shared(7, now) == now
+
+
+def test_out_of_range_shared_time_is_ignored(client, seen, make_user):
+    viewer, other = make_user("viewer"), make_user("other")
+    # A rate limit TAT in microseconds would read as a date after year 9999.
+    seen.update(presence._shared_key(other.id), lambda old: 10 ** 15)
+
+    response = client.get(f"/users/presence?ids={other.id}", headers=auth(viewer))
+    assert response.status_code == 200
+    assert response.json()[0]["online"] is False
+
+    # The next touch replaces it instead of keeping the larger value.
+    now = datetime.now(timezone.utc)
+    presence.touch(other.id, now)
+    assert presence._seen_shared(other.id, now + timedelta(seconds=1)) is not None
+
+
+def test_failed_flush_keeps_the_newer_times(seen, monkeypatch):
+    earlier = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    later = earlier + timedelta(minutes=1)
+    presence.touch(1, later)
+    presence.touch(2, earlier)
+
+    class Broken:
+        def execute(self, stmt):
+            # Activity that arrives while the write is in flight.
+            presence.touch(1, earlier)
+            presence.touch(2, later)
+            raise RuntimeError("database is down")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(presence, "SessionLocal", Broken)
+    presence.run()
+    assert presence._pending == {1: later, 2: later}
+
+
+def test_failed_commit_puts_the_times_back(seen, monkeypatch):
+    now = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+    presence.touch(1, now)
+
+    class Broken:
+        def execute(self, stmt):
+            pass
+
+        def commit(self):
+            raise RuntimeError("connection lost")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(presence, "SessionLocal", Broken)
+    presence.run()
+    assert presence._pending == {1: now}
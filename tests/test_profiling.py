@@ -0,0 +1,21 @@
+from app import profiling
+from app.config import settings
+
+
+def test_sampled_requests_do_not_expose_timings(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+
+    response = client.get("/topics/")
+    assert "server-timing" not in response.headers and "x-profile-id" not in response.headers
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+    response = client.get("/topics/", headers={"X-Profile-Token": "1.forged"})
+    assert "server-timing" not in response.headers
+
+    response = client.get("/topics/", headers={"X-Profile-Token": profiling.make_token()})
+    assert "total;dur=" in response.headers["server-timing"]
+    assert len(list(tmp_path.glob(f"*-{response.headers['x-profile-id']}.folded"))) == 1
+    # The lock is released once the files are written.
+    assert profiling._busy.acquire(blocking=False)
+    profiling._busy.release()
@@ -0,0 +1,63 @@
+import pytest
+
+from app import models, purge
+from app.config import settings
+
+likes = models.article_like_association
+bookmarks = models.article_bookmark_association
+follows = models.user_follow_association
+
+
+@pytest.fixture
+def account(db, make_user):
+    """A user who liked, bookmarked, followed, wrote and commented; then deleted their account."""
+    user, other = make_user("leaving"), make_user("staying")
+    theirs = models.Article(title="theirs", content="body", author_id=user.id, is_published=True)
+    liked = models.Article(title="liked", content="body", author_id=other.id, is_published=True,
+                           likes_count=2, bookmarks_count=1)
+    db.add_all([theirs, liked])
+    db.commit()
+    db.execute(likes.insert(), [{"user_id": user.id, "article_id": liked.id},
+                                {"user_id": other.id, "article_id": liked.id},
+                                {"user_id": other.id, "article_id": theirs.id}])
+    db.execute(bookmarks.insert().values(user_id=user.id, article_id=liked.id))
+    db.execute(follows.insert().values(follower_id=other.id, following_id=user.id))
+    db.add_all([models.Comment(content="c", article_id=liked.id, user_id=user.id),
+                models.Comment(content="c", article_id=theirs.id, user_id=other.id)])
+    purge.deactivate(db, user)
+    db.commit()
+    return user.id, liked.id
+
+
+def test_purge_walks_every_stage_and_decrements_counters(db, account, monkeypatch):
+    user_id, liked_id = account
+    monkeypatch.setattr(settings, "purge_batch_size", 1)
+    record = db.get(models.AccountPurge, user_id)
+    names = [stage[0] for stage in purge._stages(user_id)]
+
+    seen = []
+    while purge.run_batch(db):
+        db.refresh(record)
+        seen.append(record.stage)
+    assert seen == sorted(seen, key=names.index)
+    assert seen[-1] == names[-1] and record.finished_at is not None
+    # Their like, bookmark and follow; two comments; the like on their
+    # article; the article; the user.
+    assert record.rows_deleted == 8
+
+    liked = db.query(models.Article).filter(models.Article.id == liked_id).one()
+    assert (liked.likes_count, liked.bookmarks_count) == (1, 0)
+    assert db.query(models.User).execution_options(include_inactive=True).filter(
+        models.User.id == user_id).first() is None
+    assert db.execute(likes.select()).all() == [(db.query(models.User).one().id, liked_id)]
+
+
+def test_purge_resumes_at_the_saved_stage(db, account, monkeypatch):
+    user_id, _ = account
+    db.get(models.AccountPurge, user_id).stage = "comments"
+    db.commit()
+    while purge.run_batch(db):
+        pass
+    # The likes stage was skipped, so the like is left behind.
+    assert db.execute(likes.select().where(likes.c.user_id == user_id)).all()
+    assert db.get(models.AccountPurge, user_id).finished_at is not None
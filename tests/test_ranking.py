@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app import ranking
+from app.config import settings
+
+NOW = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def _affinity(authors=(), weights=(), topics=()) -> ranking.Affinity:
+    return ranking.Affinity(np.array(authors, dtype=np.int64), np.array(weights, dtype=np.float64),
+                            np.array(topics, dtype=np.int64), [], 0)
+
+
+def _rows(*rows) -> np.ndarray:
+    # (id, author_id, age in hours, likes, bookmarks, views)
+    return np.array([(i, author, NOW.timestamp() - hours * 3600, *counts) for i, author, hours, *counts in rows],
+                    dtype=np.float64)
+
+
+@pytest.fixture(autouse=True)
+def weights(monkeypatch):
+    monkeypatch.setattr(settings, "feed_half_life_hours", 24)
+    monkeypatch.setattr(settings, "feed_author_repeat_penalty", 0.5)
+
+
+def test_score_halves_with_each_half_life():
+    rows = _rows((1, 10, 0, 0, 0, 0), (2, 10, 24, 0, 0, 0), (3, 10, 48, 0, 0, 0))
+    scores = ranking.score(rows, np.empty((0, 2), dtype=np.int64), _affinity(), NOW)
+    assert np.allclose(scores, [1.0, 0.5, 0.25])
+
+
+def test_score_adds_author_topic_and_engagement_terms():
+    rows = _rows((1, 10, 0, 0, 0, 0), (2, 20, 0, 0, 0, 0), (3, 30, 0, 0, 0, 0), (4, 40, 0, 1, 1, 1))
+    pairs = np.array([[3, 7], [3, 8], [3, 9]], dtype=np.int64)
+    affinity = _affinity(authors=[20], weights=[2.0], topics=[7, 8])
+    scores = ranking.score(rows, pairs, affinity, NOW)
+    assert np.allclose(scores, [
+        1.0,
+        1 + ranking.AUTHOR * 2.0,
+        1 + ranking.TOPIC * np.log1p(2),
+        1 + ranking.ENGAGEMENT * np.log1p(ranking.ENGAGEMENT_WEIGHTS.sum()),
+    ])
+
+
+def test_lookup_returns_zero_for_unknown_ids():
+    keys, weights = np.array([3, 5, 9]), np.array([0.3, 0.5, 0.9])
+    assert np.allclose(ranking._lookup(keys, weights, np.array([1, 3, 4, 9, 12])), [0, 0.3, 0, 0.9, 0])
+    assert np.allclose(ranking._lookup(np.array([], dtype=np.int64), np.array([]), np.array([1, 2])), [0, 0])
+
+
+def test_diversify_penalizes_each_repeat_of_an_author():
+    authors = np.array([1, 1, 1, 2, 3])
+    scores = np.array([10.0, 9.0, 8.0, 6.0, 1.0])
+    # Author 1 scores 10, 9 * 0.5 and 8 * 0.25 after the penalty.
+    assert ranking.diversify(authors, scores).tolist() == [0, 3, 1, 2, 4]
+
+
+def test_diversify_keeps_order_without_repeats():
+    scores = np.array([1.0, 3.0, 2.0])
+    assert ranking.diversify(np.array([1, 2, 3]), scores).tolist() == [1, 2, 0]
+    assert ranking.diversify(np.array([], dtype=np.int64), np.array([])).tolist() == []
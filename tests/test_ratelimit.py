@@ -0,0 +1,48 @@
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from app import oauth2, ratelimit
+from app.config import settings
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(settings, "ratelimit_enabled", True)
+    monkeypatch.setattr(ratelimit, "_memory", ratelimit.MemoryStore())
+    app = FastAPI()
+
+    @app.get("/", dependencies=[Depends(ratelimit.limit("test", ip="5/minute", user="3/minute"))])
+    def endpoint():
+        return {}
+
+    return TestClient(app)
+
+
+def test_burst_then_one_request_per_interval():
+    rate = ratelimit.Rate("3/minute")
+    assert [ratelimit.acquire("k", rate, now=1000.0) for _ in range(3)] == [0, 0, 0]
+    assert ratelimit.acquire("k", rate, now=1000.0) == pytest.approx(20.0)
+    # A rejected request doesn't use up budget.
+    assert ratelimit.acquire("k", rate, now=1010.0) == pytest.approx(10.0)
+    assert ratelimit.acquire("k", rate, now=1020.0) == 0
+    assert ratelimit.acquire("k", rate, now=1020.0) == pytest.approx(20.0)
+
+
+def test_rejection_is_429_with_retry_after(limited):
+    assert [limited.get("/").status_code for _ in range(3)] == [200, 200, 200]
+    response = limited.get("/")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "20"
+
+
+def test_user_rate_is_per_token_and_anonymous_clients_share_their_ip(limited, monkeypatch):
+    monkeypatch.setattr(ratelimit, "client_ip", lambda request: request.headers["x-client"])
+    token = {"Authorization": "Bearer " + oauth2.create_access_token({"user_id": 1})}
+
+    statuses = [limited.get("/", headers={"x-client": f"10.0.0.{n}", **token}).status_code for n in range(4)]
+    assert statuses == [200, 200, 200, 429]
+
+    # A bad token counts against the anonymous budget of its address.
+    bad = {"Authorization": "Bearer nonsense", "x-client": "10.0.1.1"}
+    assert [limited.get("/", headers=bad).status_code for _ in range(4)] == [200, 200, 200, 429]
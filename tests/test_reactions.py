@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import cache, models, reactions, trending
+
+from .conftest import auth
+
+ROUTES = {"like": ("/articles/{}/like", "liked", "likes_count"),
+          "bookmark": ("/bookmarks/{}", "bookmarked", "bookmarks_count")}
+
+
+class _Statements:
+    """Stands in for the session; keeps the statement and answers (count, changed)."""
+
+    def execute(self, stmt):
+        self.stmt = stmt
+        return self
+
+    def first(self):
+        return 1, 1
+
+
+@pytest.mark.parametrize("kind", sorted(reactions.REACTIONS))
+def test_counter_moves_by_the_rows_the_cte_changed(kind):
+    table, counter, _ = reactions.REACTIONS[kind]
+    db = _Statements()
+
+    assert reactions.add(db, kind, 7, 3) == (1, True)
+    compiled = db.stmt.compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+    assert f"INSERT INTO {table.name}" in sql and "ON CONFLICT DO NOTHING" in sql
+    assert f"{counter}=(articles.{counter} + %(param_1)s * (SELECT count(*) AS count_1 FROM changed))" in sql
+    assert compiled.params["param_1"] == 1
+
+    reactions.remove(db, kind, 7, 3)
+    compiled = db.stmt.compile(dialect=postgresql.dialect())
+    assert f"DELETE FROM {table.name}" in str(compiled)
+    assert compiled.params["param_1"] == -1
+
+
+@pytest.mark.parametrize("kind", sorted(reactions.REACTIONS))
+def test_repeated_put_and_delete_count_once(client, db, make_user, monkeypatch, kind):
+    # The data-modifying CTEs are PostgreSQL-only; this stands in for them
+    # with the same contract: (new count, whether a row changed).
+    def apply(db, kind, article_id, user_id, sign):
+        table, counter, _ = reactions.REACTIONS[kind]
+        article = db.get(models.Article, article_id)
+        if article is None:
+            return None
+        if reactions.has(db, kind, article_id, user_id) == (sign > 0):
+            return getattr(article, counter), False
+        if sign > 0:
+            db.execute(table.insert().values(article_id=article_id, user_id=user_id))
+        else:
+            db.execute(table.delete().where(table.c.article_id == article_id, table.c.user_id == user_id))
+        setattr(article, counter, getattr(article, counter) + sign)
+        return getattr(article, counter), True
+
+    monkeypatch.setattr(reactions, "add", lambda db, kind, a, u: apply(db, kind, a, u, 1))
+    monkeypatch.setattr(reactions, "remove", lambda db, kind, a, u: apply(db, kind, a, u, -1))
+    recorded, invalidated = [], []
+    monkeypatch.setattr(trending, "record", lambda db, article_id, name, amount=1: recorded.append(amount))
+    monkeypatch.setattr(cache, "invalidate", lambda *tags: invalidated.append(tags))
+
+    author, reader = make_user("author"), make_user("reader")
+    article = models.Article(title="t", content="body", author_id=author.id, is_published=True)
+    db.add(article)
+    db.commit()
+    path, flag, count = ROUTES[kind]
+    path = path.format(article.id)
+
+    for _ in range(2):
+        assert client.put(path, headers=auth(reader)).json() == {flag: True, count: 1}
+    for _ in range(2):
+        assert client.delete(path, headers=auth(reader)).json() == {flag: False, count: 0}
+
+    assert recorded == [1, -1]
+    assert invalidated == [(f"article:{article.id}", f"user:{reader.id}")] * 2
+    assert client.put(ROUTES[kind][0].format(article.id + 1), headers=auth(reader)).status_code == 404
@@ -0,0 +1,105 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import models, related
+from app.config import settings
+
+
+def _documents(rng, n, vocabulary=400):
+    weights = 1 / np.arange(1, vocabulary + 1) ** 1.1
+    weights /= weights.sum()
+    return [Counter(f"w{term}" for term in rng.choice(vocabulary, size=30, p=weights)) for _ in range(n)]
+
+
+def _recomputed(corpus: related.Corpus) -> related.Corpus:
+    # Every row recomputed under the corpus's own weights.
+    copy = related.Corpus(corpus.k)
+    copy.__dict__.update(corpus.__dict__)
+    copy.neighbours, copy.scores = copy.top_k(copy.weighted(), np.arange(len(copy.ids)))
+    return copy
+
+
+def test_update_matches_recomputing_every_row():
+    rng = np.random.default_rng(7)
+    ids = np.arange(1, 301, dtype=np.int64)
+    corpus = related.Corpus(10)
+    corpus.rebuild(ids, _documents(rng, len(ids)))
+
+    # Edit some articles, publish new ones, unpublish others.
+    changed = np.concatenate([rng.choice(ids, 15, replace=False), np.arange(301, 311)])
+    published = np.setdiff1d(np.arange(1, 311), rng.choice(ids, 5, replace=False))
+    changed = np.intersect1d(changed, published)
+    corpus.update(changed, _documents(rng, len(changed)), published)
+
+    expected = _recomputed(corpus)
+    assert np.array_equal(corpus.ids, published)
+    assert np.array_equal(corpus.scores, expected.scores)
+    assert np.array_equal(corpus.neighbours, expected.neighbours)
+
+
+def test_update_stays_close_to_a_rebuild():
+    rng = np.random.default_rng(3)
+    ids = np.arange(1, 301, dtype=np.int64)
+    documents = _documents(rng, len(ids))
+    corpus = related.Corpus(10)
+    corpus.rebuild(ids, documents)
+
+    changed = rng.choice(ids, 5, replace=False)
+    edits = _documents(rng, len(changed))
+    corpus.update(changed, edits, ids)
+    for article_id, document in zip(changed, edits):
+        documents[article_id - 1] = document
+    rebuilt = related.Corpus(10)
+    rebuilt.rebuild(ids, documents)
+
+    # Only IDF drift separates them: the edited rows' own terms are weighted
+    # with the IDF they had at the last rebuild.
+    assert np.abs(corpus.scores - rebuilt.scores).max() < 0.05
+
+
+def test_save_and_load_round_trip(tmp_path):
+    corpus = related.Corpus(5)
+    corpus.rebuild(np.arange(1, 51, dtype=np.int64), _documents(np.random.default_rng(1), 50))
+    corpus.watermark, corpus.built_at, corpus.generation = datetime(2026, 1, 2, 3, 4), 12.5, 7
+    corpus.save(str(tmp_path / "corpus.npz"))
+
+    loaded = related.Corpus.load(str(tmp_path / "corpus.npz"))
+    assert loaded.vocabulary == corpus.vocabulary
+    assert (loaded.watermark, loaded.built_at, loaded.generation) == (corpus.watermark, 12.5, 7)
+    assert (loaded.counts != corpus.counts).nnz == 0
+    assert np.array_equal(loaded.neighbours, corpus.neighbours)
+
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "related_index_path", str(tmp_path / "index.npy"))
+    monkeypatch.setattr(settings, "related_min_score", 0.0)
+    monkeypatch.setattr(related, "_corpus", None)
+    return tmp_path
+
+
+def test_another_worker_continues_incrementally(db, make_user, index_path, monkeypatch):
+    author = make_user("author")
+    texts = ["python asyncio event loop", "python asyncio tasks", "sourdough bread starter",
+             "sourdough bread crust", "garden tomato soil"]
+    articles = [models.Article(title=text, content=text, author_id=author.id, is_published=True)
+                for text in texts]
+    db.add_all(articles)
+    db.commit()
+    assert related.refresh(db) == 5
+
+    # Another worker gets the lock next: nothing in memory, the corpus on disk.
+    monkeypatch.setattr(related, "_corpus", None)
+    articles[4].title = articles[4].content = "python asyncio garden"
+    articles[4].updated_at = datetime.now() + timedelta(seconds=1)
+    db.commit()
+
+    def rebuild(*args):
+        raise AssertionError("rebuilt from scratch")
+
+    monkeypatch.setattr(related.Corpus, "rebuild", rebuild)
+    assert related.refresh(db) == 5
+    assert articles[4].id in related.Index(settings.related_index_path).related(articles[0].id, 5)
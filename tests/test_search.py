@@ -0,0 +1,21 @@
+from app import models
+
+from .conftest import auth
+
+
+def test_search_combines_title_and_topic_matches(client, db, make_user):
+    author = make_user("author")
+    by_title = models.Article(title="Python tips", content="body", author_id=author.id, is_published=True)
+    by_topic = models.Article(title="Decorators", content="body", author_id=author.id, is_published=True)
+    draft = models.Article(title="Draft", content="body", author_id=author.id, is_published=False)
+    topic = models.Topic(title="python")
+    db.add_all([by_title, by_topic, draft, topic])
+    db.commit()
+    db.execute(models.article_topic_association.insert(),
+               [{"article_id": by_topic.id, "topic_id": topic.id}, {"article_id": draft.id, "topic_id": topic.id}])
+    db.commit()
+
+    response = client.get("/articles/search", params={"search_string": "python"}, headers=auth(author))
+    assert response.status_code == 200
+    assert sorted(article["id"] for article in response.json()["articles"]) == sorted([by_title.id, by_topic.id])
+    assert [topic["title"] for topic in response.json()["topics"]] == ["python"]
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import server
+
+
+@pytest.fixture
+def master(monkeypatch):
+    master = server.Master(None, None, SimpleNamespace(workers=2))
+    monkeypatch.setattr(server.time, "monotonic", lambda: 100.0)
+    return master
+
+
+def test_fast_failures_back_off_exponentially(master):
+    delays = []
+    for _ in range(3):
+        master.exited(0, 1.0, 256)
+        delays.append(master.pending.pop(0) - 100.0)
+    assert delays == [server.RESPAWN_BACKOFF_SECONDS * 2 ** n for n in range(3)]
+
+    # A clean recycle, or a crash after a long run, resets the slot.
+    master.exited(0, 1.0, 0)
+    assert master.pending[0] == 100.0 and master.failures[0] == 0
+    master.exited(1, server.FAST_FAILURE_SECONDS + 1, 256)
+    assert master.pending[1] == 100.0
+
+
+def test_master_gives_up_after_repeated_fast_failures(master, caplog):
+    for _ in range(server.MAX_FAST_FAILURES):
+        master.exited(1, 0.5, 256)
+    assert master.failed and master.stopping
+    assert master.pending == {}
+    assert "shutting down" in caplog.text
@@ -0,0 +1,36 @@
+import pytest
+
+from app import ratelimit, shared
+
+
+@pytest.fixture
+def table():
+    # One bucket, so every key competes for the same eight slots.
+    table = shared.SharedTable(shared.BUCKET_SIZE)
+    yield table
+    table.close(unlink=True)
+
+
+def test_table_keeps_keys_in_one_bucket_apart(table):
+    for n in range(shared.BUCKET_SIZE):
+        table.update(f"key:{n}", lambda old, n=n: old + 1000 + n)
+    assert [table.get(f"key:{n}") for n in range(shared.BUCKET_SIZE)] == \
+        [1000 + n for n in range(shared.BUCKET_SIZE)]
+    assert table.get("missing") == 0
+
+
+def test_full_bucket_gives_up_the_smallest_value(table):
+    for n in range(shared.BUCKET_SIZE):
+        table.update(f"key:{n}", lambda old, n=n: 1000 + n)
+    assert table.update("new", lambda old: old + 1) == 1
+    assert table.get("key:0") == 0
+    assert table.get("key:1") == 1001
+
+
+def test_rate_limits_do_not_leak_between_keys(table, monkeypatch):
+    monkeypatch.setattr(shared, "rates", table)
+    strict = ratelimit.Rate("1/hour")
+    assert ratelimit.acquire("login:a", strict, now=100.0) == 0
+    assert ratelimit.acquire("login:a", strict, now=101.0) > 0
+    # Another key in the same bucket still has its full budget.
+    assert ratelimit.acquire("login:b", strict, now=101.0) == 0
@@ -0,0 +1,58 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app import comment_tree, models
+
+Row = namedtuple("Row", "id parent_id user_id content created_at depth reply_count")
+
+
+def test_username_of_deactivated_account_is_taken(client, db, make_user):
+    user = make_user("gone")
+    user.is_active = False
+    db.commit()
+    assert client.get("/users/check_username/gone").status_code == 400
+    assert client.get("/users/check_username/free").status_code == 200
+
+
+def test_comment_author_missing_after_the_tree_query_is_skipped(db, make_user, monkeypatch):
+    kept, dropped = make_user("kept"), make_user("dropped")
+    now = datetime.now(timezone.utc)
+    # The tree query is PostgreSQL-only; these are its rows for a page where
+    # one author was deactivated before the user lookup ran.
+    rows = [Row(1, None, kept.id, "root", now, 0, 1), Row(3, None, dropped.id, "other", now, 0, 0),
+            Row(2, 1, dropped.id, "reply", now, 1, 0)]
+    execute = db.execute
+    monkeypatch.setattr(db, "execute", lambda stmt, *args, **kwargs: SimpleNamespace(all=lambda: rows)
+                        if stmt is comment_tree._ROOTS_SQL else execute(stmt, *args, **kwargs))
+    dropped.is_active = False
+    db.commit()
+
+    page = comment_tree.load_page(db, 1, None, 0, 10, 3, 3)
+    assert [(node.id, node.replies) for node in page.comments] == [(1, [])]
+
+
+def test_relationship_loads_hide_deactivated_accounts(db, make_user):
+    author, gone, staying = make_user("author"), make_user("gone"), make_user("staying")
+    article = models.Article(title="t", content="body", author_id=author.id, is_published=True)
+    theirs = models.Article(title="theirs", content="body", author_id=gone.id, is_published=True)
+    db.add_all([article, theirs])
+    db.commit()
+    db.add_all([models.Comment(content="gone", article_id=article.id, user_id=gone.id),
+                models.Comment(content="staying", article_id=article.id, user_id=staying.id)])
+    author.followers.extend([gone, staying])
+    gone.is_active = False
+    db.commit()
+    article_id, theirs_id, author_id = article.id, theirs.id, author.id
+    db.expunge_all()
+
+    # Lazy loads on objects from an ORM query get the same criteria.
+    loaded = db.query(models.Article).filter(models.Article.id == article_id).one()
+    assert [comment.content for comment in loaded.comments] == ["staying"]
+    user = db.query(models.User).filter(models.User.id == author_id).one()
+    assert [follower.username for follower in user.followers] == ["staying"]
+    assert db.query(models.Article).filter(models.Article.id == theirs_id).first() is None
+
+    # Opting out shows them again.
+    everyone = db.query(models.User).execution_options(include_inactive=True).all()
+    assert {user.username for user in everyone} == {"author", "gone", "staying"}
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+import pytest
+
+from app import models, trending
+
+
+@pytest.fixture
+def views(monkeypatch):
+    monkeypatch.setattr(trending, "_pending_views", trending.Counter())
+
+
+def _activity(db, article_id, bucket, likes):
+    db.add(models.ArticleActivity(article_id=article_id, bucket=bucket, likes=likes))
+    db.commit()
+
+
+def test_failed_flush_keeps_the_views(engine, views, monkeypatch):
+    def fail(db, pending):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(trending, "flush_views", fail)
+    trending.record_view(5)
+    trending.record_view(5)
+    trending.refresh()
+    trending.record_view(5)
+    assert trending.take_views() == {5: 3}
+
+
+def test_undo_only_takes_back_from_this_hours_bucket(db):
+    bucket = trending.current_bucket()
+    _activity(db, 1, bucket, 1)
+    _activity(db, 2, bucket - timedelta(hours=1), 1)
+
+    for _ in range(2):
+        trending.record(db, 1, "likes", -1)
+    trending.record(db, 2, "likes", -1)
+    db.commit()
+
+    rows = {(row.article_id, row.likes) for row in db.query(models.ArticleActivity)}
+    assert rows == {(1, 0), (2, 1)}
@@ -0,0 +1,11 @@
+from app import models
+
+from .conftest import auth
+
+
+def test_adding_topics_twice_is_idempotent(client, db, make_user):
+    user = make_user("reader")
+    for _ in range(2):
+        response = client.put("/users/add_topics", json={"topics": ["python", "rust"]}, headers=auth(user))
+        assert response.status_code == 200
+    assert db.query(models.user_topic_association).count() == 2
@@ -0,0 +1,22 @@
+from sqlalchemy import create_engine
+
+from app import database, warmup
+from app.config import settings
+
+
+def test_warm_up_opens_at_most_the_pool_size(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", pool_size=2, max_overflow=1)
+    monkeypatch.setattr(database, "_engine", engine)
+    monkeypatch.setattr(settings, "create_schema", False)
+    monkeypatch.setattr(warmup, "_hot_queries", lambda db: None)
+
+    assert warmup.warm_up(10) > 0
+    assert engine.pool.checkedin() == 2
+    assert engine.pool.overflow() <= 0
+    engine.dispose()
+
+
+def test_time_counts_schema_creation_without_connections(engine, monkeypatch):
+    monkeypatch.setattr(settings, "create_schema", True)
+    monkeypatch.setattr(warmup.partitions, "run", lambda: {})
+    assert warmup.warm_up(0) > 0